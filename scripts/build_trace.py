@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Wall time, subprocess and I/O accounting for release.py steps.
+
+Spans nest; the summary table indents child spans and totals the top-level
+ones. The Chrome trace opens in chrome://tracing or https://ui.perfetto.dev.
+Byte counts come from ``/proc/self/io`` and are left empty on systems without it.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+_PROC_IO = Path("/proc/self/io")
+
+
+@dataclass
+class Span:
+    name: str
+    depth: int
+    start: float
+    duration: float = 0.0
+    subprocesses: int = 0
+    bytes_read: Optional[int] = None
+    bytes_written: Optional[int] = None
+    args: dict = field(default_factory=dict)
+
+
+def _io_counters() -> Optional[Tuple[int, int]]:
+    try:
+        fields = dict(line.split(": ", 1) for line in _PROC_IO.read_text().splitlines())
+    except (OSError, ValueError):
+        return None
+    return int(fields["rchar"]), int(fields["wchar"])
+
+
+class BuildTrace:
+    """Collects spans; subprocesses are counted with an audit hook so every spawn is seen."""
+
+    def __init__(self) -> None:
+        self.spans: List[Span] = []
+        self.subprocesses = 0
+        self._depth = 0
+        self._origin = time.perf_counter()
+        self._hooked = False
+        self._thread = threading.get_ident()
+
+    def _audit(self, event: str, _args: tuple) -> None:
+        if event == "subprocess.Popen":
+            self.subprocesses += 1
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[Span]:
+        if not self._hooked:
+            sys.addaudithook(self._audit)
+            self._hooked = True
+        record = Span(name=name, depth=self._depth, start=time.perf_counter() - self._origin, args=args)
+        self.spans.append(record)
+        self._depth += 1
+        spawned = self.subprocesses
+        io_before = _io_counters()
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.duration = time.perf_counter() - started
+            record.subprocesses = self.subprocesses - spawned
+            io_after = _io_counters()
+            if io_before and io_after:
+                record.bytes_read = io_after[0] - io_before[0]
+                record.bytes_written = io_after[1] - io_before[1]
+            self._depth -= 1
+
+    def summary(self) -> str:
+        if not self.spans:
+            return ""
+        top = [span for span in self.spans if span.depth == 0]
+        labels = ["  " * span.depth + span.name for span in self.spans]
+        width = max(len(label) for label in labels + ["total"])
+        lines = [f"{'step':<{width}} {'wall ms':>10} {'procs':>6} {'read':>10} {'written':>10}"]
+        for label, span in zip(labels, self.spans):
+            lines.append(
+                f"{label:<{width}} {span.duration * 1000:>10.1f} {span.subprocesses:>6} "
+                f"{_format_bytes(span.bytes_read):>10} {_format_bytes(span.bytes_written):>10}"
+            )
+        total = sum(span.duration for span in top)
+        lines.append(f"{'total':<{width}} {total * 1000:>10.1f} {sum(span.subprocesses for span in top):>6}")
+        return "\n".join(lines)
+
+    def chrome_trace(self) -> dict:
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": self._thread, "args": {"name": "release.py"}}]
+        for span in self.spans:
+            args = dict(span.args, subprocesses=span.subprocesses)
+            if span.bytes_read is not None:
+                args.update(bytes_read=span.bytes_read, bytes_written=span.bytes_written)
+            events.append({
+                "name": span.name,
+                "cat": "build",
+                "ph": "X",
+                "ts": round(span.start * 1e6, 3),
+                "dur": round(span.duration * 1e6, 3),
+                "pid": pid,
+                "tid": self._thread,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: Path) -> None:
+        path.write_text(json.dumps(self.chrome_trace(), indent=1) + "\n", encoding="utf-8")
+
+
+def _format_bytes(count: Optional[int]) -> str:
+    if count is None:
+        return "-"
+    if count < 1024:
+        return f"{count} B"
+    if count < 1024 * 1024:
+        return f"{count / 1024:.1f} KB"
+    return f"{count / (1024 * 1024):.1f} MB"
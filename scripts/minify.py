@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""Conservative, dependency-free minifiers for the packaged extension files.
+
+The JavaScript minifier only removes comments and redundant whitespace; it keeps
+line breaks wherever automatic semicolon insertion could depend on them, and never
+renames or rewrites code. PNGs are recompressed losslessly: the decoded pixel
+stream is left untouched and only the deflate encoding and non-colour metadata
+change.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+_WORD = re.compile(r"[A-Za-z0-9_$\\\u0080-\U0010ffff]")
+_JS_SPACE = " \t\r\n\f\v\u00a0\ufeff"
+_REGEX_KEYWORDS = frozenset((
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await",
+))
+# Dropping the space between these pairs would change the token stream (a + +b, a - -b).
+_KEEP_SPACE = frozenset((("+", "+"), ("-", "-"), ("/", "/"), ("/", "*")))
+# A line break after these characters, or before the ones below, can never feed automatic semicolon insertion.
+_NO_ASI_AFTER = frozenset(";{,(")
+_NO_ASI_BEFORE = frozenset("};,)")
+
+
+class MinifyError(ValueError):
+    """Raised when a file cannot be tokenised safely (unterminated string, comment or regex)."""
+
+
+def _is_word(char: str) -> bool:
+    return bool(char) and bool(_WORD.match(char))
+
+
+class _JavaScriptMinifier:
+    def __init__(self, source: str) -> None:
+        self.source = source
+        self.pos = 0
+        self.out: List[str] = []
+        self.previous = ""
+        self.previous_after_operand = False
+        self.regex_allowed = True
+
+    def _last(self) -> str:
+        return self.out[-1][-1] if self.out else ""
+
+    def _emit(self, text: str, *, operand: bool = False) -> None:
+        """Append a token; ``operand`` marks literals after which ``/`` means division."""
+        after_operand = not self.regex_allowed
+        if operand or text in (")", "]", "}"):
+            self.regex_allowed = False
+        elif _is_word(text[0]):
+            self.regex_allowed = text in _REGEX_KEYWORDS
+        elif text in ("+", "-") and self.previous == text and self.previous_after_operand:
+            self.regex_allowed = False  # postfix ++ / --
+        else:
+            self.regex_allowed = True
+        self.previous = text
+        self.previous_after_operand = after_operand
+        self.out.append(text)
+
+    def _whitespace(self, newline: bool) -> None:
+        source = self.source
+        while self.pos < len(source) and source[self.pos] in _JS_SPACE:
+            newline = newline or source[self.pos] == "\n"
+            self.pos += 1
+        last = self._last()
+        nxt = source[self.pos] if self.pos < len(source) else ""
+        if not last or not nxt or last == "\n":
+            return
+        if newline and last not in _NO_ASI_AFTER and nxt not in _NO_ASI_BEFORE:
+            self.out.append("\n")
+        elif (_is_word(last) and _is_word(nxt)) or (last, nxt) in _KEEP_SPACE or (last.isdigit() and nxt == "."):
+            self.out.append(" ")
+
+    def _quoted(self, quote: str) -> None:
+        source = self.source
+        start = self.pos
+        self.pos += 1
+        while self.pos < len(source):
+            char = source[self.pos]
+            if char == "\\":
+                self.pos += 2
+                continue
+            self.pos += 1
+            if char == quote:
+                self._emit(source[start:self.pos], operand=True)
+                return
+            if char == "\n":
+                break
+        raise MinifyError(f"Unterminated string starting at offset {start}")
+
+    def _template(self) -> None:
+        source = self.source
+        start = self.pos
+        self.pos += 1
+        while self.pos < len(source):
+            char = source[self.pos]
+            if char == "\\":
+                self.pos += 2
+            elif char == "`":
+                self.pos += 1
+                self._emit(source[start:self.pos], operand=True)
+                return
+            elif source.startswith("${", self.pos):
+                self.pos += 2
+                self._emit(source[start:self.pos])
+                self.code(until_brace=True)
+                start = self.pos
+                self.pos += 1  # the closing brace, kept with the next literal part
+            else:
+                self.pos += 1
+        raise MinifyError(f"Unterminated template literal starting at offset {start}")
+
+    def _regex(self) -> None:
+        source = self.source
+        start = self.pos
+        self.pos += 1
+        in_class = False
+        while self.pos < len(source):
+            char = source[self.pos]
+            if char == "\\":
+                self.pos += 2
+                continue
+            if char == "\n":
+                break
+            self.pos += 1
+            if char == "[":
+                in_class = True
+            elif char == "]":
+                in_class = False
+            elif char == "/" and not in_class:
+                while self.pos < len(source) and _is_word(source[self.pos]):
+                    self.pos += 1
+                self._emit(source[start:self.pos], operand=True)
+                return
+        raise MinifyError(f"Unterminated regular expression starting at offset {start}")
+
+    def code(self, until_brace: bool = False) -> None:
+        source = self.source
+        depth = 0
+        while self.pos < len(source):
+            char = source[self.pos]
+            if char in _JS_SPACE:
+                self._whitespace(False)
+            elif source.startswith("//", self.pos):
+                end = source.find("\n", self.pos)
+                self.pos = len(source) if end == -1 else end
+                self._whitespace(False)
+            elif source.startswith("/*", self.pos):
+                end = source.find("*/", self.pos + 2)
+                if end == -1:
+                    raise MinifyError(f"Unterminated comment starting at offset {self.pos}")
+                comment = source[self.pos:end + 2]
+                self.pos = end + 2
+                if comment.startswith("/*!"):
+                    self.out.append(comment)
+                else:
+                    self._whitespace("\n" in comment)
+            elif char in "'\"":
+                self._quoted(char)
+            elif char == "`":
+                self._template()
+            elif char == "/" and self.regex_allowed:
+                self._regex()
+            elif _is_word(char):
+                start = self.pos
+                while self.pos < len(source) and _is_word(source[self.pos]):
+                    self.pos += 1
+                self._emit(source[start:self.pos])
+            else:
+                if until_brace:
+                    if char == "{":
+                        depth += 1
+                    elif char == "}":
+                        if depth == 0:
+                            return
+                        depth -= 1
+                self.pos += 1
+                self._emit(char)
+        if until_brace:
+            raise MinifyError("Unterminated template expression")
+
+
+def minify_js(source: str) -> str:
+    minifier = _JavaScriptMinifier(source)
+    minifier.code()
+    return "".join(minifier.out).strip() + "\n"
+
+
+_CSS_TOKEN = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')|/\*.*?\*/|\s+', re.DOTALL)
+_CSS_PUNCTUATION = re.compile(r"\s*([{};,>])\s*|:\s+")
+
+
+def _css_segment(segment: str) -> str:
+    return _CSS_PUNCTUATION.sub(lambda match: match.group(1) or ":", segment).replace(";}", "}")
+
+
+def minify_css(source: str) -> str:
+    parts: List[str] = []
+    segment: List[str] = []
+    position = 0
+    for match in _CSS_TOKEN.finditer(source):
+        segment.append(source[position:match.start()])
+        if match.group(1):
+            parts.append(_css_segment("".join(segment)))
+            parts.append(match.group(1))
+            segment = []
+        else:
+            # Comments separate tokens just like whitespace does.
+            segment.append(" ")
+        position = match.end()
+    segment.append(source[position:])
+    parts.append(_css_segment("".join(segment)))
+    return "".join(parts).strip()
+
+
+_HTML_TOKEN = re.compile(
+    r"(?P<comment><!--(?!\[if).*?-->)"
+    r"|(?P<raw><(?P<rawtag>script|style|pre|textarea)\b[^>]*>.*?</(?P=rawtag)\s*>)"
+    r"|(?P<tag><[^>]*>)",
+    re.DOTALL | re.IGNORECASE,
+)
+_TAG_SPACE = re.compile(r'("[^"]*"|\'[^\']*\')|\s+')
+_RAW_PARTS = re.compile(r"(<[^>]*>)(.*)(</[^>]*>)", re.DOTALL)
+_JS_TYPES = ("", "text/javascript", "application/javascript", "module")
+
+
+def _collapse_text(text: str) -> str:
+    return re.sub(r"\s+", lambda m: "\n" if "\n" in m.group(0) else " ", text)
+
+
+def _minify_raw(element: str, tag: str) -> str:
+    opening, body, closing = _RAW_PARTS.match(element).groups()
+    if tag == "style":
+        body = minify_css(body)
+    elif tag == "script":
+        type_match = re.search(r"""\btype\s*=\s*["']?([^"'\s>]*)""", opening, re.IGNORECASE)
+        if (type_match.group(1).lower() if type_match else "") in _JS_TYPES and body.strip():
+            body = minify_js(body).rstrip("\n")
+    return opening + body + closing
+
+
+def minify_html(source: str) -> str:
+    parts: List[str] = []
+    position = 0
+    for match in _HTML_TOKEN.finditer(source):
+        parts.append(_collapse_text(source[position:match.start()]))
+        if match.group("raw"):
+            parts.append(_minify_raw(match.group("raw"), match.group("rawtag").lower()))
+        elif match.group("tag"):
+            parts.append(_TAG_SPACE.sub(lambda m: m.group(1) or " ", match.group("tag")))
+        position = match.end()
+    parts.append(_collapse_text(source[position:]))
+    return "".join(parts).strip() + "\n"
+
+
+def minify_json(source: str) -> str:
+    return json.dumps(json.loads(source), ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Ancillary chunks that affect how pixels are rendered; everything else ancillary (text, time, pHYs,
+# bKGD, embedded provenance blobs) is dropped. Animated PNGs are left alone entirely.
+_PNG_KEEP = frozenset((b"tRNS", b"gAMA", b"cHRM", b"sRGB", b"iCCP", b"sBIT", b"cICP", b"mDCv", b"cLLi"))
+_PNG_IDAT_CHUNK = 1 << 20
+
+
+def _png_chunks(data: bytes) -> List[tuple]:
+    if not data.startswith(_PNG_SIGNATURE):
+        raise MinifyError("Not a PNG file")
+    chunks = []
+    offset = len(_PNG_SIGNATURE)
+    while offset < len(data):
+        if offset + 8 > len(data):
+            raise MinifyError("Truncated PNG chunk header")
+        length, kind = struct.unpack(">I4s", data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        if len(body) != length:
+            raise MinifyError("Truncated PNG chunk")
+        chunks.append((kind, body))
+        offset += 12 + length
+        if kind == b"IEND":
+            break
+    return chunks
+
+
+def _png_chunk(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def recompress_png(data: bytes) -> bytes:
+    """Re-deflate the image data at the strongest settings and drop non-colour metadata."""
+    chunks = _png_chunks(data)
+    kinds = {kind for kind, _ in chunks}
+    if b"acTL" in kinds or b"IDAT" not in kinds:
+        return data
+    raw = zlib.decompress(b"".join(body for kind, body in chunks if kind == b"IDAT"))
+    best: Optional[bytes] = None
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, zlib.MAX_WBITS, 9, strategy)
+        candidate = compressor.compress(raw) + compressor.flush()
+        if best is None or len(candidate) < len(best):
+            best = candidate
+    out = [_PNG_SIGNATURE]
+    wrote_idat = False
+    for kind, body in chunks:
+        if kind == b"IDAT":
+            if not wrote_idat:
+                out.extend(
+                    _png_chunk(b"IDAT", best[start:start + _PNG_IDAT_CHUNK])
+                    for start in range(0, len(best), _PNG_IDAT_CHUNK)
+                )
+                wrote_idat = True
+        elif kind[0:1].isupper() or kind in _PNG_KEEP:
+            out.append(_png_chunk(kind, body))
+    result = b"".join(out)
+    return result if len(result) < len(data) else data
+
+
+_PNG_TOOLS = (("oxipng", ["-o", "4", "--strip", "safe", "--quiet"]), ("optipng", ["-o2", "-quiet", "-strip", "all"]))
+# Installed or not, these change what optimize_file returns.
+EXTERNAL_TOOLS = ("oxipng", "optipng", "node")
+
+
+def _external_png(data: bytes) -> Optional[bytes]:
+    """Run oxipng or optipng when installed; both are lossless."""
+    for tool, args in _PNG_TOOLS:
+        executable = shutil.which(tool)
+        if not executable:
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "image.png"
+            path.write_bytes(data)
+            result = subprocess.run([executable, *args, str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+            if result.returncode == 0:
+                return path.read_bytes()
+    return None
+
+
+def optimize_png(data: bytes) -> bytes:
+    best = recompress_png(data)
+    external = _external_png(best)
+    return external if external is not None and len(external) < len(best) else best
+
+
+def _check_js(minified: str) -> bool:
+    """Let node parse the result when it is installed; without node the minifier is trusted."""
+    node = shutil.which("node")
+    if not node:
+        return True
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "check.js"
+        path.write_text(minified, encoding="utf-8")
+        return subprocess.run([node, "--check", str(path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False).returncode == 0
+
+
+def _text(minifier: Callable[[str], str], check: Optional[Callable[[str], bool]] = None) -> Callable[[bytes], bytes]:
+    def run(data: bytes) -> bytes:
+        try:
+            minified = minifier(data.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            return data
+        if check is not None and not check(minified):
+            return data
+        encoded = minified.encode("utf-8")
+        return encoded if len(encoded) < len(data) else data
+    return run
+
+
+OPTIMIZERS: Dict[str, Callable[[bytes], bytes]] = {
+    ".js": _text(minify_js, _check_js),
+    ".css": _text(minify_css),
+    ".html": _text(minify_html),
+    ".json": _text(minify_json),
+    ".png": optimize_png,
+}
+
+
+def fingerprint() -> str:
+    """A digest of this module's source and the external tools found, for keying cached optimizer output."""
+    digest = hashlib.sha256(Path(__file__).read_bytes())
+    for tool in EXTERNAL_TOOLS:
+        digest.update(f"\n{tool}={shutil.which(tool) or ''}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def optimize_file(name: str, data: bytes) -> bytes:
+    """Return the smallest safe encoding of ``data``, or ``data`` itself when no optimizer applies or helps."""
+    optimizer = OPTIMIZERS.get(Path(name).suffix.lower())
+    if optimizer is None:
+        return data
+    try:
+        return optimizer(data)
+    except (MinifyError, zlib.error):
+        return data
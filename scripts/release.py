@@ -1,28 +1,47 @@
 #!/usr/bin/env python3
-"""Interactively build SHIFT Code Manager releases or test artifacts."""
+"""Build SHIFT Code Manager releases or test artifacts, interactively or from the command line."""
 
 from __future__ import annotations
 
+import argparse
+import cProfile
+import hashlib
 import json
+import pstats
 import re
+import shutil
+import struct
 import subprocess
 import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime
+from fnmatch import fnmatch
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Sequence, Tuple
-from zipfile import ZIP_DEFLATED, ZipFile
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from zipfile import ZIP_DEFLATED, ZIP_STORED, BadZipFile, ZipFile
+
+from build_trace import BuildTrace
+from minify import fingerprint, optimize_file
 
 REPO_ROOT = Path(__file__).resolve().parent.parent
 CHROME_MANIFEST = REPO_ROOT / "manifest.chrome.json"
 FIREFOX_MANIFEST = REPO_ROOT / "manifest.firefox.json"
 DEFAULT_MANIFEST = CHROME_MANIFEST
 CHANGELOG_PATH = REPO_ROOT / "CHANGELOG.md"
+CHANGELOG_CACHE = REPO_ROOT / ".release-cache" / "changelog.json"
 PACKAGE_JSON = REPO_ROOT / "package.json"
 PACKAGE_LOCK = REPO_ROOT / "package-lock.json"
 DIST_DIR = REPO_ROOT / "dist"
+ARTIFACT_CACHE_DIR = DIST_DIR / ".cache"
+ARTIFACT_CACHE_LIMIT = 16
 PACKAGE_TEMPLATE = "shift-code-manager-{version}.zip"
 TEST_PACKAGE_SUFFIX = "test"
+ZIP_TIMESTAMP = (1980, 1, 1, 0, 0, 0)
+SIZE_BUDGET_PATH = REPO_ROOT / "size-budget.json"
+TRACE = BuildTrace()
 PACKAGE_ENTRIES: Sequence[str] = (
     "manifest.chrome.json",
     "popup.html",
@@ -60,6 +79,54 @@ class Release:
     commits: List[Commit]
 
 
+@dataclass
+class _HistoryCommit:
+    commit: Commit
+    parents: Tuple[str, ...]
+    index: int
+
+
+@dataclass
+class _History:
+    commits: Dict[str, _HistoryCommit]
+    head: Optional[str]
+
+
+@dataclass(frozen=True)
+class _SourceFile:
+    data: bytes
+    digest: str
+
+
+@dataclass(frozen=True)
+class SizeBudget:
+    total: Optional[int]
+    files: Dict[str, int]
+
+
+@dataclass(frozen=True)
+class _SourceInfo:
+    rel_path: str
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+@dataclass(frozen=True)
+class _CompressedData:
+    method: int
+    crc: int
+    size: int
+    payload: bytes
+
+
+_LOG_FORMAT = "%H%x1f%h%x1f%P%x1f%cs%x1f%D%x1f%s"
+# Bump when _format_release output changes so cached sections are rebuilt.
+_CHANGELOG_CACHE_VERSION = 1
+# Bump when _write_zip or _compress output changes so cached artifacts are rebuilt.
+_ARTIFACT_FORMAT_VERSION = 1
+_OPTIMIZE_LEVELS = tuple(range(1, 10))
+
 _RTYPE_PATTERN = re.compile(r"^(?P<type>[a-z]+)(?:\([^)]+\))?:\s*(?P<rest>.+)$")
 
 
@@ -170,34 +237,348 @@ def _iter_package_paths(entries: Sequence[str]) -> Iterable[Path]:
             raise BuildError(f"Package entry missing: {entry}")
 
 
-def _build_zip(version: str, *, suffix: Optional[str] = None, manifest_path: Optional[Path] = None) -> Path:
-    DIST_DIR.mkdir(parents=True, exist_ok=True)
+def _artifact_name(version: str, suffix: Optional[str]) -> str:
     filename = PACKAGE_TEMPLATE.format(version=version)
     if suffix:
         stem, ext = filename.rsplit(".", 1)
         filename = f"{stem}-{suffix}.{ext}"
-    artifact_path = DIST_DIR / filename
-    if manifest_path and not manifest_path.exists():
-        raise BuildError(f"Manifest override not found at {manifest_path}")
-    with ZipFile(artifact_path, "w", ZIP_DEFLATED) as zf:
-        for file_path in _iter_package_paths(PACKAGE_ENTRIES):
-            if file_path == CHROME_MANIFEST:
-                source_path = manifest_path or file_path
-                zf.write(source_path, "manifest.json")
-                continue
-            arcname = file_path.relative_to(REPO_ROOT)
-            zf.write(file_path, arcname.as_posix())
-    return artifact_path
-
-
-def _build_release_artifacts(version: str, *, test_build: bool) -> List[Path]:
+    return filename
+
+
+def _package_layout(manifest_path: Optional[Path]) -> List[Tuple[str, Path]]:
+    """Return ``(archive name, source file)`` pairs in archive order for one browser flavour."""
+    layout = []
+    for file_path in _iter_package_paths(PACKAGE_ENTRIES):
+        if file_path == CHROME_MANIFEST:
+            layout.append(("manifest.json", manifest_path or file_path))
+        else:
+            layout.append((file_path.relative_to(REPO_ROOT).as_posix(), file_path))
+    return layout
+
+
+def _read_source(path: Path) -> _SourceFile:
+    data = path.read_bytes()
+    return _SourceFile(data=data, digest=hashlib.sha256(data).hexdigest())
+
+
+def _source_info(path: Path, known: Dict[str, dict]) -> _SourceInfo:
+    """Stat ``path`` and hash it only when its size or mtime differs from the previous build manifest."""
+    rel_path = path.relative_to(REPO_ROOT).as_posix()
+    stat = path.stat()
+    entry = known.get(rel_path)
+    if entry and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        digest = entry["sha256"]
+    else:
+        digest = _read_source(path).digest
+    return _SourceInfo(rel_path, stat.st_size, stat.st_mtime_ns, digest)
+
+
+def _compress(source: _SourceFile, levels: Sequence[int] = (zlib.Z_DEFAULT_COMPRESSION,)) -> _CompressedData:
+    """Deflate at each of ``levels`` and keep the smallest result."""
+    payload = b""
+    for level in levels:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        candidate = compressor.compress(source.data) + compressor.flush()
+        if not payload or len(candidate) < len(payload):
+            payload = candidate
+    crc = zlib.crc32(source.data)
+    if len(payload) >= len(source.data):
+        # Already-compressed files (PNG) are stored rather than inflated by deflate framing.
+        return _CompressedData(ZIP_STORED, crc, len(source.data), source.data)
+    return _CompressedData(ZIP_DEFLATED, crc, len(source.data), payload)
+
+
+def _optimize_source(path: Path, source: _SourceFile) -> _SourceFile:
+    data = optimize_file(path.name, source.data)
+    return source if data is source.data else _SourceFile(data=data, digest=source.digest)
+
+
+@lru_cache(maxsize=None)
+def _build_mode(optimize: bool) -> str:
+    """How members are produced; optimized output also depends on minify.py and the tools it finds."""
+    return f"optimized-{fingerprint()[:16]}" if optimize else "plain"
+
+
+def _layout_key(layout: Sequence[Tuple[str, Path]], digests: Dict[Path, str], *, optimize: bool) -> str:
+    mode = _build_mode(optimize)
+    digest = hashlib.sha256(f"zip-v{_ARTIFACT_FORMAT_VERSION}-{mode}\n".encode())
+    for arcname, path in layout:
+        digest.update(f"{arcname}\x00{digests[path]}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _write_zip(path: Path, members: Sequence[Tuple[str, _CompressedData]]) -> None:
+    """Write a deterministic zip: fixed timestamps, fixed permissions and the given member order."""
+    if len(members) > 0xFFFF:
+        raise BuildError("Too many files for a zip without ZIP64 support")
+    dos_time = (ZIP_TIMESTAMP[3] << 11) | (ZIP_TIMESTAMP[4] << 5) | (ZIP_TIMESTAMP[5] // 2)
+    dos_date = ((ZIP_TIMESTAMP[0] - 1980) << 9) | (ZIP_TIMESTAMP[1] << 5) | ZIP_TIMESTAMP[2]
+    local_parts: List[bytes] = []
+    central_parts: List[bytes] = []
+    offset = 0
+    for arcname, member in members:
+        name = arcname.encode("utf-8")
+        flags = 0 if name.isascii() else 0x800
+        fields = (20, flags, member.method, dos_time, dos_date, member.crc, len(member.payload), member.size, len(name))
+        local = struct.pack("<IHHHHHIIIHH", 0x04034B50, *fields, 0) + name
+        central_parts.append(
+            struct.pack("<IH", 0x02014B50, (3 << 8) | 20)
+            + struct.pack("<HHHHHIIIH", *fields)
+            + struct.pack("<HHHHII", 0, 0, 0, 0, 0o100644 << 16, offset)
+            + name
+        )
+        local_parts.extend((local, member.payload))
+        offset += len(local) + len(member.payload)
+    central = b"".join(central_parts)
+    if offset + len(central) > 0xFFFFFFFF:
+        raise BuildError("Package too large for a zip without ZIP64 support")
+    end = struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, len(members), len(members), len(central), offset, 0)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("wb") as handle:
+        handle.writelines(local_parts)
+        handle.write(central)
+        handle.write(end)
+    tmp_path.replace(path)
+
+
+def _read_zip_members(path: Path, wanted: Dict[str, str]) -> Dict[str, _CompressedData]:
+    """Raw-copy the compressed bytes of ``{arcname: sha256}`` members out of a previous build, keyed by sha256."""
+    members: Dict[str, _CompressedData] = {}
+    try:
+        with ZipFile(path) as zf, path.open("rb") as handle:
+            for info in zf.infolist():
+                digest = wanted.get(info.filename)
+                if digest is None or digest in members:
+                    continue
+                handle.seek(info.header_offset)
+                header = handle.read(30)
+                name_length, extra_length = struct.unpack("<HH", header[26:30])
+                handle.seek(info.header_offset + 30 + name_length + extra_length)
+                payload = handle.read(info.compress_size)
+                members[digest] = _CompressedData(info.compress_type, info.CRC, info.file_size, payload)
+    except (OSError, BadZipFile, struct.error):
+        return {}
+    return members
+
+
+def _build_manifest_path(suffix: Optional[str]) -> Path:
+    return ARTIFACT_CACHE_DIR / f"{suffix or 'release'}.manifest.json"
+
+
+def _load_build_manifest(suffix: Optional[str]) -> dict:
+    try:
+        manifest = json.loads(_build_manifest_path(suffix).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return manifest if isinstance(manifest, dict) and manifest.get("version") == _ARTIFACT_FORMAT_VERSION else {}
+
+
+def _save_build_manifest(
+    suffix: Optional[str],
+    zip_path: Path,
+    layout: Sequence[Tuple[str, Path]],
+    infos: Dict[Path, _SourceInfo],
+    *,
+    optimize: bool,
+) -> None:
+    manifest = {
+        "version": _ARTIFACT_FORMAT_VERSION,
+        "mode": _build_mode(optimize),
+        "zip": zip_path.name,
+        "files": {
+            arcname: {
+                "path": infos[path].rel_path,
+                "size": infos[path].size,
+                "mtime_ns": infos[path].mtime_ns,
+                "sha256": infos[path].digest,
+            }
+            for arcname, path in layout
+        },
+    }
+    _build_manifest_path(suffix).write_text(json.dumps(manifest, indent=1) + "\n", encoding="utf-8")
+
+
+def _prune_artifact_cache(keep: Iterable[Path]) -> None:
+    """Drop the oldest cached zips beyond ``ARTIFACT_CACHE_LIMIT``, never one a manifest still points at."""
+    keep_names = {path.name for path in keep}
+    zips = sorted(ARTIFACT_CACHE_DIR.glob("*.zip"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for stale in zips[ARTIFACT_CACHE_LIMIT:]:
+        if stale.name not in keep_names:
+            stale.unlink(missing_ok=True)
+
+
+def _source_infos(
+    paths: Sequence[Path], previous: Sequence[dict], pool: Optional[ThreadPoolExecutor] = None
+) -> Dict[Path, _SourceInfo]:
+    known = {
+        entry["path"]: entry
+        for manifest in previous
+        for entry in manifest.get("files", {}).values()
+        if isinstance(entry, dict) and "path" in entry
+    }
+    mapper = pool.map if pool is not None else map
+    return dict(zip(paths, mapper(lambda path: _source_info(path, known), paths)))
+
+
+def _build_artifacts(
+    version: str,
+    flavours: Sequence[Tuple[Optional[str], Optional[Path]]],
+    *,
+    optimize: bool = False,
+    budget: Optional[SizeBudget] = None,
+    incremental: bool = True,
+) -> List[Path]:
+    """Build one zip per ``(suffix, manifest override)`` flavour.
+
+    Every source file is hashed and compressed at most once and shared between flavours, which are written in
+    parallel. Zips are content-addressed in ``dist/.cache`` by their member names and hashes, so a flavour
+    whose inputs have not changed is copied from the cache instead of rebuilt. With ``optimize`` files are
+    minified first and deflated at whichever level packs them smallest; a ``budget`` is checked against
+    every artifact.
+
+    With ``incremental`` each flavour's ``<suffix>.manifest.json`` records the (path, size, mtime, hash) of
+    its members: files whose size and mtime are unchanged are not re-read, and unchanged members are
+    raw-copied from the previous zip without being inflated or deflated again. Without it every file is
+    re-read and recompressed and the cached zips are written again.
+    """
+    for _, manifest_path in flavours:
+        if manifest_path and not manifest_path.exists():
+            raise BuildError(f"Manifest override not found at {manifest_path}")
+    ARTIFACT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    mode = _build_mode(optimize)
+    layouts = [_package_layout(manifest_path) for _, manifest_path in flavours]
+    paths = sorted({path for layout in layouts for _, path in layout})
+    previous = [_load_build_manifest(suffix) for suffix, _ in flavours] if incremental else []
+    with ThreadPoolExecutor() as pool:
+        with TRACE.span("hash sources", files=len(paths)):
+            infos = _source_infos(paths, previous, pool)
+        digests = {path: info.digest for path, info in infos.items()}
+        cached = [
+            ARTIFACT_CACHE_DIR / f"{_layout_key(layout, digests, optimize=optimize)}.zip" for layout in layouts
+        ]
+        # A full rebuild overwrites the cached zips too, so it can replace a bad cache entry.
+        pending = [
+            index for index, cache_path in enumerate(cached) if not incremental or not cache_path.exists()
+        ]
+        unique = {digests[path]: path for index in pending for _, path in layouts[index]}
+        compressed: Dict[str, _CompressedData] = {}
+        with TRACE.span("reuse members") as span:
+            for manifest in previous:
+                zip_path = ARTIFACT_CACHE_DIR / str(manifest.get("zip", ""))
+                if manifest.get("mode") != mode or not zip_path.is_file():
+                    continue
+                wanted = {
+                    arcname: entry.get("sha256")
+                    for arcname, entry in manifest.get("files", {}).items()
+                    if entry.get("sha256") in unique and entry.get("sha256") not in compressed
+                }
+                if wanted:
+                    compressed.update(_read_zip_members(zip_path, wanted))
+            span.args["members"] = len(compressed)
+        fresh = {digest: path for digest, path in unique.items() if digest not in compressed}
+        with TRACE.span("read sources", files=len(fresh)):
+            prepared = list(pool.map(_read_source, fresh.values()))
+        if optimize:
+            with TRACE.span("optimize", files=len(fresh)):
+                prepared = list(pool.map(_optimize_source, fresh.values(), prepared))
+            levels: Sequence[int] = _OPTIMIZE_LEVELS
+        else:
+            levels = (zlib.Z_DEFAULT_COMPRESSION,)
+        with TRACE.span("compress", files=len(fresh)):
+            compressed.update(zip(fresh, pool.map(lambda source: _compress(source, levels), prepared)))
+        with TRACE.span("write zips", zips=len(pending)):
+            list(pool.map(
+                lambda index: _write_zip(
+                    cached[index],
+                    [(arcname, compressed[digests[path]]) for arcname, path in layouts[index]],
+                ),
+                pending,
+            ))
+    artifacts = []
+    with TRACE.span("copy artifacts", cached=len(flavours) - len(pending)):
+        for (suffix, _), cache_path in zip(flavours, cached):
+            artifact_path = DIST_DIR / _artifact_name(version, suffix)
+            shutil.copyfile(cache_path, artifact_path)
+            artifacts.append(artifact_path)
+    for (suffix, _), layout, cache_path in zip(flavours, layouts, cached):
+        _save_build_manifest(suffix, cache_path, layout, infos, optimize=optimize)
+    _prune_artifact_cache(cached)
+    if budget is not None:
+        try:
+            for artifact_path in artifacts:
+                _check_size_budget(artifact_path, budget)
+        except BuildError:
+            for artifact_path in artifacts:
+                artifact_path.unlink()
+            raise
+    return artifacts
+
+
+def _build_zip(version: str, *, suffix: Optional[str] = None, manifest_path: Optional[Path] = None) -> Path:
+    return _build_artifacts(version, [(suffix, manifest_path)])[0]
+
+
+def _build_release_artifacts(
+    version: str,
+    *,
+    test_build: bool,
+    optimize: bool = False,
+    budget: Optional[SizeBudget] = None,
+    incremental: bool = True,
+) -> List[Path]:
     chrome_suffix = TEST_PACKAGE_SUFFIX if test_build else None
     firefox_suffix = f"{TEST_PACKAGE_SUFFIX}-firefox" if test_build else "firefox"
-    artifacts = [
-        _build_zip(version, suffix=chrome_suffix),
-        _build_zip(version, suffix=firefox_suffix, manifest_path=FIREFOX_MANIFEST),
-    ]
-    return artifacts
+    return _build_artifacts(
+        version,
+        [(chrome_suffix, None), (firefox_suffix, FIREFOX_MANIFEST)],
+        optimize=optimize,
+        budget=budget,
+        incremental=incremental,
+    )
+
+
+def _load_size_budget(path: Path) -> SizeBudget:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except OSError as exc:
+        raise BuildError(f"Unable to read size budget {path}: {exc}") from exc
+    except json.JSONDecodeError as exc:
+        raise BuildError(f"Unable to parse size budget {path}: {exc}") from exc
+    total = data.get("total")
+    files = data.get("files", {})
+    if total is not None and not isinstance(total, int):
+        raise BuildError(f"Size budget 'total' must be a byte count in {path}")
+    if not isinstance(files, dict) or any(not isinstance(limit, int) for limit in files.values()):
+        raise BuildError(f"Size budget 'files' must map glob patterns to byte counts in {path}")
+    return SizeBudget(total=total, files=files)
+
+
+def _check_size_budget(artifact_path: Path, budget: SizeBudget) -> None:
+    """Compare packed member sizes and the artifact size against ``budget``; fail with a size report."""
+    with ZipFile(artifact_path) as zf:
+        members = sorted(zf.infolist(), key=lambda info: info.compress_size, reverse=True)
+    total = artifact_path.stat().st_size
+    failures = 0
+    lines = [f"Size report for {artifact_path.name} (bytes):", f"  {'file':<32} {'size':>10} {'packed':>10} {'budget':>10}"]
+    for info in members:
+        limits = [limit for pattern, limit in budget.files.items() if fnmatch(info.filename, pattern)]
+        limit = min(limits) if limits else None
+        over = limit is not None and info.compress_size > limit
+        failures += over
+        lines.append(
+            f"  {info.filename:<32} {info.file_size:>10} {info.compress_size:>10} "
+            f"{limit if limit is not None else '-':>10}{'  OVER' if over else ''}"
+        )
+    over = budget.total is not None and total > budget.total
+    failures += over
+    lines.append(
+        f"  {'total':<32} {sum(info.file_size for info in members):>10} {total:>10} "
+        f"{budget.total if budget.total is not None else '-':>10}{'  OVER' if over else ''}"
+    )
+    report = "\n".join(lines)
+    if failures:
+        raise BuildError(f"{failures} size budget(s) exceeded.\n{report}")
+    print(f"📦 {artifact_path.name}: {total} bytes, within budget")
 
 
 def _stage_and_commit(version: str, paths: Sequence[Path]) -> None:
@@ -233,26 +614,66 @@ def _push_release() -> None:
         raise BuildError("Release commit pushed, but pushing tags failed: " + str(exc)) from exc
 
 
-def _commit_range(current: str, previous: Optional[str]) -> str:
-    return f"{previous}..{current}" if previous else current
+def _gather_tags() -> List[Tuple[str, str, str]]:
+    """Return ``(tag, object sha, commit sha)`` triples oldest first, peeling annotated tags in the same call."""
+    output = _run_git([
+        "for-each-ref",
+        "refs/tags",
+        "--sort=creatordate",
+        "--format=%(refname:short)%1f%(objectname)%1f%(*objectname)",
+    ])
+    tags: List[Tuple[str, str, str]] = []
+    for line in output.splitlines():
+        name, sha, peeled = line.split("\x1f")
+        tags.append((name, sha, peeled or sha))
+    return tags
 
 
-def _parse_commit_line(raw: str) -> Commit:
-    sha, date_str, summary = raw.split("\x1f", 2)
-    return Commit(sha=sha, date=datetime.strptime(date_str, "%Y-%m-%d"), summary=summary)
+def _is_head(decorations: str) -> bool:
+    return any(ref == "HEAD" or ref.startswith("HEAD -> ") for ref in decorations.split(", "))
 
 
-def _collect_commits(rev_range: str) -> List[Commit]:
+def _read_history() -> _History:
+    """Read every commit reachable from HEAD or a tag with a single ``git log``."""
     output = _run_git([
         "log",
-        rev_range,
-        "--pretty=format:%h\x1f%cs\x1f%s",
         "--date-order",
-        "--no-merges",
+        f"--pretty=format:{_LOG_FORMAT}",
+        "--tags",
+        "HEAD",
     ])
-    if not output:
-        return []
-    return [_parse_commit_line(line) for line in output.splitlines()]
+    history = _History(commits={}, head=None)
+    for index, line in enumerate(output.splitlines()):
+        sha, short_sha, parents, date_str, decorations, summary = line.split("\x1f", 5)
+        history.commits[sha] = _HistoryCommit(
+            commit=Commit(sha=short_sha, date=datetime.strptime(date_str, "%Y-%m-%d"), summary=summary),
+            parents=tuple(parents.split()),
+            index=index,
+        )
+        if history.head is None and _is_head(decorations):
+            history.head = sha
+    if history.head is None:
+        history.head = _run_git(["rev-parse", "HEAD"])
+    return history
+
+
+def _walk(history: _History, start: str, stop: Set[str]) -> Tuple[Set[str], Set[str]]:
+    """Commits reachable from ``start`` that are not in ``stop``, plus the ``stop`` commits met on the way."""
+    seen: Set[str] = set()
+    boundary: Set[str] = set()
+    pending = [start]
+    while pending:
+        sha = pending.pop()
+        if sha in seen:
+            continue
+        if sha in stop:
+            boundary.add(sha)
+            continue
+        seen.add(sha)
+        entry = history.commits.get(sha)
+        if entry is not None:
+            pending.extend(entry.parents)
+    return seen, boundary
 
 
 def _derive_label(
@@ -289,49 +710,91 @@ def _clean_summary(summary: str) -> str:
     return summary[:1].upper() + summary[1:] if summary else summary
 
 
-def _release_date(ref: str) -> datetime:
-    raw_date = _run_git(["log", "-1", ref, "--pretty=format:%cs"])
-    return datetime.strptime(raw_date, "%Y-%m-%d")
-
-
-def _gather_refs() -> List[str]:
-    tags = [tag for tag in _run_git(["tag", "--sort=creatordate"]).splitlines() if tag]
+def _gather_refs(history: _History) -> List[Tuple[str, str]]:
+    tags = _gather_tags()
     if not tags:
         raise BuildError(
             "No git tags found. Tag previous releases (e.g. 'git tag 1.0 <commit>') before generating a release."
         )
-    try:
-        head_sha = _run_git(["rev-parse", "HEAD"])
-        latest_tag_sha = _run_git(["rev-parse", tags[-1]])
-    except BuildError:
-        return tags + ["HEAD"]
-    if head_sha != latest_tag_sha:
-        tags.append("HEAD")
-    return tags
-
-
-def _build_releases(manifest_version: Optional[str]) -> List[Release]:
-    refs = _gather_refs()
-    releases: List[Release] = []
+    refs = [(name, commit_sha) for name, _, commit_sha in tags]
+    # Compared against the tag object, as `git rev-parse <tag>` did, so an annotated tag on HEAD still
+    # gets its "(unreleased)" section.
+    if history.head != tags[-1][1]:
+        refs.append(("HEAD", history.head))
+    return refs
+
+
+def _release_commits(history: _History, members: Set[str]) -> List[Commit]:
+    entries = sorted((history.commits[sha] for sha in members if sha in history.commits), key=lambda entry: entry.index)
+    return [entry.commit for entry in entries if len(entry.parents) < 2]
+
+
+def _build_sections(manifest_version: Optional[str], cache: Dict[str, str]) -> Tuple[List[str], Dict[str, str]]:
+    """Render one changelog section per release, newest first, reusing cached sections of tagged releases.
+
+    Returns the sections and the cache entries to keep. A tagged release is keyed by its tag, commit and the
+    previous release's commit, so only sections whose range changed (normally just the newest) are rebuilt.
+    """
+    with TRACE.span("read history"):
+        history = _read_history()
+        refs = _gather_refs(history)
+    latest_tag_label = next(_derive_label(ref, None, None) for ref, _ in reversed(refs) if ref != "HEAD")
+    sections: List[str] = []
+    used: Dict[str, str] = {}
     previous: Optional[str] = None
-    latest_tag_label: Optional[str] = None
-    for candidate in reversed(refs):
-        if candidate == "HEAD":
-            continue
-        latest_tag_label = candidate[1:] if candidate.startswith("v") and len(candidate) > 1 else candidate
-        break
-    for ref in refs:
-        commits = _collect_commits(_commit_range(ref, previous))
-        releases.append(
-            Release(
+    # Ancestors of the previous release, or None until a rebuilt section needs them.
+    reachable: Optional[Set[str]] = set()
+    for ref, sha in refs:
+        key = None if ref == "HEAD" else "\x1f".join((ref, sha, previous or ""))
+        section = cache.get(key) if key else None
+        if section is None:
+            if reachable is None:
+                reachable, _ = _walk(history, previous, set())
+            members, boundary = _walk(history, sha, reachable)
+            release = Release(
                 label=_derive_label(ref, manifest_version, latest_tag_label),
-                date=_release_date(ref),
-                commits=commits,
+                date=history.commits[sha].commit.date,
+                commits=_release_commits(history, members),
             )
-        )
-        previous = ref
-    releases.reverse()
-    return releases
+            section = _format_release(release)
+            if previous is None or previous in boundary:
+                reachable |= members
+            else:
+                reachable = None
+        else:
+            reachable = None
+        if key:
+            used[key] = section
+        sections.append(section)
+        previous = sha
+    sections.reverse()
+    return sections, used
+
+
+def _load_changelog_cache(path: Optional[Path]) -> Dict[str, str]:
+    if path is None:
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != _CHANGELOG_CACHE_VERSION:
+        return {}
+    sections = data.get("sections")
+    return sections if isinstance(sections, dict) else {}
+
+
+def _save_changelog_cache(path: Optional[Path], sections: Dict[str, str]) -> None:
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"version": _CHANGELOG_CACHE_VERSION, "sections": sections}), encoding="utf-8")
+        tmp_path.replace(path)
+    except OSError:
+        # The cache only saves time; a read-only checkout still gets a full changelog.
+        pass
 
 
 def _format_release(release: Release) -> str:
@@ -356,8 +819,23 @@ def _format_release(release: Release) -> str:
     return "\n".join(lines).rstrip()
 
 
-def generate_changelog(manifest_path: Path, output_path: Path) -> None:
+def render_changelog(manifest_version: Optional[str], *, cache_path: Optional[Path] = CHANGELOG_CACHE) -> str:
     _ensure_git_repo()
+    cache = _load_changelog_cache(cache_path)
+    sections, used = _build_sections(manifest_version, cache)
+    if used != cache:
+        _save_changelog_cache(cache_path, used)
+    header = "# Changelog\n"
+    body = "\n\n".join(sections)
+    return f"{header}\n{body}\n"
+
+
+def generate_changelog(
+    manifest_path: Path,
+    output_path: Path,
+    *,
+    cache_path: Optional[Path] = CHANGELOG_CACHE,
+) -> None:
     try:
         manifest_version = None
         if manifest_path.exists():
@@ -365,10 +843,7 @@ def generate_changelog(manifest_path: Path, output_path: Path) -> None:
             manifest_version = str(data.get("version")) if data.get("version") is not None else None
     except json.JSONDecodeError as exc:
         raise BuildError(f"Failed to parse {manifest_path}: {exc}") from exc
-    releases = _build_releases(manifest_version)
-    header = "# Changelog\n"
-    body = "\n\n".join(_format_release(release) for release in releases)
-    output_path.write_text(f"{header}\n{body}\n", encoding="utf-8")
+    output_path.write_text(render_changelog(manifest_version, cache_path=cache_path), encoding="utf-8")
 
 
 def _prompt_choice(current_version: str) -> Tuple[str, Dict[str, str]]:
@@ -402,121 +877,381 @@ def _confirm_manifest_version(manifest: dict) -> str:
     return version
 
 
-def main() -> int:
+@dataclass
+class Step:
+    """One pipeline step; ``needed`` is False when its inputs already match its output."""
+
+    name: str
+    action: Callable[[], None]
+    needed: bool = True
+    detail: str = ""
+
+
+@dataclass
+class _ReleaseState:
+    artifact_path: Optional[Path] = None
+    commit_created: bool = False
+    tag_created: bool = False
+    push_completed: bool = False
+
+
+def _print_plan(title: str, steps: Sequence[Step]) -> None:
+    print(title)
+    for step in steps:
+        print(f"  [{'run' if step.needed else 'skip':<4}] {step.name:<15} {step.detail}")
+
+
+def _run_steps(steps: Sequence[Step]) -> None:
+    for step in steps:
+        if step.needed:
+            with TRACE.span(step.name):
+                step.action()
+        else:
+            print(f"⏭️  Skipping {step.name}: {step.detail}")
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as exc:
+        raise BuildError(f"Unable to parse {path}: {exc}") from exc
+    if not isinstance(data, dict):
+        raise BuildError(f"Unable to parse {path}: expected a JSON object")
+    return data
+
+
+def _json_version(path: Path) -> Optional[str]:
+    if not path.exists():
+        return None
+    version = _read_json(path).get("version")
+    return None if version is None else str(version)
+
+
+def _lockfile_versions(lock: dict) -> List[Optional[str]]:
+    versions = [lock.get("version")]
+    root = lock.get("packages", {}).get("")
+    if root is not None:
+        versions.append(root.get("version"))
+    return versions
+
+
+def _lockfile_matches(package_data: dict, lock: dict) -> bool:
+    """True when package.json and the lockfile's root entry differ at most in their version."""
+    if lock.get("name") != package_data.get("name"):
+        return False
+    root = lock.get("packages", {}).get("")
+    if root is None:
+        return True
+    return all(
+        root.get(field, {}) == package_data.get(field, {})
+        for field in ("dependencies", "devDependencies", "optionalDependencies", "peerDependencies")
+    )
+
+
+def _bump_manifests(version: str) -> None:
+    for path in (DEFAULT_MANIFEST, FIREFOX_MANIFEST):
+        if path.exists():
+            manifest = _load_manifest(path)
+            manifest["version"] = version
+            _write_manifest(path, manifest)
+
+
+def _bump_package_json(version: str) -> None:
+    package_data = _read_json(PACKAGE_JSON)
+    package_data["version"] = version
+    _write_package_json(PACKAGE_JSON, package_data)
+
+
+def _bump_package_lock(version: str) -> None:
+    """Set the lockfile's version fields directly; only fall back to npm when dependencies drifted."""
+    package_data = _read_json(PACKAGE_JSON)
+    lock = _read_json(PACKAGE_LOCK)
+    if not _lockfile_matches(package_data, lock):
+        _run_npm(["install", "--package-lock-only"])
+        return
+    lock["version"] = version
+    root = lock.get("packages", {}).get("")
+    if root is not None:
+        root["version"] = version
+    PACKAGE_LOCK.write_text(json.dumps(lock, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def _artifacts_cached(version: str, flavours: Sequence[Tuple[Optional[str], Optional[Path]]], optimize: bool) -> bool:
+    try:
+        layouts = [_package_layout(manifest_path) for _, manifest_path in flavours]
+    except BuildError:
+        return False
+    paths = sorted({path for layout in layouts for _, path in layout})
+    infos = _source_infos(paths, [_load_build_manifest(suffix) for suffix, _ in flavours])
+    digests = {path: info.digest for path, info in infos.items()}
+    return all(
+        (ARTIFACT_CACHE_DIR / f"{_layout_key(layout, digests, optimize=optimize)}.zip").exists() for layout in layouts
+    )
+
+
+def _test_build_steps(version: str, args: argparse.Namespace, budget: Optional[SizeBudget]) -> List[Step]:
+    flavours = [(TEST_PACKAGE_SUFFIX, None), (f"{TEST_PACKAGE_SUFFIX}-firefox", FIREFOX_MANIFEST)]
+    with TRACE.span("plan"):
+        cached = not args.full_rebuild and _artifacts_cached(version, flavours, args.optimize)
+
+    def package() -> None:
+        artifacts = _build_release_artifacts(
+            version, test_build=True, optimize=args.optimize, budget=budget, incremental=not args.full_rebuild
+        )
+        rel_paths = ", ".join(str(path.relative_to(REPO_ROOT)) for path in artifacts)
+        print(f"✅ Test builds ready: {rel_paths}")
+
+    return [Step("package", package, detail="copy cached zips" if cached else "build Chrome and Firefox zips")]
+
+
+def _release_steps(
+    new_version: str,
+    args: argparse.Namespace,
+    budget: Optional[SizeBudget],
+    state: _ReleaseState,
+) -> List[Step]:
+    manifests = [path for path in (DEFAULT_MANIFEST, FIREFOX_MANIFEST) if path.exists()]
+    stale_manifests = [path.name for path in manifests if _json_version(path) != new_version]
+    package_stale = PACKAGE_JSON.exists() and _json_version(PACKAGE_JSON) != new_version
+    lock_stale = False
+    lock_detail = "already at " + new_version
+    if PACKAGE_LOCK.exists() and PACKAGE_JSON.exists():
+        lock = _read_json(PACKAGE_LOCK)
+        lock_stale = any(version != new_version for version in _lockfile_versions(lock))
+        if lock_stale:
+            package_data = _read_json(PACKAGE_JSON)
+            lock_detail = "edit version fields" if _lockfile_matches(package_data, lock) else "npm install --package-lock-only"
+    changelog_text = render_changelog(new_version)
+    current_changelog = CHANGELOG_PATH.read_text(encoding="utf-8") if CHANGELOG_PATH.exists() else None
+    paths_to_commit = [*manifests, CHANGELOG_PATH]
+    paths_to_commit.extend(path for path in (PACKAGE_JSON, PACKAGE_LOCK) if path.exists())
+
+    def write_changelog() -> None:
+        CHANGELOG_PATH.write_text(changelog_text, encoding="utf-8")
+        print("Changelog regenerated with Features/Fixes/Chore/Other sections.")
+
+    def review() -> None:
+        print("Review and edit manifest.chrome.json, manifest.firefox.json, and CHANGELOG.md as needed.")
+        try:
+            input("Press Enter to package and commit, or Ctrl+C to cancel: ")
+        except KeyboardInterrupt as exc:  # pragma: no cover - user abort
+            raise BuildError("Release cancelled.") from exc
+
+    def package() -> None:
+        artifacts = _build_release_artifacts(
+            new_version, test_build=False, optimize=args.optimize, budget=budget, incremental=not args.full_rebuild
+        )
+        state.artifact_path = artifacts[0]
+
+    def commit() -> None:
+        _stage_and_commit(new_version, paths_to_commit)
+        state.commit_created = True
+
+    def tag() -> None:
+        _create_tag(new_version)
+        state.tag_created = True
+
+    def push() -> None:
+        _push_release()
+        state.push_completed = True
+
+    return [
+        Step("manifests", lambda: _bump_manifests(new_version), bool(stale_manifests),
+             ", ".join(stale_manifests) or f"already at {new_version}"),
+        Step("package.json", lambda: _bump_package_json(new_version), package_stale,
+             "set version" if package_stale else f"already at {new_version}"),
+        Step("package-lock", lambda: _bump_package_lock(new_version), lock_stale, lock_detail),
+        Step("changelog", write_changelog, changelog_text != current_changelog,
+             "regenerate CHANGELOG.md" if changelog_text != current_changelog else "unchanged"),
+        Step("review", review, not args.yes, "wait for Enter" if not args.yes else "--yes"),
+        Step("package", package, detail="build Chrome and Firefox zips"),
+        Step("commit", commit, detail=f"chore: release v{new_version}"),
+        Step("tag", tag, detail=new_version),
+        Step("push", push, not args.no_push, "push commit and tags" if not args.no_push else "--no-push"),
+    ]
+
+
+def _snapshot(paths: Sequence[Path]) -> Dict[Path, Optional[str]]:
+    return {path: path.read_text(encoding="utf-8") if path.exists() else None for path in paths}
+
+
+def _rollback(new_version: str, state: _ReleaseState, originals: Dict[Path, Optional[str]]) -> None:
+    if not state.commit_created:
+        for path, text in originals.items():
+            if text is None:
+                if path.exists():
+                    path.unlink()
+            else:
+                path.write_text(text, encoding="utf-8")
+        try:
+            _run_git(["reset", "HEAD", *(str(path.relative_to(REPO_ROOT)) for path in originals if path.exists())])
+        except BuildError:
+            pass
+    if state.tag_created and not state.push_completed:
+        try:
+            _run_git(["tag", "-d", new_version])
+        except BuildError:
+            pass
+    if state.artifact_path and state.artifact_path.exists():
+        state.artifact_path.unlink()
+
+
+def _run_release(current_version: str, new_version: str, args: argparse.Namespace, budget: Optional[SizeBudget]) -> int:
+    _validate_version(new_version)
+    state = _ReleaseState()
+    with TRACE.span("plan"):
+        steps = _release_steps(new_version, args, budget, state)
+    if args.dry_run:
+        dirty = bool(_run_git(["status", "--porcelain"]))
+        _print_plan(f"Release plan {current_version} -> {new_version}:", steps)
+        if dirty:
+            print("⚠️  Uncommitted changes detected; the release would stop before any step runs.")
+        return 0
+    _ensure_clean_worktree()
+    originals = _snapshot([DEFAULT_MANIFEST, FIREFOX_MANIFEST, CHANGELOG_PATH, PACKAGE_JSON, PACKAGE_LOCK])
+    try:
+        _run_steps(steps)
+    except BaseException as exc:  # noqa: BLE001 - ensure state rolls back
+        _rollback(new_version, state, originals)
+        if isinstance(exc, BuildError):
+            raise
+        if isinstance(exc, KeyboardInterrupt):
+            raise BuildError("Release cancelled.") from exc
+        raise BuildError(str(exc)) from exc
+    pushed = "created and pushed" if state.push_completed else "created, not pushed"
+    print(f"✅ Release ready: {state.artifact_path.relative_to(REPO_ROOT)} (tag {new_version} {pushed})")
+    return 0
+
+
+def _parse_args(argv: Optional[Sequence[str]]) -> argparse.Namespace:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--optimize",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Minify JS/HTML/CSS/JSON, recompress PNGs losslessly and pick the best deflate level per file",
+    )
+    common.add_argument(
+        "--size-budget",
+        type=Path,
+        default=argparse.SUPPRESS,
+        help=f"JSON size budget to enforce (default with --optimize: {SIZE_BUDGET_PATH.name} if present)",
+    )
+    common.add_argument(
+        "--full-rebuild",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Re-read and recompress every file and rewrite the cached zips, reusing nothing from earlier builds",
+    )
+    common.add_argument(
+        "--trace",
+        type=Path,
+        default=argparse.SUPPRESS,
+        help="Write step timings as a Chrome trace-event JSON file (chrome://tracing, ui.perfetto.dev)",
+    )
+    common.add_argument(
+        "--profile",
+        nargs="?",
+        const="-",
+        default=argparse.SUPPRESS,
+        metavar="FILE",
+        help="Run the build under cProfile; print the top functions, or save stats to FILE",
+    )
+    common.add_argument(
+        "--dry-run",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="Print the steps that would run, and which are skipped because they are up to date",
+    )
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        parents=[common],
+        epilog="Without a command the script asks what to build.",
+    )
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    commands.add_parser("test", parents=[common], help="Build test zips without a version bump")
+    for name, help_text in (
+        ("release", "Bump the version, regenerate the changelog, package, commit, tag and push"),
+        ("plan", "Same as 'release --dry-run'"),
+    ):
+        release = commands.add_parser(name, parents=[common], help=help_text)
+        release.add_argument("--bump", choices=("major", "minor"), required=True, help="Version segment to bump")
+        release.add_argument("--yes", "-y", action="store_true", help="Do not wait for a review before packaging")
+        release.add_argument("--no-push", action="store_true", help="Commit and tag locally without pushing")
+    commands.add_parser("changelog", parents=[common], help="Regenerate CHANGELOG.md only")
+    args = parser.parse_args(argv)
+    args.optimize = getattr(args, "optimize", False)
+    args.dry_run = getattr(args, "dry_run", False) or args.command == "plan"
+    args.size_budget = getattr(args, "size_budget", None)
+    args.full_rebuild = getattr(args, "full_rebuild", False)
+    args.trace = getattr(args, "trace", None)
+    args.profile = getattr(args, "profile", None)
+    args.yes = getattr(args, "yes", False)
+    args.no_push = getattr(args, "no_push", False)
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = _parse_args(argv)
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if profiler is None:
+            return _run(args)
+        return profiler.runcall(_run, args)
+    finally:
+        summary = TRACE.summary()
+        if summary:
+            print(f"\n⏱️  Build timings\n{summary}")
+        if args.trace:
+            TRACE.write_chrome_trace(args.trace)
+            print(f"Trace written to {args.trace}")
+        if profiler is not None:
+            if args.profile == "-":
+                pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+            else:
+                profiler.dump_stats(args.profile)
+                print(f"Profile written to {args.profile}")
+
+
+def _run(args: argparse.Namespace) -> int:
     manifest_path = DEFAULT_MANIFEST
     try:
+        budget_path = args.size_budget or (SIZE_BUDGET_PATH if args.optimize and SIZE_BUDGET_PATH.exists() else None)
+        budget = _load_size_budget(budget_path) if budget_path else None
         manifest = _load_manifest(manifest_path)
         current_version = _confirm_manifest_version(manifest)
-        selection, previews = _prompt_choice(current_version)
+
+        if args.command == "changelog":
+            with TRACE.span("changelog"):
+                text = render_changelog(current_version)
+            unchanged = CHANGELOG_PATH.exists() and CHANGELOG_PATH.read_text(encoding="utf-8") == text
+            if args.dry_run:
+                detail = "unchanged" if unchanged else "regenerate CHANGELOG.md"
+                _print_plan("Changelog plan:", [Step("changelog", lambda: None, not unchanged, detail)])
+            elif unchanged:
+                print("Changelog already up to date.")
+            else:
+                CHANGELOG_PATH.write_text(text, encoding="utf-8")
+                print("Changelog regenerated with Features/Fixes/Chore/Other sections.")
+            return 0
+
+        if args.command in ("release", "plan"):
+            return _run_release(current_version, _bump_version(current_version, args.bump), args, budget)
+
+        if args.command == "test":
+            selection, previews = "test", {}
+        else:
+            selection, previews = _prompt_choice(current_version)
 
         if selection == "test":
-            artifacts = _build_release_artifacts(current_version, test_build=True)
-            rel_paths = ", ".join(str(path.relative_to(REPO_ROOT)) for path in artifacts)
-            print(f"✅ Test builds ready: {rel_paths}")
+            steps = _test_build_steps(current_version, args, budget)
+            if args.dry_run:
+                _print_plan(f"Test build plan for {current_version}:", steps)
+            else:
+                _run_steps(steps)
             return 0
 
-        _ensure_clean_worktree()
-        new_version = previews[selection]
-        _validate_version(new_version)
-        original_manifest_text = manifest_path.read_text(encoding="utf-8")
-        original_firefox_manifest_text = FIREFOX_MANIFEST.read_text(encoding="utf-8") if FIREFOX_MANIFEST.exists() else None
-        original_changelog_text = CHANGELOG_PATH.read_text(encoding="utf-8") if CHANGELOG_PATH.exists() else None
-        original_package_text = PACKAGE_JSON.read_text(encoding="utf-8") if PACKAGE_JSON.exists() else None
-        original_package_lock_text = PACKAGE_LOCK.read_text(encoding="utf-8") if PACKAGE_LOCK.exists() else None
-        manifest["version"] = new_version
-        _write_manifest(manifest_path, manifest)
-        if original_firefox_manifest_text is not None:
-            firefox_manifest = _load_manifest(FIREFOX_MANIFEST)
-            firefox_manifest["version"] = new_version
-            _write_manifest(FIREFOX_MANIFEST, firefox_manifest)
-        if PACKAGE_JSON.exists():
-            try:
-                package_data = json.loads(PACKAGE_JSON.read_text(encoding="utf-8"))
-            except json.JSONDecodeError as exc:
-                raise BuildError(f"Unable to parse {PACKAGE_JSON}: {exc}") from exc
-            package_data["version"] = new_version
-            _write_package_json(PACKAGE_JSON, package_data)
-        if PACKAGE_LOCK.exists() and PACKAGE_JSON.exists():
-            _run_npm(["install", "--package-lock-only"])
-        artifact_path: Optional[Path] = None
-        commit_created = False
-        tag_created = False
-        push_completed = False
-        try:
-            generate_changelog(manifest_path, CHANGELOG_PATH)
-            print("Changelog regenerated with Features/Fixes/Chore/Other sections.")
-            print("Review and edit manifest.chrome.json, manifest.firefox.json, and CHANGELOG.md as needed.")
-            try:
-                input("Press Enter to package and commit, or Ctrl+C to cancel: ")
-            except KeyboardInterrupt as exc:  # pragma: no cover - user abort
-                raise BuildError("Release cancelled.") from exc
-            artifacts = _build_release_artifacts(new_version, test_build=False)
-            artifact_path = artifacts[0]
-            paths_to_commit = [manifest_path, CHANGELOG_PATH]
-            if FIREFOX_MANIFEST.exists():
-                paths_to_commit.append(FIREFOX_MANIFEST)
-            if PACKAGE_JSON.exists():
-                paths_to_commit.append(PACKAGE_JSON)
-            if PACKAGE_LOCK.exists():
-                paths_to_commit.append(PACKAGE_LOCK)
-            _stage_and_commit(new_version, paths_to_commit)
-            commit_created = True
-            _create_tag(new_version)
-            tag_created = True
-            _push_release()
-            push_completed = True
-        except Exception as exc:  # noqa: BLE001 - ensure state rolls back
-            if not commit_created:
-                manifest_path.write_text(original_manifest_text, encoding="utf-8")
-                if original_firefox_manifest_text is None:
-                    if FIREFOX_MANIFEST.exists():
-                        FIREFOX_MANIFEST.unlink()
-                else:
-                    FIREFOX_MANIFEST.write_text(original_firefox_manifest_text, encoding="utf-8")
-                if original_changelog_text is None:
-                    if CHANGELOG_PATH.exists():
-                        CHANGELOG_PATH.unlink()
-                else:
-                    CHANGELOG_PATH.write_text(original_changelog_text, encoding="utf-8")
-                if original_package_text is None:
-                    if PACKAGE_JSON.exists():
-                        PACKAGE_JSON.unlink()
-                else:
-                    PACKAGE_JSON.write_text(original_package_text, encoding="utf-8")
-                if original_package_lock_text is None:
-                    if PACKAGE_LOCK.exists():
-                        PACKAGE_LOCK.unlink()
-                else:
-                    PACKAGE_LOCK.write_text(original_package_lock_text, encoding="utf-8")
-                try:
-                    reset_paths = [
-                        str(manifest_path.relative_to(REPO_ROOT)),
-                        str(CHANGELOG_PATH.relative_to(REPO_ROOT)),
-                    ]
-                    if FIREFOX_MANIFEST.exists():
-                        reset_paths.append(str(FIREFOX_MANIFEST.relative_to(REPO_ROOT)))
-                    if PACKAGE_JSON.exists():
-                        reset_paths.append(str(PACKAGE_JSON.relative_to(REPO_ROOT)))
-                    if PACKAGE_LOCK.exists():
-                        reset_paths.append(str(PACKAGE_LOCK.relative_to(REPO_ROOT)))
-                    _run_git(["reset", "HEAD", *reset_paths])
-                except BuildError:
-                    pass
-            if tag_created and not push_completed:
-                try:
-                    _run_git(["tag", "-d", new_version])
-                except BuildError:
-                    pass
-            if artifact_path and artifact_path.exists():
-                artifact_path.unlink()
-            if isinstance(exc, BuildError):
-                raise
-            raise BuildError(str(exc)) from exc
-        print(
-            f"✅ Release ready: {artifact_path.relative_to(REPO_ROOT)} "
-            f"(tag {new_version} created and pushed)"
-        )
-        return 0
+        return _run_release(current_version, previews[selection], args, budget)
     except BuildError as exc:
         sys.stderr.write(f"Error: {exc}\n")
         return 1
@@ -0,0 +1,121 @@
+#!/usr/bin/env node
+/*
+ * Node runner for extraction_bench.py: loads background.js (or the copy from a
+ * release build) in a sandbox with stubbed extension APIs and times
+ * fetchCodesFromWebsites on each benchmark case.
+ *
+ * Usage: node bench-runner.js MANIFEST.json
+ *
+ * The manifest lists the background script, the repeat counts and the cases
+ * ({page, stored, game, url}); results are written to stdout as JSON. Stages are
+ * split at the points where the extension hands control to the browser:
+ * extract runs from response.text() to storage.local.get (the regex match),
+ * dedup from storage.local.get to storage.local.set (the includes filters and
+ * codeStates initialisation).
+ */
+'use strict';
+
+const crypto = require('crypto');
+const fs = require('fs');
+const vm = require('vm');
+const { performance } = require('perf_hooks');
+
+// Stands in for every extension API the script touches while loading.
+function stub() {
+    return new Proxy(function () {}, {
+        get(target, property) {
+            if (property === 'then') {
+                return undefined;
+            }
+            if (!(property in target)) {
+                target[property] = stub();
+            }
+            return target[property];
+        },
+        apply() {
+            return stub();
+        }
+    });
+}
+
+function loadBackground(path) {
+    const state = { page: '', storage: null, marks: {} };
+    const browser = stub();
+    browser.storage = {
+        local: {
+            async get() {
+                state.marks.get = performance.now();
+                return state.storage();
+            },
+            async set() {
+                state.marks.set = performance.now();
+            }
+        }
+    };
+    const silent = { log() {}, info() {}, warn() {}, error() {}, debug() {} };
+    const context = vm.createContext({
+        browser,
+        console: silent,
+        async fetch() {
+            return {
+                async text() {
+                    state.marks.text = performance.now();
+                    return state.page;
+                }
+            };
+        }
+    });
+    vm.runInContext(fs.readFileSync(path, 'utf8'), context, { filename: path });
+    if (typeof context.fetchCodesFromWebsites !== 'function') {
+        throw new Error(`${path} does not define fetchCodesFromWebsites`);
+    }
+    return { state, fetchCodes: context.fetchCodesFromWebsites };
+}
+
+async function runCase(background, benchCase, repeat, warmup) {
+    const { state, fetchCodes } = background;
+    const stored = JSON.parse(fs.readFileSync(benchCase.stored, 'utf8'));
+    state.page = fs.readFileSync(benchCase.page, 'utf8');
+    // codeStates and gameNewCodes are modified in place, so every run gets fresh ones.
+    state.storage = () => ({
+        ShiftCodes: stored.codes,
+        gameNewCodes: { [benchCase.game]: stored.game_codes },
+        codeStates: {}
+    });
+    const samples = { extract: [], dedup: [], total: [] };
+    let result = null;
+    for (let run = 0; run < warmup + repeat; run++) {
+        state.marks = {};
+        const started = performance.now();
+        result = await fetchCodes([benchCase.url], benchCase.game);
+        const finished = performance.now();
+        if (!result.success) {
+            throw new Error(`fetchCodesFromWebsites failed: ${result.error}`);
+        }
+        if (run >= warmup) {
+            samples.extract.push((state.marks.get - state.marks.text) / 1000);
+            samples.dedup.push((state.marks.set - state.marks.get) / 1000);
+            samples.total.push((finished - started) / 1000);
+        }
+    }
+    return {
+        new_codes: result.newCodes.length,
+        digest: crypto.createHash('sha1').update(result.newCodes.join('\n')).digest('hex'),
+        samples
+    };
+}
+
+async function main() {
+    const manifest = JSON.parse(fs.readFileSync(process.argv[2], 'utf8'));
+    const background = loadBackground(manifest.background);
+    const results = [];
+    for (const benchCase of manifest.cases) {
+        results.push(await runCase(background, benchCase, manifest.repeat, manifest.warmup));
+    }
+    process.stdout.write(JSON.stringify({ version: process.version, results }));
+}
+
+main().catch(error => {
+    process.stderr.write(`${error.message || error}\n`);
+    process.exit(1);
+});
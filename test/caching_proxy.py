@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+Caching reverse proxy for code-source pages, so many extension profiles
+polling the same ``defaultUrls`` from shift-config.js cost one upstream fetch
+per TTL instead of one each.
+
+It runs on the test server's HTTP stack: :mod:`server_core` serves clients and
+the :mod:`http_client` pool fetches upstream. Responses are keyed on the source
+URL and kept for ``ttl`` seconds in an LRU in memory, backed by a size-bounded
+LRU on disk that survives restarts. Concurrent requests for a URL that has to
+be fetched share one upstream request. Stale entries are revalidated with a
+conditional GET, and are served stale while the upstream is unreachable.
+``/codes?url=...`` (or every response, with ``--codes-only``) returns just the
+codes on the page as compact JSON.
+
+Run with: python3 caching_proxy.py --upstream http://localhost:8000 --port 8080
+
+Clients ask for ``/fetch?url=SOURCE_URL`` or ``/codes?url=SOURCE_URL``, send
+absolute-form requests as to a forward proxy, or, with ``--upstream``, request
+any other path, which is fetched from the upstream base URL.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from dataclasses import asdict, dataclass, field, replace
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from code_extractor import CODE_PATTERN
+from content_encoding import ContentEncoder, encoded_etag
+from http_client import ConnectionPool, HTTPClientError
+from server_core import (
+    SERVER_MODES,
+    Request,
+    Response,
+    is_not_modified,
+    json_response,
+    make_etag,
+    make_server,
+    text_response,
+    validator_headers,
+)
+
+TTL = 60.0
+MEMORY_BYTES = 64 * 1024 * 1024
+DISK_BYTES = 512 * 1024 * 1024
+UPSTREAM_TIMEOUT = 30.0
+UPSTREAM_CONNECTIONS = 100
+# Routes that block on upstream fetches need threads even under asyncio.
+ASYNCIO_WORKERS = 64
+STATS_PATH = "/proxy-stats"
+
+
+@dataclass
+class CacheEntry:
+    """One upstream response; ``etag``/``last_modified`` are the upstream's validators, used to revalidate."""
+
+    url: str
+    status: int
+    content_type: str
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fetched_at: float
+    codes: Tuple[str, ...]
+    # Compressed bodies by content coding, filled on first use.
+    encoded: Dict[str, bytes] = field(default_factory=dict, compare=False)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    def meta(self) -> dict:
+        meta = asdict(self)
+        del meta["body"], meta["encoded"]
+        return meta
+
+
+def extract_codes(body: bytes) -> Tuple[str, ...]:
+    return tuple(dict.fromkeys(code.decode("ascii") for code in CODE_PATTERN.findall(body)))
+
+
+def normalize_url(url: str) -> str:
+    """Cache key for a source URL: lowercase scheme and host, no fragment."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.netloc:
+        raise ValueError(f"Not an http(s) URL: {url!r}")
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, ""))
+
+
+class DiskStore:
+    """Entries as ``<sha256 of url>.json`` plus ``.body`` files, evicted least recently used beyond ``max_bytes``."""
+
+    def __init__(self, directory: Path, max_bytes: int = DISK_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sizes: "OrderedDict[str, int]" = OrderedDict()
+        # Recency survives restarts through the metadata files' modification times.
+        for meta in sorted(directory.glob("*.json"), key=lambda path: path.stat().st_mtime):
+            body = meta.with_suffix(".body")
+            if body.exists():
+                self._sizes[meta.stem] = meta.stat().st_size + body.stat().st_size
+        self._bytes = sum(self._sizes.values())
+        self.evictions = 0
+
+    @staticmethod
+    def _name(url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        name = self._name(url)
+        with self._lock:
+            if name not in self._sizes:
+                return None
+            self._sizes.move_to_end(name)
+        meta_path = self.directory / f"{name}.json"
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            body = (self.directory / f"{name}.body").read_bytes()
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        meta["codes"] = tuple(meta["codes"])
+        return CacheEntry(body=body, **meta)
+
+    def put(self, entry: CacheEntry, body_changed: bool = True) -> None:
+        name = self._name(entry.url)
+        meta = json.dumps(entry.meta(), separators=(",", ":")).encode("utf-8")
+        if body_changed:
+            _write_atomic(self.directory / f"{name}.body", entry.body)
+        _write_atomic(self.directory / f"{name}.json", meta)
+        with self._lock:
+            self._bytes += len(meta) + entry.size - self._sizes.pop(name, 0)
+            self._sizes[name] = len(meta) + entry.size
+            while self._bytes > self.max_bytes and len(self._sizes) > 1:
+                evicted, size = self._sizes.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+                for suffix in (".json", ".body"):
+                    (self.directory / f"{evicted}{suffix}").unlink(missing_ok=True)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "directory": str(self.directory),
+                "entries": len(self._sizes),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    partial = path.with_name(path.name + ".tmp")
+    partial.write_bytes(data)
+    os.replace(partial, path)
+
+
+class Upstream:
+    """Blocking front for a :class:`~http_client.ConnectionPool` running on its own event loop thread."""
+
+    def __init__(self, connections: int = UPSTREAM_CONNECTIONS, timeout: float = UPSTREAM_TIMEOUT) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="upstream", daemon=True)
+        self._thread.start()
+        self.pool = ConnectionPool(limit=connections, timeout=timeout)
+
+    def get(self, url: str, headers: Dict[str, str]):
+        return asyncio.run_coroutine_threadsafe(self.pool.request("GET", url, headers), self._loop).result()
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.pool.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class CachingProxy:
+    """The proxy app: pass :meth:`app` to ``make_server``.
+
+    ``X-Cache`` on each response says how it was served: ``HIT`` from cache,
+    ``MISS`` fetched, ``REVALIDATED`` after an upstream 304, ``COALESCED``
+    shared with a concurrent fetch, ``STALE`` because the upstream failed, or
+    ``BYPASS`` for a non-200 upstream response, which is never cached.
+    """
+
+    def __init__(
+        self,
+        upstream: Upstream,
+        *,
+        base_url: Optional[str] = None,
+        ttl: float = TTL,
+        memory_bytes: int = MEMORY_BYTES,
+        disk: Optional[DiskStore] = None,
+        codes_only: bool = False,
+        encoder: Optional[ContentEncoder] = None,
+    ) -> None:
+        self.upstream = upstream
+        self.base_url = base_url.rstrip("/") if base_url else None
+        self.ttl = ttl
+        self.memory_bytes = memory_bytes
+        self.disk = disk
+        self.codes_only = codes_only
+        self.encoder = encoder or ContentEncoder()
+        self._memory: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._memory_used = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats: Counter = Counter()
+
+    def app(self, request: Request) -> Response:
+        if request.path == STATS_PATH and not request.target.startswith(("http://", "https://")):
+            return json_response(self.snapshot())
+        if request.method not in ("GET", "HEAD"):
+            return text_response(405, "The proxy only serves GET and HEAD\n")
+        try:
+            url, codes_only = self.source_url(request)
+        except ValueError as exc:
+            return text_response(400, f"{exc}\n")
+        try:
+            entry, state = self.lookup(url)
+        except (HTTPClientError, OSError, asyncio.TimeoutError) as exc:
+            with self._lock:
+                self.stats["upstream_errors"] += 1
+            return text_response(502, f"Upstream fetch of {url} failed: {exc or type(exc).__name__}\n")
+        return self.respond(request, entry, state, codes_only)
+
+    def source_url(self, request: Request) -> Tuple[str, bool]:
+        """The normalised source URL a request asks for, and whether it wants the code list."""
+        if request.target.startswith(("http://", "https://")):
+            return normalize_url(request.target), self.codes_only
+        if request.path in ("/fetch", "/codes"):
+            url = request.query_value("url")
+            if not url:
+                raise ValueError(f"{request.path} needs a ?url= parameter")
+            return normalize_url(url), request.path == "/codes" or self.codes_only
+        if self.base_url is None:
+            raise ValueError("Use /fetch?url=... or /codes?url=... (no --upstream base URL is set)")
+        return normalize_url(self.base_url + request.target), self.codes_only
+
+    def lookup(self, url: str) -> Tuple[CacheEntry, str]:
+        """Return a fresh entry for ``url``, fetching it at most once however many threads ask at the same time."""
+        entry = self._cached(url)
+        if entry is not None and time.time() - entry.fetched_at < self.ttl:
+            with self._lock:
+                self.stats["hits"] += 1
+            return entry, "HIT"
+        with self._lock:
+            pending = self._inflight.get(url)
+            leader = pending is None
+            if leader:
+                pending = self._inflight[url] = Future()
+            else:
+                self.stats["coalesced"] += 1
+        if not leader:
+            return pending.result()[0], "COALESCED"
+        try:
+            result = self._fetch(url, entry)
+        except BaseException as exc:
+            pending.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[url]
+        pending.set_result(result)
+        return result
+
+    def _cached(self, url: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._memory.get(url)
+            if entry is not None:
+                self._memory.move_to_end(url)
+                return entry
+        if self.disk is None:
+            return None
+        entry = self.disk.get(url)
+        if entry is not None:
+            with self._lock:
+                self.stats["disk_reads"] += 1
+            self._remember(entry)
+        return entry
+
+    def _fetch(self, url: str, stale: Optional[CacheEntry]) -> Tuple[CacheEntry, str]:
+        headers = {"Accept-Encoding": "gzip, deflate"}
+        if stale is not None and stale.etag:
+            headers["If-None-Match"] = stale.etag
+        if stale is not None and stale.last_modified:
+            headers["If-Modified-Since"] = stale.last_modified
+        try:
+            response = self.upstream.get(url, headers)
+        except (HTTPClientError, OSError, asyncio.TimeoutError):
+            if stale is None:
+                raise
+            with self._lock:
+                self.stats["stale"] += 1
+            return stale, "STALE"
+        if response.status == 304 and stale is not None:
+            entry = replace(stale, fetched_at=time.time())
+            self._store(entry, body_changed=False)
+            with self._lock:
+                self.stats["revalidated"] += 1
+            return entry, "REVALIDATED"
+        body = response.content()
+        entry = CacheEntry(
+            url,
+            response.status,
+            response.header("content-type", "application/octet-stream"),
+            body,
+            response.header("etag"),
+            response.header("last-modified"),
+            time.time(),
+            extract_codes(body),
+        )
+        if response.status != 200 or "no-store" in response.header("cache-control", ""):
+            with self._lock:
+                self.stats["bypass"] += 1
+            return entry, "BYPASS"
+        self._store(entry)
+        with self._lock:
+            self.stats["misses"] += 1
+        return entry, "MISS"
+
+    def _store(self, entry: CacheEntry, body_changed: bool = True) -> None:
+        self._remember(entry)
+        if self.disk is not None:
+            try:
+                self.disk.put(entry, body_changed)
+            except OSError as exc:
+                sys.stderr.write(f"Unable to write {entry.url} to the disk cache: {exc}\n")
+
+    def _remember(self, entry: CacheEntry) -> None:
+        with self._lock:
+            previous = self._memory.pop(entry.url, None)
+            if previous is not None:
+                self._memory_used -= previous.size
+            if entry.size > self.memory_bytes:
+                return
+            self._memory[entry.url] = entry
+            self._memory_used += entry.size
+            while self._memory_used > self.memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted.size
+                self.stats["memory_evictions"] += 1
+
+    def respond(self, request: Request, entry: CacheEntry, state: str, codes_only: bool) -> Response:
+        age = max(0, int(time.time() - entry.fetched_at))
+        headers = [("X-Cache", state), ("Age", str(age)), ("Cache-Control", "no-cache")]
+        if codes_only:
+            body = json.dumps(
+                {"url": entry.url, "status": entry.status, "fetched_at": entry.fetched_at, "codes": entry.codes},
+                separators=(",", ":"),
+            ).encode("utf-8")
+            content_type, encoded = "application/json", None
+        else:
+            body, content_type, encoded = entry.body, entry.content_type, entry.encoded
+        etag = make_etag(body)
+        encoding = self.encoder.negotiate(request, content_type, len(body))
+        headers += [*validator_headers(encoded_etag(etag, encoding), entry.fetched_at), ("Vary", "Accept-Encoding")]
+        if entry.status == 200 and is_not_modified(request, encoded_etag(etag, encoding), entry.fetched_at):
+            return Response(304, headers)
+        headers.append(("Content-Type", content_type))
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+            body = (
+                self.encoder.encode_cached(encoded, body, encoding)
+                if encoded is not None
+                else self.encoder.encode(body, encoding)
+            )
+        return Response(entry.status, headers, body)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            snapshot = {
+                "ttl": self.ttl,
+                "memory": {"entries": len(self._memory), "bytes": self._memory_used, "max_bytes": self.memory_bytes},
+                "inflight": len(self._inflight),
+                "upstream_connections": self.upstream.pool.connections_opened,
+                **self.stats,
+            }
+        if self.disk is not None:
+            snapshot["disk"] = self.disk.snapshot()
+        snapshot["compression"] = self.encoder.snapshot()
+        return snapshot
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Cache code-source pages for many extension profiles.")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on (default 8080)")
+    parser.add_argument("--bind", default="", help="Address to bind to (default: all interfaces)")
+    parser.add_argument("--mode", choices=SERVER_MODES, default="threaded", help="Server mode (default threaded)")
+    parser.add_argument("--workers", type=int, default=None, help="Thread pool size for the server mode")
+    parser.add_argument("--upstream", help="Base URL that paths other than /fetch and /codes are fetched from")
+    parser.add_argument("--ttl", type=float, default=TTL, help=f"Seconds a response is served before revalidation "
+                        f"(default {TTL:g})")
+    parser.add_argument("--memory-mb", type=float, default=MEMORY_BYTES / 2 ** 20, help="In-memory cache size in MB")
+    parser.add_argument("--disk-dir", type=Path, help="Also keep responses on disk in this directory")
+    parser.add_argument("--disk-mb", type=float, default=DISK_BYTES / 2 ** 20, help="On-disk cache size in MB")
+    parser.add_argument("--timeout", type=float, default=UPSTREAM_TIMEOUT, help="Upstream request timeout in seconds")
+    parser.add_argument("--connections", type=int, default=UPSTREAM_CONNECTIONS, help="Upstream connection limit")
+    parser.add_argument("--codes-only", action="store_true", help="Answer every request with the page's codes as JSON")
+    parser.add_argument("--quiet", action="store_true", help="Do not log each request to stderr")
+    args = parser.parse_args(argv)
+    if args.upstream:
+        try:
+            args.upstream = normalize_url(args.upstream)
+        except ValueError as exc:
+            parser.error(str(exc))
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    workers = args.workers or (ASYNCIO_WORKERS if args.mode == "asyncio" else None)
+    upstream = Upstream(args.connections, args.timeout)
+    try:
+        disk = DiskStore(args.disk_dir, int(args.disk_mb * 2 ** 20)) if args.disk_dir else None
+        proxy = CachingProxy(
+            upstream,
+            base_url=args.upstream,
+            ttl=args.ttl,
+            memory_bytes=int(args.memory_mb * 2 ** 20),
+            disk=disk,
+            codes_only=args.codes_only,
+        )
+        with make_server(args.mode, (args.bind, args.port), proxy.app, workers, log_requests=not args.quiet) as httpd:
+            print(f"Caching proxy on http://localhost:{args.port} ({args.mode} mode), "
+                  f"upstream {args.upstream or 'per request'}, TTL {args.ttl:g}s")
+            httpd.serve_forever()
+    except KeyboardInterrupt:
+        return 130
+    except OSError as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    finally:
+        upstream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Offline SHiFT code extraction for archived source pages.
+
+Pages are scanned as bytes, chunk by chunk, with the extension's rule (the
+regex in background.js, word boundaries included), so a file of any size is
+never decoded or held in memory; files above ``MMAP_THRESHOLD`` are searched
+through ``mmap`` and ``.gz`` archives are decompressed as they stream.
+
+Codes are deduplicated against a :class:`CodeIndex` of known codes, which keeps
+each code as one integer: the 25 characters read as a base-36 number fit in
+130 bits, so an index saves to 17 bytes per code. Directories are scanned on a
+process pool; the CLI reports which codes are new and which were already known:
+
+    python3 code_extractor.py saves/ --known known.txt --workers 8 --output codes.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from shift_codes import CODE_LENGTH, RAW_LENGTH, SHIFT_CODE_PATTERN, format_code
+
+# Bytes patterns are ASCII-only, which is how JavaScript regexes without the u flag treat \b.
+CODE_PATTERN = re.compile(SHIFT_CODE_PATTERN.pattern.encode("ascii"))
+CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 16 * 1024 * 1024
+PACKED_BYTES = 17
+_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def pack_code(code: str) -> int:
+    """The code's 25 characters as one base-36 number."""
+    raw = code.replace("-", "")
+    if len(raw) != RAW_LENGTH:
+        raise ValueError(f"Not a SHiFT code: {code!r}")
+    return int(raw, 36)
+
+
+def unpack_code(value: int) -> str:
+    chars = []
+    for _ in range(RAW_LENGTH):
+        value, digit = divmod(value, 36)
+        chars.append(_DIGITS[digit])
+    return format_code("".join(reversed(chars)))
+
+
+def iter_codes(stream: BinaryIO, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """Yield every code in a binary stream in order, repeats included.
+
+    Matches near the end of a chunk wait for the next one, since the byte after
+    a code decides its word boundary; one byte before the resume point is kept
+    so the boundary before the next code is judged the same way.
+    """
+    buffer = b""
+    start = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        final = not chunk
+        buffer += chunk
+        resume = start
+        for match in CODE_PATTERN.finditer(buffer, start):
+            if match.end() >= len(buffer) and not final:
+                break
+            yield match.group().decode("ascii")
+            resume = match.end()
+        if final:
+            return
+        resume = max(resume, len(buffer) - CODE_LENGTH)
+        keep = max(resume - 1, 0)
+        buffer = buffer[keep:]
+        start = resume - keep
+
+
+def _open(path: Path) -> BinaryIO:
+    if str(path) == "-":
+        return sys.stdin.buffer
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+def iter_file_codes(path: Path, mmap_threshold: int = MMAP_THRESHOLD) -> Iterator[str]:
+    """Every code in a file (``-`` for stdin, ``.gz`` decompressed), searching large plain files in place."""
+    if str(path) != "-" and path.suffix != ".gz" and path.stat().st_size >= mmap_threshold:
+        with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for match in CODE_PATTERN.finditer(mapped):
+                yield match.group().decode("ascii")
+        return
+    stream = _open(path)
+    try:
+        yield from iter_codes(stream)
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+
+def extract_codes(path: Path) -> Tuple[List[str], int]:
+    """The file's unique codes in order of first appearance, and its size in bytes."""
+    codes = list(dict.fromkeys(iter_file_codes(path)))
+    return codes, 0 if str(path) == "-" else path.stat().st_size
+
+
+class CodeIndex:
+    """A set of codes kept as packed integers, saved as sorted 17-byte big-endian records."""
+
+    def __init__(self, codes: Iterable[str] = ()) -> None:
+        self._packed = {pack_code(code) for code in codes}
+
+    def __len__(self) -> int:
+        return len(self._packed)
+
+    def __contains__(self, code: str) -> bool:
+        return pack_code(code) in self._packed
+
+    def __iter__(self) -> Iterator[str]:
+        return (unpack_code(value) for value in sorted(self._packed))
+
+    def add(self, code: str) -> bool:
+        """Add a code; False if it was already indexed."""
+        value = pack_code(code)
+        if value in self._packed:
+            return False
+        self._packed.add(value)
+        return True
+
+    def to_bytes(self) -> bytes:
+        return b"".join(value.to_bytes(PACKED_BYTES, "big") for value in sorted(self._packed))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CodeIndex":
+        if len(data) % PACKED_BYTES:
+            raise ValueError(f"An index holds {PACKED_BYTES}-byte records, got {len(data)} bytes")
+        index = cls()
+        index._packed = {
+            int.from_bytes(data[offset:offset + PACKED_BYTES], "big") for offset in range(0, len(data), PACKED_BYTES)
+        }
+        return index
+
+    @classmethod
+    def load(cls, path: Path) -> "CodeIndex":
+        """Read a saved ``.idx`` index, or take every code found in any other file (text, JSON, a storage dump)."""
+        if path.suffix == ".idx":
+            return cls.from_bytes(path.read_bytes())
+        return cls(iter_file_codes(path))
+
+    def update(self, other: "CodeIndex") -> None:
+        self._packed |= other._packed
+
+    def save(self, path: Path) -> None:
+        path.write_bytes(self.to_bytes())
+
+
+def iter_inputs(paths: Sequence[Path], pattern: str = "*") -> Iterator[Path]:
+    """Files as given, and the files matching ``pattern`` below each directory, in sorted order."""
+    for path in paths:
+        if path.is_dir():
+            yield from sorted(item for item in path.rglob(pattern) if item.is_file())
+        else:
+            yield path
+
+
+def scan(paths: Sequence[Path], workers: Optional[int] = None) -> Iterator[Tuple[Path, List[str], int]]:
+    """Extract codes from every path, in order, spreading the files over a process pool."""
+    workers = workers or os.cpu_count() or 1
+    # Worker processes cannot read our stdin, so ``-`` is always scanned here.
+    if workers == 1 or len(paths) < 2 or any(str(path) == "-" for path in paths):
+        for path in paths:
+            yield (path, *extract_codes(path))
+        return
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, (codes, size) in zip(paths, executor.map(extract_codes, paths, chunksize=chunksize)):
+            yield path, codes, size
+
+
+def classify(scanned: Iterable[Tuple[Path, List[str], int]], known: CodeIndex) -> dict:
+    """Split codes into new and known, file by file; a new code counts as known in every later file."""
+    seen = CodeIndex()
+    files = []
+    new_codes: List[str] = []
+    known_codes: List[str] = []
+    total_bytes = total_codes = 0
+    for path, codes, size in scanned:
+        fresh = []
+        for code in codes:
+            if code in known:
+                if seen.add(code):
+                    known_codes.append(code)
+            elif seen.add(code):
+                fresh.append(code)
+        new_codes.extend(fresh)
+        total_bytes += size
+        total_codes += len(codes)
+        files.append({"path": str(path), "bytes": size, "codes": len(codes), "new": fresh})
+    return {
+        "files": files,
+        "new": new_codes,
+        "known": known_codes,
+        "summary": {
+            "files": len(files),
+            "bytes": total_bytes,
+            "codes": total_codes,
+            "unique": len(seen),
+            "new": len(new_codes),
+            "known": len(known_codes),
+        },
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Extract SHiFT codes from archived pages and split new from known.")
+    parser.add_argument("paths", nargs="+", type=Path, help="Files or directories to scan (- for stdin)")
+    parser.add_argument("--glob", default="*", help="Which files to scan inside directories (default: all)")
+    parser.add_argument(
+        "--known",
+        action="append",
+        type=Path,
+        default=[],
+        help="Codes already seen: a saved .idx index, or any file containing codes (repeatable)",
+    )
+    parser.add_argument("--save-index", type=Path, help="Save the known and new codes as an .idx index")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--output", "-o", default="-", help="Write the JSON report here (default: stdout)")
+    parser.add_argument("--summary", action="store_true", help="Leave the per-file entries out of the report")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    started = time.perf_counter()
+    try:
+        known = CodeIndex()
+        for path in args.known:
+            known.update(CodeIndex.load(path))
+        paths = list(iter_inputs(args.paths, args.glob))
+        report = classify(scan(paths, args.workers), known)
+        if args.save_index:
+            known.update(CodeIndex(report["new"]))
+            known.save(args.save_index)
+    except (OSError, ValueError, EOFError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    report["summary"]["seconds"] = round(time.perf_counter() - started, 3)
+    if args.summary:
+        del report["files"]
+    text = json.dumps(report, indent=2) + "\n"
+    if args.output == "-":
+        sys.stdout.write(text)
+    else:
+        Path(args.output).write_text(text, encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Size analysis and a compact encoding for the extension's stored codes.
+
+background.js keeps ``ShiftCodes`` (every code seen), ``gameNewCodes`` (codes
+per game) and ``codeStates``: one ``{state, timestamp, game, platform,
+retryCount}`` object per ``platform:game:code`` key, six per code, all read and
+written again on every fetch. This tool loads a dump of that storage, either a
+settings export from the popup or ``browser.storage.local.get(null)`` saved as
+JSON, and reports how the bytes split over games, platforms and states.
+
+It also converts dumps to a compact binary form and back. Game, platform and
+state names are interned, and codes are packed as in :mod:`code_extractor` and
+referred to by number. The states of one code in one game become a single cell
+with a bitset of the platforms it has entries for. The cell stores the state,
+retry count and timestamp most of its platforms share once, plus a second
+bitset and values for the platforms that differ. Entries that do not fit
+that shape are carried over verbatim, and every conversion is decoded again
+and compared with the input before it is written, so ``expand`` gives back the
+same JSON data:
+
+    python3 code_store.py analyze shift-code-manager-settings.json
+    python3 code_store.py compact shift-code-manager-settings.json codes.scs
+    python3 code_store.py expand codes.scs restored.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import zlib
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from code_extractor import PACKED_BYTES, pack_code, unpack_code
+from shift_codes import generate_shift_codes
+
+MAGIC = b"SHFTCS1\n"
+CODE_KEYS = ("ShiftCodes", "gameNewCodes", "codeStates")
+# CODE_STATES in popup.js and the platforms background.js initialises, in their order.
+STATES = ("new", "checking", "expired", "invalid", "redeemed", "validated", "error", "to_be_redeemed", "checked")
+PLATFORMS = ("steam", "xbox", "nintendo", "epic", "psn", "stadia")
+ENTRY_FIELDS = ("state", "timestamp", "game", "platform", "retryCount")
+
+
+def storage_json(value) -> bytes:
+    """``value`` as JSON.stringify writes it, which is what storage.local keeps."""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def load_dump(path: Path) -> Tuple[dict, Optional[dict]]:
+    """The storage in a dump, and the settings export wrapped around it (None for a plain storage dump)."""
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Unable to parse {path}: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ValueError(f"{path} does not hold a JSON object")
+    if isinstance(data.get("settings"), dict):
+        return data["settings"], {key: value for key, value in data.items() if key != "settings"}
+    return data, None
+
+
+def with_wrapper(storage: dict, wrapper: Optional[dict]) -> dict:
+    """The dump as it was loaded: a settings export again if it came from one."""
+    if wrapper is None:
+        return storage
+    dump = dict(wrapper)
+    dump["settings"] = storage
+    return dump
+
+
+def _split_key(key: str, value) -> Optional[Tuple[str, str, str]]:
+    """(platform, game, code) for an entry in the shape the extension writes, or None for anything else."""
+    parts = key.split(":")
+    if len(parts) != 3 or not isinstance(value, dict) or set(value) != set(ENTRY_FIELDS):
+        return None
+    platform, game, code = parts
+    if value["game"] != game or value["platform"] != platform or not isinstance(value["state"], str):
+        return None
+    for field_name in ("timestamp", "retryCount"):
+        number = value[field_name]
+        if isinstance(number, bool) or not isinstance(number, int) or number < 0:
+            return None
+    try:
+        if unpack_code(pack_code(code)) != code:
+            return None
+    except ValueError:
+        return None
+    return platform, game, code
+
+
+def analyze(storage: dict) -> dict:
+    """Entry counts and JSON bytes of the stored codes by game, platform and state."""
+    by_game: Dict[str, Counter] = {}
+    by_platform: Dict[str, Counter] = {}
+    by_state: Dict[str, Counter] = {}
+    code_states = storage.get("codeStates") or {}
+    cells: Dict[Tuple[str, str], set] = {}
+    irregular = 0
+    for key, value in code_states.items():
+        size = len(storage_json(key)) + len(storage_json(value)) + 2
+        parsed = _split_key(key, value)
+        if parsed is None:
+            irregular += 1
+            platform, game, state = "(other)", "(other)", "(other)"
+        else:
+            platform, game, code = parsed
+            state = value["state"]
+            cells.setdefault((game, code), set()).add((state, value["retryCount"], value["timestamp"]))
+        for table, name in ((by_game, game), (by_platform, platform), (by_state, state)):
+            table.setdefault(name, Counter()).update(entries=1, bytes=size)
+    for game, codes in (storage.get("gameNewCodes") or {}).items():
+        by_game.setdefault(game, Counter()).update(new_codes=len(codes), new_codes_bytes=len(storage_json(codes)))
+    sizes = {key: len(storage_json(storage[key])) for key in CODE_KEYS if key in storage}
+    sizes["other"] = len(storage_json({key: value for key, value in storage.items() if key not in CODE_KEYS}))
+    sizes["total"] = len(storage_json(storage))
+    code_bytes = sum(size for key, size in sizes.items() if key in CODE_KEYS)
+    return {
+        "codes": len(storage.get("ShiftCodes") or ()),
+        "entries": len(code_states),
+        "irregular_entries": irregular,
+        "cells": len(cells),
+        "uniform_cells": sum(1 for states in cells.values() if len(states) == 1),
+        "bytes": sizes,
+        # fetchCodesFromWebsites reads and writes all three keys on every fetch.
+        "bytes_per_fetch": 2 * code_bytes,
+        "by_game": {name: dict(counts) for name, counts in sorted(by_game.items())},
+        "by_platform": {name: dict(counts) for name, counts in sorted(by_platform.items())},
+        "by_state": {name: dict(counts) for name, counts in sorted(by_state.items())},
+    }
+
+
+def _write_varint(out: bytearray, value: int) -> None:
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_signed(out: bytearray, value: int) -> None:
+    _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+
+class _Reader:
+    def __init__(self, data: bytes, position: int = 0) -> None:
+        self.data = data
+        self.position = position
+
+    def varint(self) -> int:
+        value = shift = 0
+        while True:
+            if self.position >= len(self.data):
+                raise ValueError("Compact store is truncated")
+            byte = self.data[self.position]
+            self.position += 1
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def signed(self) -> int:
+        value = self.varint()
+        return -(value >> 1) - 1 if value & 1 else value >> 1
+
+    def take(self, size: int) -> bytes:
+        if self.position + size > len(self.data):
+            raise ValueError("Compact store is truncated")
+        chunk = self.data[self.position:self.position + size]
+        self.position += size
+        return chunk
+
+
+def _interned(preferred: Iterable[str], seen: Iterable[str]) -> List[str]:
+    """Names in ``preferred`` order, then any others in the order they were first seen."""
+    seen = list(dict.fromkeys(seen))
+    known = [name for name in preferred if name in set(seen)]
+    return known + [name for name in seen if name not in set(known)]
+
+
+def _write_ids(out: bytearray, ids: List[int]) -> None:
+    _write_varint(out, len(ids))
+    previous = -1
+    for value in ids:
+        _write_signed(out, value - previous - 1)
+        previous = value
+
+
+def _read_ids(reader: _Reader) -> List[int]:
+    ids = []
+    previous = -1
+    for _ in range(reader.varint()):
+        previous += reader.signed() + 1
+        ids.append(previous)
+    return ids
+
+
+def encode(storage: dict, wrapper: Optional[dict] = None) -> bytes:
+    """The compact form of a storage dump; see the module docstring for what it keeps and how."""
+    shift_codes = storage.get("ShiftCodes")
+    game_new_codes = storage.get("gameNewCodes")
+    code_states = storage.get("codeStates")
+    # Lists that are not lists of codes are kept verbatim with everything else.
+    if not isinstance(shift_codes, list) or not all(isinstance(code, str) for code in shift_codes):
+        shift_codes = None
+    if not isinstance(game_new_codes, dict) or not all(
+        isinstance(codes, list) and all(isinstance(code, str) for code in codes) for codes in game_new_codes.values()
+    ):
+        game_new_codes = None
+    if not isinstance(code_states, dict):
+        code_states = None
+    code_ids: Dict[str, int] = {}
+    codes: List[str] = []
+    verbatim: List[str] = []
+
+    def code_id(code: str) -> int:
+        found = code_ids.get(code)
+        if found is None:
+            found = code_ids[code] = len(codes)
+            codes.append(code)
+        return found
+
+    def packable(code: str) -> bool:
+        try:
+            return unpack_code(pack_code(code)) == code
+        except ValueError:
+            return False
+
+    if shift_codes is not None and not all(packable(code) for code in shift_codes):
+        shift_codes = None
+    if game_new_codes is not None and not all(packable(code) for codes in game_new_codes.values() for code in codes):
+        game_new_codes = None
+    cells: Dict[Tuple[str, int], Dict[str, dict]] = {}
+    extras = {}
+    for key, value in (code_states or {}).items():
+        parsed = _split_key(key, value)
+        if parsed is None:
+            extras[key] = value
+            continue
+        platform, game, code = parsed
+        cells.setdefault((game, code_id(code)), {})[platform] = value
+    for code in shift_codes or ():
+        code_id(code)
+    for codes_of_game in (game_new_codes or {}).values():
+        for code in codes_of_game:
+            code_id(code)
+    games = _interned((), [*(game_new_codes or {}), *(game for game, _ in cells)])
+    platforms = _interned(PLATFORMS, (platform for entries in cells.values() for platform in entries))
+    states = _interned(STATES, (value["state"] for entries in cells.values() for value in entries.values()))
+    game_index = {game: index for index, game in enumerate(games)}
+    platform_index = {platform: index for index, platform in enumerate(platforms)}
+    state_index = {state: index for index, state in enumerate(states)}
+    for name, kept in (("ShiftCodes", shift_codes), ("gameNewCodes", game_new_codes), ("codeStates", code_states)):
+        if name in storage and kept is None:
+            verbatim.append(name)
+    header = {
+        "games": games,
+        "platforms": platforms,
+        "states": states,
+        "present": [name for name in CODE_KEYS if name in storage and name not in verbatim],
+        "keys": list(storage),
+        "other": {key: value for key, value in storage.items() if key not in CODE_KEYS or key in verbatim},
+        "extras": extras,
+        "wrapper": wrapper,
+    }
+    out = bytearray(MAGIC)
+    header_bytes = storage_json(header)
+    _write_varint(out, len(header_bytes))
+    out += header_bytes
+    _write_varint(out, len(codes))
+    for code in codes:
+        out += pack_code(code).to_bytes(PACKED_BYTES, "big")
+    _write_ids(out, [code_ids[code] for code in shift_codes or ()])
+    _write_varint(out, len(game_new_codes or {}))
+    for game, codes_of_game in (game_new_codes or {}).items():
+        _write_varint(out, game_index[game])
+        _write_ids(out, [code_ids[code] for code in codes_of_game])
+    _write_varint(out, len(cells))
+    previous_code = previous_time = 0
+    for (game, code), entries in cells.items():
+        values = {
+            platform_index[platform]: (state_index[value["state"]], value["retryCount"], value["timestamp"])
+            for platform, value in entries.items()
+        }
+        shared = Counter(values.values()).most_common(1)[0][0]
+        exceptions = {index: value for index, value in sorted(values.items()) if value != shared}
+        _write_varint(out, game_index[game])
+        _write_signed(out, code - previous_code)
+        _write_varint(out, sum(1 << index for index in values))
+        _write_varint(out, sum(1 << index for index in exceptions))
+        _write_varint(out, shared[0])
+        _write_varint(out, shared[1])
+        _write_signed(out, shared[2] - previous_time)
+        # Platforms that differ from the cell's shared value, with timestamps relative to it.
+        for state, retry_count, timestamp in exceptions.values():
+            _write_varint(out, state)
+            _write_varint(out, retry_count)
+            _write_signed(out, timestamp - shared[2])
+        previous_code, previous_time = code, shared[2]
+    return bytes(out)
+
+
+def decode(data: bytes) -> Tuple[dict, Optional[dict]]:
+    """The storage dump and settings-export wrapper that :func:`encode` was given."""
+    if not data.startswith(MAGIC):
+        raise ValueError("Not a compact code store")
+    reader = _Reader(data, len(MAGIC))
+    try:
+        header = json.loads(reader.take(reader.varint()).decode("utf-8"))
+    except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError(f"Damaged compact store header: {exc}") from exc
+    games, platforms, states = header["games"], header["platforms"], header["states"]
+    codes = [unpack_code(int.from_bytes(reader.take(PACKED_BYTES), "big")) for _ in range(reader.varint())]
+    shift_codes = [codes[index] for index in _read_ids(reader)]
+    game_new_codes = {}
+    for _ in range(reader.varint()):
+        game = games[reader.varint()]
+        game_new_codes[game] = [codes[index] for index in _read_ids(reader)]
+    code_states = {}
+    code = timestamp = 0
+    for _ in range(reader.varint()):
+        game = games[reader.varint()]
+        code += reader.signed()
+        mask, exceptions = reader.varint(), reader.varint()
+        shared = states[reader.varint()], reader.varint()
+        timestamp += reader.signed()
+        for index, platform in enumerate(platforms):
+            if not mask >> index & 1:
+                continue
+            state, retry_count, stamp = *shared, timestamp
+            if exceptions >> index & 1:
+                state, retry_count, stamp = states[reader.varint()], reader.varint(), timestamp + reader.signed()
+            code_states[f"{platform}:{game}:{codes[code]}"] = {
+                "state": state, "timestamp": stamp, "game": game, "platform": platform, "retryCount": retry_count
+            }
+    if reader.position != len(data):
+        raise ValueError("Compact store has trailing bytes")
+    code_states.update(header["extras"])
+    decoded = {"ShiftCodes": shift_codes, "gameNewCodes": game_new_codes, "codeStates": code_states}
+    storage = {}
+    for key in header["keys"]:
+        storage[key] = header["other"][key] if key in header["other"] else decoded[key]
+    return storage, header["wrapper"]
+
+
+def compact(storage: dict, wrapper: Optional[dict] = None) -> bytes:
+    """Encode a dump and make sure it decodes to the same data before handing it out."""
+    data = encode(storage, wrapper)
+    if decode(data) != (storage, wrapper):
+        raise ValueError("The compact form does not round-trip; keep the JSON dump")
+    return data
+
+
+def synthesize(
+    codes_per_game: int,
+    games: Iterable[str],
+    platforms: Iterable[str] = PLATFORMS,
+    used_platforms: int = 1,
+    seed: Optional[int] = None,
+) -> dict:
+    """A storage dump shaped like a long-used install: codes fetched over time, redeemed on a few platforms."""
+    rng = random.Random(seed)
+    games = list(games)
+    platforms = list(platforms)
+    used = platforms[:used_platforms]
+    outcomes = {"redeemed": 0.45, "validated": 0.1, "expired": 0.25, "invalid": 0.05, "error": 0.05, "new": 0.1}
+    storage = {"ShiftCodes": [], "gameNewCodes": {}, "codeStates": {}}
+    pool = generate_shift_codes(codes_per_game * len(games), None if seed is None else seed + 1)
+    now = 1_700_000_000_000
+    for game_number, game in enumerate(games):
+        codes = pool[game_number * codes_per_game:(game_number + 1) * codes_per_game]
+        # Some sources list codes for several games at once.
+        if game_number:
+            shared = storage["gameNewCodes"][games[0]]
+            codes[:len(codes) // 20] = shared[:len(codes) // 20]
+        storage["gameNewCodes"][game] = codes
+        fetched = now
+        for code in codes:
+            fetched += rng.randrange(0, 2 * 86_400_000) if rng.random() < 0.2 else rng.randrange(0, 5)
+            if code not in storage["ShiftCodes"]:
+                storage["ShiftCodes"].append(code)
+            for platform in platforms:
+                entry = {"state": "new", "timestamp": fetched, "game": game, "platform": platform, "retryCount": 0}
+                if platform in used:
+                    entry["state"] = rng.choices(list(outcomes), list(outcomes.values()))[0]
+                    if entry["state"] != "new":
+                        entry["timestamp"] = fetched + rng.randrange(60_000, 7 * 86_400_000)
+                    if entry["state"] == "error":
+                        entry["retryCount"] = rng.randrange(1, 4)
+                storage["codeStates"][f"{platform}:{game}:{code}"] = entry
+    return storage
+
+
+def _table(title: str, rows: Dict[str, dict], total: int, stream) -> None:
+    stream.write(f"\n{title:<28} {'entries':>9} {'bytes':>12} {'share':>7}\n")
+    for name, counts in rows.items():
+        size = counts.get("bytes", 0)
+        share = size / total if total else 0.0
+        stream.write(f"{name:<28} {counts.get('entries', 0):>9} {size:>12,} {share:>7.1%}\n")
+
+
+def print_report(report: dict, stream=sys.stdout) -> None:
+    sizes = report["bytes"]
+    stream.write(
+        f"{report['codes']} codes, {report['entries']} codeStates entries "
+        f"({report['irregular_entries']} irregular), {report['cells']} code/game cells "
+        f"({report['uniform_cells']} with one state on every platform)\n"
+    )
+    stream.write("".join(f"{key:<14} {size:>12,} bytes\n" for key, size in sizes.items()))
+    stream.write(f"{'per fetch':<14} {report['bytes_per_fetch']:>12,} bytes read and written\n")
+    states_total = sizes.get("codeStates", 0)
+    _table("codeStates by game", report["by_game"], states_total, stream)
+    _table("codeStates by platform", report["by_platform"], states_total, stream)
+    _table("codeStates by state", report["by_state"], states_total, stream)
+    compact_sizes = report.get("compact")
+    if compact_sizes:
+        stream.write(
+            f"\nJSON {compact_sizes['json']:,} bytes ({compact_sizes['json_deflated']:,} deflated), "
+            f"compact {compact_sizes['compact']:,} bytes ({compact_sizes['compact_deflated']:,} deflated): "
+            f"{compact_sizes['ratio']:.1f}x smaller\n"
+        )
+
+
+def _compact_sizes(storage: dict, data: bytes) -> dict:
+    raw = storage_json(storage)
+    return {
+        "json": len(raw),
+        "json_deflated": len(zlib.compress(raw, 9)),
+        "compact": len(data),
+        "compact_deflated": len(zlib.compress(data, 9)),
+        "ratio": len(raw) / len(data) if data else 0.0,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Analyse extension storage dumps and convert them to a compact form.")
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+    analyzer = commands.add_parser("analyze", help="Report the stored codes' size by game, platform and state")
+    analyzer.add_argument("dump", type=Path, help="Settings export or storage dump (JSON)")
+    analyzer.add_argument("--output", "-o", help="Also write the report as JSON to this file")
+    compactor = commands.add_parser("compact", help="Convert a dump to the compact form (verified before writing)")
+    compactor.add_argument("dump", type=Path)
+    compactor.add_argument("output", type=Path)
+    expander = commands.add_parser("expand", help="Convert a compact store back to the JSON dump")
+    expander.add_argument("store", type=Path)
+    expander.add_argument("output", help="JSON file to write (- for stdout)")
+    commands.add_parser("verify", help="Check that a dump survives the round trip").add_argument("dump", type=Path)
+    generator = commands.add_parser("generate", help="Write a synthetic storage dump for trying the format out")
+    generator.add_argument("output", type=Path)
+    generator.add_argument("--codes", type=int, default=500, help="Codes per game (default 500)")
+    generator.add_argument("--games", type=int, default=6, help="Number of games (default 6)")
+    generator.add_argument("--used-platforms", type=int, default=1, help="Platforms codes get redeemed on")
+    generator.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        if args.command == "generate":
+            games = [f"game{number + 1}" for number in range(args.games)]
+            storage = synthesize(args.codes, games, used_platforms=args.used_platforms, seed=args.seed)
+            args.output.write_text(json.dumps(storage, indent=2) + "\n", encoding="utf-8")
+            print(f"Wrote {len(storage['codeStates'])} codeStates entries to {args.output}")
+        elif args.command == "expand":
+            storage, wrapper = decode(args.store.read_bytes())
+            text = json.dumps(with_wrapper(storage, wrapper), indent=2, ensure_ascii=False) + "\n"
+            if args.output == "-":
+                sys.stdout.write(text)
+            else:
+                Path(args.output).write_text(text, encoding="utf-8")
+        else:
+            storage, wrapper = load_dump(args.dump)
+            data = compact(storage, wrapper)
+            sizes = _compact_sizes(storage, data)
+            if args.command == "analyze":
+                report = {**analyze(storage), "compact": sizes}
+                print_report(report)
+                if args.output:
+                    Path(args.output).write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+            elif args.command == "compact":
+                args.output.write_bytes(data)
+                print(f"Wrote {args.output}: {sizes['compact']:,} bytes from {sizes['json']:,} ({sizes['ratio']:.1f}x)")
+            else:
+                print(f"Round trip OK: {sizes['json']:,} JSON bytes <-> {sizes['compact']:,} compact bytes")
+    except (OSError, ValueError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
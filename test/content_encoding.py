@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+``Accept-Encoding`` negotiation and response compression for the test server.
+
+gzip is always offered; brotli is preferred when the ``brotli`` module is
+installed. Encoded bodies get their own ETag (``"<etag>-gzip"``) so caches never
+mix representations, and :class:`ContentEncoder` keeps per-encoding byte and CPU
+counters so the bandwidth saved can be weighed against the time spent.
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from server_core import Request
+
+try:  # Optional: brotli is not a dependency.
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+MIN_SIZE = 256
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+# Tie-break order when the client weighs encodings equally.
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def parse_accept_encoding(header: Optional[str]) -> Dict[str, float]:
+    """Map each coding in an ``Accept-Encoding`` header to its q-value."""
+    weights: Dict[str, float] = {}
+    for item in (header or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    return weights
+
+
+def is_compressible(content_type: Optional[str]) -> bool:
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def encoded_etag(etag: str, encoding: Optional[str]) -> str:
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+class ContentEncoder:
+    """Picks an encoding per request and compresses bodies, counting bytes and CPU time per encoding.
+
+    ``gzip_level`` 0 turns gzip off and ``brotli_quality`` -1 turns brotli off;
+    with both off every response is sent as is. ``bytes_in``/``bytes_out`` count
+    what responses would have sent and did send; ``compressed`` and ``cpu_ms``
+    count the compression work, which cached variants avoid. ``cpu_ms`` is the
+    CPU time of the thread that compressed, so other requests do not add to it.
+    """
+
+    def __init__(self, gzip_level: int = GZIP_LEVEL, brotli_quality: int = BROTLI_QUALITY, min_size: int = MIN_SIZE):
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.min_size = min_size
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Counter] = {}
+
+    @property
+    def encodings(self) -> List[str]:
+        enabled = {"gzip": self.gzip_level > 0, "br": self.brotli_quality >= 0}
+        return [encoding for encoding in ENCODINGS if enabled[encoding]]
+
+    def negotiate(self, request: Request, content_type: Optional[str], size: Optional[int] = None) -> Optional[str]:
+        """Return the encoding to send, or None for the identity encoding.
+
+        ``size`` is None for streamed bodies, which are always worth compressing.
+        """
+        if not is_compressible(content_type) or (size is not None and size < self.min_size):
+            return None
+        weights = parse_accept_encoding(request.headers.get("Accept-Encoding"))
+        best, best_weight = None, 0.0
+        for encoding in self.encodings:
+            weight = weights.get(encoding, weights.get("*", 0.0))
+            if weight > best_weight:
+                best, best_weight = encoding, weight
+        return best
+
+    def encode(self, data: bytes, encoding: str) -> bytes:
+        started = time.thread_time()
+        if encoding == "br":
+            encoded = brotli.compress(data, quality=self.brotli_quality)
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            encoded = compressor.compress(data) + compressor.flush()
+        self._record(encoding, compressed=len(data), cpu_seconds=time.thread_time() - started)
+        return encoded
+
+    def encode_cached(self, variants: Dict[str, bytes], data: bytes, encoding: str) -> bytes:
+        """Return ``data`` encoded for one response, reusing and filling the ``variants`` cache kept with it."""
+        encoded = variants.get(encoding)
+        if encoded is None:
+            encoded = variants[encoding] = self.encode(data, encoding)
+        else:
+            self._record(encoding, cached=1)
+        self._record(encoding, responses=1, bytes_in=len(data), bytes_out=len(encoded))
+        return encoded
+
+    def encode_stream(self, chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+        """Compress a streamed body chunk by chunk, flushing after each so the client can decode as it reads."""
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compress, finish = compressor.compress, compressor.flush
+
+            def flush() -> bytes:
+                return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        self._record(encoding, responses=1)
+        try:
+            for chunk in chunks:
+                started = time.thread_time()
+                encoded = compress(chunk) + flush()
+                cpu_seconds = time.thread_time() - started
+                self._record(
+                    encoding, cpu_seconds, compressed=len(chunk), bytes_in=len(chunk), bytes_out=len(encoded)
+                )
+                if encoded:
+                    yield encoded
+            tail = finish()
+            self._record(encoding, bytes_out=len(tail))
+            yield tail
+        finally:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+
+    def _record(self, encoding: str, cpu_seconds: float = 0.0, **counts: int) -> None:
+        with self._lock:
+            stats = self.stats.setdefault(encoding, Counter())
+            stats.update(counts)
+            stats["cpu_ms"] += cpu_seconds * 1000
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            encodings = {}
+            for encoding, stats in self.stats.items():
+                saved = stats["bytes_in"] - stats["bytes_out"]
+                encodings[encoding] = {
+                    **stats,
+                    "cpu_ms": round(stats["cpu_ms"], 3),
+                    "bytes_saved": saved,
+                    "ratio": round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else None,
+                }
+            return {
+                "available": list(ENCODINGS),
+                "enabled": self.encodings,
+                "gzip_level": self.gzip_level,
+                "brotli_quality": self.brotli_quality,
+                "encodings": encodings,
+            }
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Benchmark SHiFT code extraction and dedup as the extension does it in
+fetchCodesFromWebsites (background.js).
+
+Each case is a stress page with ``--page-codes`` codes and a stored-code history
+of ``--history`` codes, a ``--known`` share of which already appear on the page.
+Runners time three stages per case: ``extract`` (regex over the page), ``dedup``
+(filtering against the stored and per-game lists and initialising codeStates)
+and ``total``. The ``node`` runner executes the real background.js, or the copy
+inside a release zip given with ``--background``; the ``python`` runner is a
+reference implementation of the same rules with hash-set dedup.
+
+Results, including log-log scaling slopes along both axes, go to ``--output``
+as JSON; with ``--baseline`` each stage is compared against an earlier run and
+the exit status is 1 if any got slower than ``--tolerance`` allows.
+
+Run with: python3 extraction_bench.py --page-codes 100,1000,10000 --history 0,1000,10000 --output bench.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from shift_codes import SHIFT_CODE_PATTERN, iter_shift_codes
+from stress_pages import StressPageSpec, iter_page_codes, iter_stress_page
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BACKGROUND_PATH = REPO_ROOT / "background.js"
+NODE_RUNNER_PATH = Path(__file__).resolve().with_name("bench-runner.js")
+PLATFORMS = ("steam", "xbox", "nintendo", "epic", "psn", "stadia")
+STAGES = ("extract", "dedup", "total")
+GAME = "bench"
+TOLERANCE = 0.25
+# Differences below this many seconds are timer noise, whatever the ratio.
+NOISE_FLOOR = 0.001
+
+
+@dataclass(frozen=True)
+class BenchCase:
+    """One page and stored history, written to ``page``/``stored`` so every runner reads the same bytes."""
+
+    page_codes: int
+    history: int
+    known: int
+    page: Path
+    stored: Path
+    page_bytes: int
+    expected_new: int
+    expected_digest: str
+
+
+def _digest(codes: Sequence[str]) -> str:
+    return hashlib.sha1("\n".join(codes).encode("ascii")).hexdigest()
+
+
+def build_cases(
+    directory: Path,
+    page_sizes: Sequence[int],
+    histories: Sequence[int],
+    *,
+    known: float = 0.5,
+    filler: int = 256,
+    near_miss: float = 0.5,
+    repeat: float = 0.1,
+    seed: int = 0,
+) -> List[BenchCase]:
+    """Write a page per size and a stored history per (size, history) pair below ``directory``."""
+    cases = []
+    for page_codes in page_sizes:
+        spec = StressPageSpec(codes=page_codes, filler=filler, near_miss=near_miss, repeat=repeat, seed=seed)
+        page = directory / f"page-{page_codes}.html"
+        with open(page, "wb") as handle:
+            for chunk in iter_stress_page(spec):
+                handle.write(chunk)
+        on_page = list(iter_page_codes(spec))
+        for history in histories:
+            rng = random.Random(f"{seed}:{page_codes}:{history}")
+            listed = rng.sample(on_page, min(int(len(on_page) * known), history))
+            # Fresh codes come from another seed; a collision with the page is vanishingly unlikely.
+            stored_codes = listed + list(iter_shift_codes(history - len(listed), seed + 1))
+            rng.shuffle(stored_codes)
+            stored = directory / f"stored-{page_codes}-{history}.json"
+            # A single-game history: every stored code is also in the game's list.
+            stored.write_text(json.dumps({"codes": stored_codes, "game_codes": stored_codes}), encoding="ascii")
+            known_codes = set(listed)
+            expected = [code for code in on_page if code not in known_codes]
+            cases.append(BenchCase(
+                page_codes, history, len(listed), page, stored, page.stat().st_size, len(expected), _digest(expected)
+            ))
+    return cases
+
+
+def _summary(samples: List[float]) -> dict:
+    return {"best": min(samples), "median": statistics.median(samples), "samples": samples}
+
+
+class PythonRunner:
+    """Reference implementation: the extension's regex and filters, with hash sets instead of list scans."""
+
+    name = "python"
+
+    def describe(self) -> dict:
+        return {"implementation": platform.python_implementation(), "version": platform.python_version()}
+
+    @staticmethod
+    def extract_and_dedup(text: str, stored: List[str], game_codes: List[str], game: str = GAME) -> tuple:
+        started = time.perf_counter()
+        found = dict.fromkeys(SHIFT_CODE_PATTERN.findall(text))
+        extracted = time.perf_counter()
+        known = set(stored)
+        new_codes = [code for code in found if code not in known]
+        game_known = set(game_codes)
+        game_new = [code for code in new_codes if code not in game_known]
+        now = int(time.time() * 1000)
+        code_states = {
+            f"{platform_name}:{game}:{code}": {
+                "state": "new", "timestamp": now, "game": game, "platform": platform_name, "retryCount": 0,
+            }
+            for code in new_codes
+            for platform_name in PLATFORMS
+        }
+        finished = time.perf_counter()
+        return game_new, code_states, extracted - started, finished - extracted, finished - started
+
+    def run(self, cases: Sequence[BenchCase], repeat: int, warmup: int) -> List[dict]:
+        results = []
+        for case in cases:
+            text = case.page.read_text(encoding="utf-8")
+            stored = json.loads(case.stored.read_text(encoding="ascii"))
+            samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+            for run in range(warmup + repeat):
+                new_codes, _, *timings = self.extract_and_dedup(text, stored["codes"], stored["game_codes"])
+                if run >= warmup:
+                    for stage, seconds in zip(STAGES, timings):
+                        samples[stage].append(seconds)
+            results.append({"new_codes": len(new_codes), "digest": _digest(new_codes), "samples": samples})
+        return results
+
+
+class NodeRunner:
+    """Runs ``fetchCodesFromWebsites`` from a background.js (or a release zip's copy) under ``node``."""
+
+    name = "node"
+
+    def __init__(self, background: Path = BACKGROUND_PATH, node: str = "node") -> None:
+        self.background = background
+        self.node = node
+        self.version: Optional[str] = None
+
+    def describe(self) -> dict:
+        return {"background": str(self.background), "node": self.version}
+
+    def run(self, cases: Sequence[BenchCase], repeat: int, warmup: int) -> List[dict]:
+        if shutil.which(self.node) is None:
+            raise RuntimeError(f"The node runner needs '{self.node}' on the PATH")
+        with tempfile.TemporaryDirectory(prefix="bench-node-") as tmp:
+            script = self.background
+            if self.background.suffix == ".zip":
+                with zipfile.ZipFile(self.background) as archive:
+                    script = Path(tmp) / "background.js"
+                    script.write_bytes(archive.read("background.js"))
+            manifest = Path(tmp) / "manifest.json"
+            manifest.write_text(json.dumps({
+                "background": str(script),
+                "repeat": repeat,
+                "warmup": warmup,
+                "cases": [
+                    {"page": str(case.page), "stored": str(case.stored), "game": GAME, "url": f"bench://{case.page.name}"}
+                    for case in cases
+                ],
+            }), encoding="utf-8")
+            completed = subprocess.run(
+                [self.node, str(NODE_RUNNER_PATH), str(manifest)], capture_output=True, text=True, check=False
+            )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Node runner failed: {completed.stderr.strip()}")
+        output = json.loads(completed.stdout)
+        self.version = output["version"]
+        return output["results"]
+
+
+RUNNERS = {"python": PythonRunner, "node": NodeRunner}
+
+
+def _slope(points: List[List[float]]) -> Optional[float]:
+    """Least-squares slope of log(seconds) over log(size): about 1 is linear, about 2 quadratic."""
+    logs = [(math.log(size), math.log(seconds)) for size, seconds in points if size > 0 and seconds > 0]
+    if len(logs) < 2:
+        return None
+    mean_x = sum(x for x, _ in logs) / len(logs)
+    mean_y = sum(y for _, y in logs) / len(logs)
+    spread = sum((x - mean_x) ** 2 for x, _ in logs)
+    if not spread:
+        return None
+    return round(sum((x - mean_x) * (y - mean_y) for x, y in logs) / spread, 3)
+
+
+def scaling_curves(results: List[dict]) -> dict:
+    """Best times per stage along each axis, with the other axis held at each of its values."""
+    curves: dict = {}
+    for result in results:
+        runner = curves.setdefault(result["runner"], {"page_codes": {}, "history": {}})
+        for axis, fixed in (("page_codes", "history"), ("history", "page_codes")):
+            for stage in STAGES:
+                series = runner[axis].setdefault(f"{fixed}={result[fixed]}", {}).setdefault(stage, {"points": []})
+                series["points"].append([result[axis], result["stages"][stage]["best"]])
+    for runner in curves.values():
+        for axis in runner.values():
+            for stages in axis.values():
+                for series in stages.values():
+                    series["points"].sort()
+                    series["slope"] = _slope(series["points"])
+    return curves
+
+
+def run_benchmark(runners: Sequence, cases: Sequence[BenchCase], repeat: int, warmup: int) -> dict:
+    results = []
+    for runner in runners:
+        for case, outcome in zip(cases, runner.run(cases, repeat, warmup)):
+            if (outcome["new_codes"], outcome["digest"]) != (case.expected_new, case.expected_digest):
+                raise RuntimeError(
+                    f"{runner.name} found {outcome['new_codes']} new codes on page-{case.page_codes} with history "
+                    f"{case.history}, expected {case.expected_new} (or the same count in another order)"
+                )
+            stages = {stage: _summary(outcome["samples"][stage]) for stage in STAGES}
+            results.append({
+                "runner": runner.name,
+                "page_codes": case.page_codes,
+                "history": case.history,
+                "known": case.known,
+                "page_bytes": case.page_bytes,
+                "new_codes": case.expected_new,
+                "stages": stages,
+                "extract_mb_per_second": case.page_bytes / stages["extract"]["best"] / 1e6
+                if stages["extract"]["best"] else None,
+                "codes_per_second": case.page_codes / stages["total"]["best"] if stages["total"]["best"] else None,
+            })
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "platform": platform.platform(),
+        "runners": {runner.name: runner.describe() for runner in runners},
+        "repeat": repeat,
+        "warmup": warmup,
+        "results": results,
+        "curves": scaling_curves(results),
+    }
+
+
+def compare(report: dict, baseline: dict, tolerance: float = TOLERANCE, floor: float = NOISE_FLOOR) -> List[dict]:
+    """Best time per stage against the baseline run's, for every case both runs have."""
+    previous = {(item["runner"], item["page_codes"], item["history"]): item for item in baseline["results"]}
+    rows = []
+    for result in report["results"]:
+        before = previous.get((result["runner"], result["page_codes"], result["history"]))
+        if before is None:
+            continue
+        for stage in STAGES:
+            old, new = before["stages"][stage]["best"], result["stages"][stage]["best"]
+            rows.append({
+                "runner": result["runner"],
+                "page_codes": result["page_codes"],
+                "history": result["history"],
+                "stage": stage,
+                "baseline": old,
+                "current": new,
+                "ratio": new / old if old else None,
+                "regression": new > old * (1 + tolerance) and new - old > floor,
+            })
+    return rows
+
+
+def print_report(report: dict, comparison: Optional[List[dict]] = None) -> None:
+    print(f"{'runner':<8} {'page':>7} {'history':>8} {'new':>7} {'extract ms':>11} {'dedup ms':>10} "
+          f"{'total ms':>10} {'MB/s':>8}")
+    for result in report["results"]:
+        stages = result["stages"]
+        throughput = result["extract_mb_per_second"]
+        print(f"{result['runner']:<8} {result['page_codes']:>7} {result['history']:>8} {result['new_codes']:>7} "
+              f"{stages['extract']['best'] * 1000:>11.2f} {stages['dedup']['best'] * 1000:>10.2f} "
+              f"{stages['total']['best'] * 1000:>10.2f} {throughput or 0:>8.1f}")
+    for runner, axes in report["curves"].items():
+        for axis, series in axes.items():
+            slopes = "  ".join(
+                f"{fixed} {stages['total']['slope']}" for fixed, stages in series.items()
+                if stages["total"]["slope"] is not None
+            )
+            if slopes:
+                print(f"{runner} total time vs {axis}, log-log slope: {slopes}")
+    if comparison is None:
+        return
+    regressions = [row for row in comparison if row["regression"]]
+    print(f"Baseline: {len(comparison)} stage timings compared, {len(regressions)} regressions")
+    for row in regressions:
+        print(f"  {row['runner']} page {row['page_codes']} history {row['history']} {row['stage']}: "
+              f"{row['baseline'] * 1000:.2f} ms -> {row['current'] * 1000:.2f} ms ({row['ratio']:.2f}x)")
+
+
+def _sizes(value: str) -> List[int]:
+    try:
+        sizes = [int(item) for item in value.split(",") if item.strip()]
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(f"Expected comma-separated integers, got {value!r}") from exc
+    if not sizes or min(sizes) < 0:
+        raise argparse.ArgumentTypeError("Sizes must be non-negative integers")
+    return sorted(set(sizes))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the extension's code extraction and dedup.")
+    parser.add_argument("--runners", default="python,node", help=f"Comma-separated runners ({', '.join(RUNNERS)})")
+    parser.add_argument("--page-codes", type=_sizes, default=[100, 1000, 10000], help="Codes per page, e.g. 100,1000")
+    parser.add_argument("--history", type=_sizes, default=[0, 1000, 10000], help="Stored-code history sizes")
+    parser.add_argument("--known", type=float, default=0.5, help="Share of each page's codes already stored")
+    parser.add_argument("--filler", type=int, default=256, help="Filler bytes between codes")
+    parser.add_argument("--near-miss", type=float, default=0.5, help="Code-like strings per code that must not match")
+    parser.add_argument("--repeat-share", type=float, default=0.1, help="Share of codes listed twice on a page")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the pages and histories")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case (the best one counts)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per case before timing")
+    parser.add_argument(
+        "--background",
+        type=Path,
+        default=BACKGROUND_PATH,
+        help="background.js for the node runner, or a release zip to take it from",
+    )
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", type=Path, help="Compare against the JSON output of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed slowdown before it is a regression")
+    args = parser.parse_args(argv)
+    args.runners = [name.strip() for name in args.runners.split(",") if name.strip()]
+    unknown = set(args.runners) - set(RUNNERS)
+    if unknown or not args.runners:
+        parser.error(f"Unknown runners: {', '.join(sorted(unknown)) or '(none)'}")
+    if not 0 <= args.known <= 1:
+        parser.error("--known must be between 0 and 1")
+    if args.repeat < 1 or args.warmup < 0:
+        parser.error("--repeat must be at least 1 and --warmup cannot be negative")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    runners = [NodeRunner(args.background) if name == "node" else RUNNERS[name]() for name in args.runners]
+    try:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+        with tempfile.TemporaryDirectory(prefix="extraction-bench-") as tmp:
+            cases = build_cases(
+                Path(tmp),
+                args.page_codes,
+                args.history,
+                known=args.known,
+                filler=args.filler,
+                near_miss=args.near_miss,
+                repeat=args.repeat_share,
+                seed=args.seed,
+            )
+            report = run_benchmark(runners, cases, args.repeat, args.warmup)
+    except (OSError, ValueError, RuntimeError, zipfile.BadZipFile, KeyError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    report["cases"] = {
+        "known": args.known, "filler": args.filler, "near_miss": args.near_miss,
+        "repeat_share": args.repeat_share, "seed": args.seed,
+    }
+    comparison = compare(report, baseline, args.tolerance) if baseline else None
+    print_report(report, comparison)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 1 if comparison and any(row["regression"] for row in comparison) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+Fault injection for the test server: slow, throttled, trickled, refused, reset
+and hung responses, so the extension's sequential fetching can be measured
+against sources that misbehave.
+
+A :class:`FaultSpec` says what goes wrong and how often. Specs come from
+``rules`` in a JSON file (first path glob that matches wins), from a named
+``scenarios`` entry picked with ``?fault=NAME``, or ad hoc from ``fault_*``
+query parameters, e.g. ``?fault_latency=fixed:2&fault_status=503:0.5``.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import threading
+from collections import Counter
+from dataclasses import asdict, dataclass, field, fields
+from fnmatch import fnmatchcase
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from mock_shift import LatencyModel
+from server_core import FileBody, Request, Response, json_response, text_response
+
+QUERY_PREFIX = "fault_"
+HANG_SECONDS = 300.0
+# Bandwidth throttling writes about ten pieces per second, but never more than this per piece.
+MAX_PACE_BYTES = 16 * 1024
+REFUSAL_STATUSES = (429, 503)
+
+
+def _parse_status(value: str) -> Dict[str, float]:
+    """``503`` or ``503:0.25`` -> ``{"503": probability}``."""
+    status, _, probability = value.partition(":")
+    return {status: float(probability) if probability else 1.0}
+
+
+def _parse_trickle(value: str) -> Tuple[int, float]:
+    size, _, interval = value.partition(":")
+    return int(size), float(interval or 0.1)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_probability(value) -> bool:
+    return _is_number(value) and 0 <= value <= 1
+
+
+@dataclass
+class FaultSpec:
+    """What goes wrong for a matching request; probabilities are drawn independently per request.
+
+    ``latency`` delays the response (a :class:`~mock_shift.LatencyModel` spec),
+    ``bandwidth`` caps it at that many bytes per second, and ``trickle``
+    (``"BYTES:SECONDS"``) sends it as chunks of that size with a pause after
+    each. ``status`` maps 429/503 to the probability of answering with it
+    instead, with ``Retry-After: retry_after``. ``reset`` is the probability of
+    a TCP reset instead of a response, and ``hang`` that of keeping the
+    connection open without a word for ``hang_seconds``.
+    """
+
+    latency: Optional[str] = None
+    bandwidth: Optional[float] = None
+    trickle: Optional[str] = None
+    status: Dict[str, float] = field(default_factory=dict)
+    retry_after: Optional[int] = 30
+    reset: float = 0.0
+    hang: float = 0.0
+    hang_seconds: float = HANG_SECONDS
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FaultSpec":
+        if not isinstance(data, dict):
+            raise ValueError(f"Fault settings must be a JSON object, not {data!r}")
+        unknown = set(data) - {item.name for item in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown fault settings: {', '.join(sorted(unknown))}")
+        spec = cls(**data)
+        spec.validate()
+        return spec
+
+    @classmethod
+    def from_query(cls, request: Request) -> Optional["FaultSpec"]:
+        values = {
+            name[len(QUERY_PREFIX):]: values[-1]
+            for name, values in request.query.items()
+            if name.startswith(QUERY_PREFIX)
+        }
+        if not values:
+            return None
+        converters = {
+            "bandwidth": float,
+            "status": _parse_status,
+            "retry_after": int,
+            "reset": float,
+            "hang": float,
+            "hang_seconds": float,
+        }
+        try:
+            return cls.from_dict({name: converters.get(name, str)(value) for name, value in values.items()})
+        except TypeError as exc:
+            raise ValueError(str(exc)) from exc
+
+    def validate(self) -> None:
+        if self.latency is not None:
+            # A plain number of seconds becomes the equivalent fixed:S spec.
+            self.latency = LatencyModel(self.latency).spec
+        if self.bandwidth is not None and (not _is_number(self.bandwidth) or self.bandwidth <= 0):
+            raise ValueError("bandwidth must be a positive number of bytes per second")
+        if self.trickle is not None:
+            try:
+                size, interval = _parse_trickle(self.trickle)
+            except (AttributeError, ValueError):
+                size, interval = 0, 0.0
+            if size <= 0 or not interval >= 0:
+                raise ValueError(f"Invalid trickle {self.trickle!r} (expected a 'BYTES:SECONDS' string)")
+        if not isinstance(self.status, dict):
+            raise ValueError('status must map 429/503 to a probability, e.g. {"503": 0.25}')
+        self.status = {str(status): probability for status, probability in self.status.items()}
+        for status, probability in self.status.items():
+            if str(status) not in map(str, REFUSAL_STATUSES):
+                raise ValueError(f"Fault status must be one of {', '.join(map(str, REFUSAL_STATUSES))}")
+            if not _is_probability(probability):
+                raise ValueError("Fault probabilities must be numbers between 0 and 1")
+        if not _is_probability(self.reset) or not _is_probability(self.hang):
+            raise ValueError("Fault probabilities must be numbers between 0 and 1")
+        if self.retry_after is not None and (not isinstance(self.retry_after, int) or isinstance(self.retry_after, bool)
+                                             or self.retry_after < 0):
+            raise ValueError("retry_after must be a whole number of seconds")
+        if not _is_number(self.hang_seconds) or self.hang_seconds < 0:
+            raise ValueError("hang_seconds must be a non-negative number")
+
+
+@dataclass
+class FaultConfig:
+    """``rules`` is a list of ``{"path": GLOB, ...FaultSpec}``; ``scenarios`` maps names to FaultSpec fields."""
+
+    rules: List[dict] = field(default_factory=list)
+    scenarios: Dict[str, dict] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FaultConfig":
+        if not isinstance(data, dict):
+            raise ValueError("A fault config must be a JSON object")
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown fault config keys: {', '.join(sorted(unknown))}")
+        config = cls(**data)
+        config.compile()
+        return config
+
+    @classmethod
+    def load(cls, path: Path) -> "FaultConfig":
+        try:
+            return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Unable to parse {path}: {exc}") from exc
+
+    def compile(self) -> Tuple[List[Tuple[str, FaultSpec]], Dict[str, FaultSpec]]:
+        if not isinstance(self.rules, list) or not all(isinstance(rule, dict) for rule in self.rules):
+            raise ValueError("rules must be a list of JSON objects")
+        if not isinstance(self.scenarios, dict):
+            raise ValueError("scenarios must map names to fault settings")
+        if self.seed is not None and (not isinstance(self.seed, int) or isinstance(self.seed, bool)):
+            raise ValueError("seed must be an integer")
+        rules = []
+        for rule in self.rules:
+            settings = dict(rule)
+            pattern = settings.pop("path", None)
+            if not isinstance(pattern, str) or not pattern:
+                raise ValueError(f"Fault rule without a 'path' glob: {rule}")
+            rules.append((pattern, FaultSpec.from_dict(settings)))
+        scenarios = {name: FaultSpec.from_dict(settings) for name, settings in self.scenarios.items()}
+        return rules, scenarios
+
+
+class FaultInjector:
+    """Applies the matching :class:`FaultSpec` to each response and counts what it did per path."""
+
+    ADMIN_PATH = "/faults"
+
+    def __init__(self, config: Optional[FaultConfig] = None) -> None:
+        self._lock = threading.Lock()
+        self.configure(config or FaultConfig())
+
+    def configure(self, config: FaultConfig) -> None:
+        rules, scenarios = config.compile()
+        with self._lock:
+            self.config = config
+            self.rules = rules
+            self.scenarios = scenarios
+            self.rng = random.Random(config.seed)
+            self.stats: Dict[str, Counter] = {}
+
+    def spec_for(self, request: Request) -> Optional[FaultSpec]:
+        name = request.query_value("fault")
+        if name is not None:
+            if name not in self.scenarios:
+                raise ValueError(f"Unknown fault scenario '{name}'")
+            return self.scenarios[name]
+        spec = FaultSpec.from_query(request)
+        if spec is not None:
+            return spec
+        for pattern, rule in self.rules:
+            if fnmatchcase(request.path, pattern):
+                return rule
+        return None
+
+    def handle(self, request: Request) -> Optional[Response]:
+        """Answer the admin endpoint, or return None for other paths."""
+        if request.path != self.ADMIN_PATH:
+            return None
+        if request.method == "GET":
+            with self._lock:
+                return json_response({
+                    "config": asdict(self.config),
+                    "stats": {path: dict(counts) for path, counts in sorted(self.stats.items())},
+                })
+        if request.method != "POST":
+            return text_response(405, "Use GET for fault stats or POST a new fault config\n")
+        try:
+            payload = json.loads(request.body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object")
+            self.configure(FaultConfig.from_dict(payload))
+        except (ValueError, TypeError) as exc:
+            return text_response(400, f"{exc}\n")
+        return json_response({"ok": True})
+
+    def apply(self, request: Request, response: Response) -> Response:
+        if request.path == self.ADMIN_PATH:
+            return response
+        try:
+            spec = self.spec_for(request)
+        except ValueError as exc:
+            _discard(response)
+            return text_response(400, f"{exc}\n")
+        if spec is None:
+            return response
+        applied: List[str] = []
+        with self._lock:
+            draw = self.rng.random
+            if spec.latency:
+                response.delay += LatencyModel(spec.latency).sample(self.rng)
+                applied.append("latency")
+            refused = next((status for status, probability in spec.status.items() if draw() < probability), None)
+            reset = spec.reset > 0 and draw() < spec.reset
+            hang = spec.hang > 0 and draw() < spec.hang
+        if hang:
+            _discard(response)
+            response = Response(0, delay=response.delay + spec.hang_seconds, abort="close")
+            applied.append("hang")
+        elif reset:
+            _discard(response)
+            response = Response(0, delay=response.delay, abort="reset")
+            applied.append("reset")
+        elif refused is not None:
+            _discard(response)
+            headers = [("Content-Type", "text/plain; charset=utf-8")]
+            if spec.retry_after is not None:
+                headers.append(("Retry-After", str(spec.retry_after)))
+            body = f"{'Too many requests' if refused == '429' else 'Service unavailable'}\n".encode("utf-8")
+            response = Response(int(refused), headers, body, delay=response.delay)
+            applied.append(f"status_{refused}")
+        else:
+            if spec.trickle:
+                response.pace = _parse_trickle(spec.trickle)
+                if not response.streaming:
+                    # An iterator body makes the server use chunked encoding.
+                    response.body = iter(response.body) if isinstance(response.body, FileBody) else iter([response.body])
+                applied.append("trickle")
+            elif spec.bandwidth:
+                size = max(1, min(MAX_PACE_BYTES, int(spec.bandwidth / 10)))
+                response.pace = (size, size / spec.bandwidth)
+                applied.append("bandwidth")
+        if applied:
+            with self._lock:
+                counts = self.stats.setdefault(request.path, Counter())
+                counts.update(applied)
+        return response
+
+
+def _discard(response: Response) -> None:
+    close = getattr(response.body, "close", None)
+    if close is not None and not isinstance(response.body, (bytes, bytearray)):
+        close()
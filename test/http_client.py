@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Minimal asyncio HTTP/1.1 client with a keep-alive connection pool.
+
+Just enough HTTP for driving the local test tools at high concurrency without
+third-party packages: GET/HEAD/POST, Content-Length, chunked and
+close-delimited bodies, gzip/deflate (and brotli if installed) content
+codings, and http/https targets.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ssl
+import zlib
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:  # Optional: brotli is not a dependency.
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+USER_AGENT = "shift-test-client/1.0"
+
+_ConnectionKey = Tuple[str, str, int]
+
+
+class HTTPClientError(RuntimeError):
+    """Raised when a response cannot be read or the peer breaks the protocol."""
+
+
+@dataclass
+class ClientResponse:
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+    reused_connection: bool = False
+
+    def header(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.headers.get(name.lower(), default)
+
+    def content(self) -> bytes:
+        """The body with its ``Content-Encoding`` undone; ``body`` stays as it came off the wire."""
+        encoding = self.header("content-encoding", "identity").lower()
+        try:
+            if encoding in ("gzip", "x-gzip"):
+                return zlib.decompress(self.body, 16 + zlib.MAX_WBITS)
+            if encoding == "deflate":
+                return zlib.decompress(self.body)
+            if encoding == "br" and brotli is not None:
+                return brotli.decompress(self.body)
+        except (zlib.error, ValueError) as exc:
+            raise HTTPClientError(f"Cannot decode {encoding} body: {exc}") from exc
+        if encoding != "identity":
+            raise HTTPClientError(f"Unsupported content coding {encoding}")
+        return self.body
+
+    def text(self) -> str:
+        return self.content().decode("utf-8", "replace")
+
+
+class ConnectionPool:
+    """Keep-alive connections per (scheme, host, port), at most ``limit`` in use at once."""
+
+    def __init__(self, limit: int = 100, timeout: float = 30.0) -> None:
+        self.limit = limit
+        self.timeout = timeout
+        self._slots = asyncio.Semaphore(limit)
+        self._idle: Dict[_ConnectionKey, List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._ssl = ssl.create_default_context()
+        self.connections_opened = 0
+
+    async def close(self) -> None:
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Mapping[str, str]] = None,
+        body: bytes = b"",
+    ) -> ClientResponse:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise HTTPClientError(f"Unsupported URL scheme in {url}")
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname or "", port)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        lines = [f"{method} {target} HTTP/1.1", f"Host: {parts.netloc}", f"User-Agent: {USER_AGENT}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        if body or method == "POST":
+            lines.append(f"Content-Length: {len(body)}")
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+        async with self._slots:
+            return await asyncio.wait_for(self._exchange(key, method, payload), self.timeout)
+
+    async def _exchange(self, key: _ConnectionKey, method: str, payload: bytes) -> ClientResponse:
+        idle = self._idle.setdefault(key, [])
+        while idle:
+            reader, writer = idle.pop()
+            try:
+                # A pooled connection may have been closed by the server; fall through to the next one.
+                writer.write(payload)
+                response, keep = await _read_response(reader, method)
+            except (ConnectionError, asyncio.IncompleteReadError, HTTPClientError):
+                writer.close()
+                continue
+            except BaseException:
+                writer.close()
+                raise
+            response.reused_connection = True
+            self._release(key, reader, writer, keep)
+            return response
+        scheme, host, port = key
+        reader, writer = await asyncio.open_connection(
+            host, port, ssl=self._ssl if scheme == "https" else None, limit=2 ** 20
+        )
+        self.connections_opened += 1
+        try:
+            writer.write(payload)
+            response, keep = await _read_response(reader, method)
+        except BaseException:
+            writer.close()
+            raise
+        self._release(key, reader, writer, keep)
+        return response
+
+    def _release(self, key: _ConnectionKey, reader, writer, keep: bool) -> None:
+        if keep:
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            writer.close()
+
+
+async def _read_response(reader: asyncio.StreamReader, method: str) -> Tuple[ClientResponse, bool]:
+    head = await reader.readuntil(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    parts = status_line.split(" ", 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise HTTPClientError(f"Malformed status line: {status_line!r}")
+    version, status = parts[0], int(parts[1])
+    headers: Dict[str, str] = {}
+    for line in header_lines:
+        if ":" in line:
+            name, value = line.split(":", 1)
+            headers[name.strip().lower()] = value.strip()
+    connection = headers.get("connection", "").lower()
+    keep = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        body = b""
+    elif "chunked" in headers.get("transfer-encoding", "").lower():
+        chunks = []
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip optional trailers up to the final blank line.
+                while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)
+        body = b"".join(chunks)
+    elif "content-length" in headers:
+        body = await reader.readexactly(int(headers["content-length"]))
+    else:
+        body = await reader.read()
+        keep = False
+    return ClientResponse(status, headers, body), keep
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+Drive a code source the way many installed extensions would.
+
+Each simulated client runs one daily check like performDailyCodeCheck in
+background.js: for every game it fetches the game's URLs one after another,
+extracts codes with the extension's regex and deduplicates them. Clients arrive
+as a Poisson process at ``--rate`` per second and share one keep-alive
+connection pool.
+
+Run with: python3 load_generator.py --target http://localhost:8000 --clients 2000 --rate 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlsplit, urlunsplit
+
+from http_client import ConnectionPool, HTTPClientError
+from shift_codes import SHIFT_CODE_PATTERN
+from shift_config import SHIFT_CONFIG_PATH, load_games
+
+URL_MAPS = ("path", "root", "none")
+
+Plan = List[Tuple[str, List[str]]]
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def map_url(url: str, target: Optional[str], mode: str) -> str:
+    """Point a source URL at the local target: keep its path, use the root page, or leave it alone."""
+    if mode == "none" or not target:
+        return url
+    base = urlsplit(target)
+    original = urlsplit(url)
+    if mode == "root":
+        return urlunsplit((base.scheme, base.netloc, base.path or "/", base.query, ""))
+    return urlunsplit((base.scheme, base.netloc, original.path or "/", original.query, ""))
+
+
+def build_plan(args: argparse.Namespace) -> Plan:
+    if args.urls:
+        return [("custom", [map_url(url, args.target, args.url_map) for url in args.urls])]
+    games = load_games(args.config)
+    if args.games:
+        wanted = set(args.games.split(","))
+        games = [game for game in games if game.id in wanted]
+        missing = wanted - {game.id for game in games}
+        if missing:
+            raise ValueError(f"Unknown games: {', '.join(sorted(missing))}")
+    return [(game.id, [map_url(url, args.target, args.url_map) for url in game.default_urls]) for game in games]
+
+
+@dataclass
+class UrlStats:
+    fetches: int = 0
+    not_modified: int = 0
+    code_sets: Counter = field(default_factory=Counter)
+    min_codes: Optional[int] = None
+    max_codes: int = 0
+    mismatches: int = 0
+    missing: int = 0
+    unexpected: int = 0
+
+    def record(self, codes: Set[str], expected: Optional[Set[str]]) -> None:
+        self.code_sets[hash(frozenset(codes))] += 1
+        self.min_codes = len(codes) if self.min_codes is None else min(self.min_codes, len(codes))
+        self.max_codes = max(self.max_codes, len(codes))
+        if expected is not None and codes != expected:
+            self.mismatches += 1
+            self.missing += len(expected - codes)
+            self.unexpected += len(codes - expected)
+
+    def as_dict(self) -> dict:
+        return {
+            "fetches": self.fetches,
+            "not_modified": self.not_modified,
+            "distinct_code_sets": len(self.code_sets),
+            "min_codes": self.min_codes or 0,
+            "max_codes": self.max_codes,
+            "mismatched_fetches": self.mismatches,
+            "missing_codes": self.missing,
+            "unexpected_codes": self.unexpected,
+        }
+
+
+@dataclass
+class LoadStats:
+    request_latencies: List[float] = field(default_factory=list)
+    check_latencies: List[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+    bytes_received: int = 0
+    bytes_decoded: int = 0
+    codes_extracted: int = 0
+    codes_unique: int = 0
+    clients_started: int = 0
+    clients_dropped: int = 0
+    urls: Dict[str, UrlStats] = field(default_factory=dict)
+
+
+class LoadGenerator:
+    def __init__(self, plan: Plan, args: argparse.Namespace, expected: Dict[str, Set[str]]) -> None:
+        self.plan = plan
+        self.args = args
+        self.expected = expected
+        self.stats = LoadStats()
+        self.rng = random.Random(args.seed)
+        # With --conditional every client revalidates against the ETag and codes last seen for a URL.
+        self.validators: Dict[str, Tuple[str, Set[str]]] = {}
+
+    async def run(self) -> dict:
+        pool = ConnectionPool(limit=self.args.concurrency, timeout=self.args.timeout)
+        tasks: Set[asyncio.Task] = set()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.args.duration if self.args.duration else None
+        try:
+            while True:
+                if self.args.clients and self.stats.clients_started + self.stats.clients_dropped >= self.args.clients:
+                    break
+                if deadline is not None and loop.time() >= deadline:
+                    break
+                if len(tasks) >= self.args.max_inflight:
+                    # Open-loop arrivals: a saturated target shows up as dropped clients, not a slower schedule.
+                    self.stats.clients_dropped += 1
+                else:
+                    self.stats.clients_started += 1
+                    task = asyncio.create_task(self.daily_check(pool, self.stats.clients_started))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if self.args.rate > 0:
+                    await asyncio.sleep(self.rng.expovariate(self.args.rate))
+                else:
+                    await asyncio.sleep(0)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            await pool.close()
+        elapsed = loop.time() - started
+        return self.report(elapsed, pool.connections_opened)
+
+    async def daily_check(self, pool: ConnectionPool, client: int) -> None:
+        check_started = time.perf_counter()
+        validators = self.validators
+        for _game, urls in self.plan:
+            # fetchCodesFromWebsites deduplicates the codes of one game's sources.
+            unique_codes: Set[str] = set()
+            for url in urls:
+                headers = {"X-Client-Id": f"loadgen-{client}"}
+                if self.args.accept_encoding:
+                    headers["Accept-Encoding"] = self.args.accept_encoding
+                if self.args.conditional and url in validators:
+                    headers["If-None-Match"] = validators[url][0]
+                request_started = time.perf_counter()
+                try:
+                    response = await pool.request("GET", url, headers)
+                except Exception as exc:  # noqa: BLE001 - the extension logs the failure and moves on
+                    self.stats.errors[type(exc).__name__] += 1
+                    continue
+                self.stats.request_latencies.append(time.perf_counter() - request_started)
+                self.stats.statuses[response.status] += 1
+                self.stats.bytes_received += len(response.body)
+                url_stats = self.stats.urls.setdefault(url, UrlStats())
+                url_stats.fetches += 1
+                if response.status == 304 and url in validators:
+                    url_stats.not_modified += 1
+                    codes = validators[url][1]
+                elif response.status == 200:
+                    try:
+                        content = response.content()
+                    except HTTPClientError as exc:
+                        self.stats.errors[type(exc).__name__] += 1
+                        continue
+                    self.stats.bytes_decoded += len(content)
+                    codes = set(SHIFT_CODE_PATTERN.findall(content.decode("utf-8", "replace")))
+                    etag = response.header("etag")
+                    if etag:
+                        validators[url] = (etag, codes)
+                else:
+                    continue
+                url_stats.record(codes, self.expected.get(url))
+                self.stats.codes_extracted += len(codes)
+                unique_codes |= codes
+            self.stats.codes_unique += len(unique_codes)
+        self.stats.check_latencies.append(time.perf_counter() - check_started)
+
+    def report(self, elapsed: float, connections: int) -> dict:
+        stats = self.stats
+        requests = len(stats.request_latencies)
+        return {
+            "elapsed_seconds": elapsed,
+            "clients_started": stats.clients_started,
+            "clients_dropped": stats.clients_dropped,
+            "daily_checks": len(stats.check_latencies),
+            "requests": requests,
+            "requests_per_second": requests / elapsed if elapsed else 0.0,
+            "bytes_received": stats.bytes_received,
+            "bytes_decoded": stats.bytes_decoded,
+            "connections_opened": connections,
+            "statuses": {str(status): count for status, count in sorted(stats.statuses.items())},
+            "errors": dict(stats.errors),
+            "request_latency_seconds": percentiles(stats.request_latencies),
+            "daily_check_seconds": percentiles(stats.check_latencies),
+            "codes_extracted": stats.codes_extracted,
+            "codes_unique": stats.codes_unique,
+            "urls": {url: url_stats.as_dict() for url, url_stats in sorted(stats.urls.items())},
+        }
+
+
+async def load_expected(plan: Plan, expected_file: Optional[Path], timeout: float) -> Dict[str, Set[str]]:
+    """Expected codes per URL from ``--expected``, plus /stress pages' own /stress/codes listing."""
+    expected: Dict[str, Set[str]] = {}
+    if expected_file:
+        expected.update({url: set(codes) for url, codes in json.loads(expected_file.read_text(encoding="utf-8")).items()})
+    pool = ConnectionPool(limit=4, timeout=timeout)
+    try:
+        for _game, urls in plan:
+            for url in urls:
+                parts = urlsplit(url)
+                if url in expected or parts.path != "/stress":
+                    continue
+                listing = urlunsplit((parts.scheme, parts.netloc, "/stress/codes", parts.query, ""))
+                response = await pool.request("GET", listing)
+                if response.status == 200:
+                    expected[url] = set(json.loads(response.body)["codes"])
+    finally:
+        await pool.close()
+    return expected
+
+
+def print_report(report: dict) -> None:
+    latency = report["request_latency_seconds"]
+    checks = report["daily_check_seconds"]
+    print(f"Clients: {report['clients_started']} started, {report['clients_dropped']} dropped, "
+          f"{report['daily_checks']} daily checks in {report['elapsed_seconds']:.2f}s")
+    print(f"Requests: {report['requests']} ({report['requests_per_second']:.0f}/s), "
+          f"{report['bytes_received'] / 1e6:.1f} MB ({report['bytes_decoded'] / 1e6:.1f} MB decoded), "
+          f"{report['connections_opened']} connections")
+    print(f"Statuses: {report['statuses']}  Errors: {report['errors'] or 'none'}")
+    if latency["count"]:
+        print("Request latency ms: " + "  ".join(
+            f"{name} {latency[name] * 1000:.1f}" for name in ("p50", "p95", "p99", "max")))
+    if checks["count"]:
+        print("Daily check ms:     " + "  ".join(
+            f"{name} {checks[name] * 1000:.1f}" for name in ("p50", "p95", "p99", "max")))
+    if report["codes_extracted"]:
+        duplicates = 1 - report["codes_unique"] / report["codes_extracted"]
+        print(f"Codes: {report['codes_extracted']} extracted, {report['codes_unique']} left after each game's "
+              f"dedup ({duplicates:.0%} duplicates across a game's sources)")
+    print(f"{'URL':<60} {'fetches':>8} {'304':>6} {'codes':>11} {'sets':>5} {'bad':>5}")
+    for url, stats in report["urls"].items():
+        codes = f"{stats['min_codes']}-{stats['max_codes']}"
+        print(f"{url[-60:]:<60} {stats['fetches']:>8} {stats['not_modified']:>6} {codes:>11} "
+              f"{stats['distinct_code_sets']:>5} {stats['mismatched_fetches']:>5}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay the extension's daily-check fetch pattern against a code source.")
+    parser.add_argument("--target", default="http://localhost:8000", help="Base URL that source URLs are mapped onto")
+    parser.add_argument(
+        "--url-map",
+        choices=URL_MAPS,
+        default="path",
+        help="path: keep each source URL's path on the target; root: fetch the target's root page; "
+        "none: fetch the source URLs unchanged",
+    )
+    parser.add_argument("--urls", nargs="+", help="Fetch these URLs instead of the games from shift-config.js")
+    parser.add_argument("--games", help="Comma-separated game ids from shift-config.js (default: all)")
+    parser.add_argument("--config", type=Path, default=SHIFT_CONFIG_PATH, help="Path to shift-config.js")
+    parser.add_argument("--clients", type=int, default=1000, help="Number of simulated daily checks (0: until --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="Stop starting clients after this many seconds")
+    parser.add_argument("--rate", type=float, default=100.0, help="Client arrivals per second (0: as fast as possible)")
+    parser.add_argument("--concurrency", type=int, default=200, help="Connection pool size")
+    parser.add_argument("--max-inflight", type=int, default=10000, help="Drop arrivals beyond this many running clients")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument(
+        "--conditional",
+        action="store_true",
+        help="Revalidate with If-None-Match against the ETag any client last saw for the URL, like a caching scraper",
+    )
+    parser.add_argument(
+        "--accept-encoding",
+        metavar="CODINGS",
+        help="Send this Accept-Encoding header, e.g. 'gzip, deflate, br' as browsers do (default: none)",
+    )
+    parser.add_argument("--expected", type=Path, help="JSON file mapping URL to the list of codes it should yield")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the arrival schedule")
+    parser.add_argument("--json", type=Path, help="Also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+    if not args.clients and not args.duration:
+        parser.error("--clients 0 needs a --duration")
+    return args
+
+
+async def _main(args: argparse.Namespace) -> dict:
+    plan = build_plan(args)
+    expected = await load_expected(plan, args.expected, args.timeout)
+    return await LoadGenerator(plan, args, expected).run()
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        report = asyncio.run(_main(args))
+    except (OSError, ValueError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    print_report(report)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+Stateful stand-in for the SHiFT redemption endpoints, built from test/saves.
+
+The mock serves the same sequence the extension drives on the real site:
+
+    GET  /rewards                          rewards page with the code form
+    GET  /entitlement_offer_codes?code=C   check result fragment for #code_results
+    POST /code_redemptions                 redeem for a platform, then redirect
+    GET  /code_redemptions/<id>            redemption result page
+
+Each code has an outcome (``redeemable``, ``redeemed``, ``expired``, ``invalid``
+or ``link_required``) that changes as it is redeemed. Latency, per-client rate
+limiting and error injection are configured through :class:`MockConfig` and can
+be changed at runtime via the ``/mock/*`` admin endpoints.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import random
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Optional, Union
+from urllib.parse import parse_qs
+
+from server_core import Request, Response, json_response, text_response
+
+SAVES_DIR = Path(__file__).resolve().parent / "saves"
+OUTCOMES = ("redeemable", "redeemed", "expired", "invalid", "link_required")
+RATE_LIMIT_NOTICE = "To continue to redeem SHiFT codes, please launch a SHiFT-enabled title first!"
+DEFAULT_GAME_LABEL = "Borderlands 4"
+
+# Outcome -> snapshot whose #code_results content answers a code check.
+_CHECK_SNAPSHOTS = {
+    "redeemable": "choose_platform",
+    "expired": "expired_code",
+    "invalid": "does_not_exist",
+    "link_required": "check_error",
+    "error": "unexpected_error",
+}
+_ALREADY_REDEEMED_FRAGMENT = "<p>This SHiFT code has already been redeemed</p>"
+
+_CHECK_SCRIPT = """
+<script>
+document.getElementById('shift_code_check').addEventListener('click', async () => {
+  const code = document.getElementById('shift_code_input').value;
+  const results = document.getElementById('code_results');
+  const response = await fetch('/entitlement_offer_codes?code=' + encodeURIComponent(code));
+  results.innerHTML = response.ok ? await response.text() : 'Unexpected error occurred';
+  results.style.display = 'block';
+  results.parentElement.style.display = 'block';
+});
+</script>
+"""
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class LatencyModel:
+    """Response delay drawn from ``fixed:S``, ``uniform:LO:HI``, ``exp:MEAN`` or ``lognormal:MU:SIGMA``.
+
+    A plain number of seconds is taken as ``fixed:S``.
+    """
+
+    KINDS = {"fixed": 1, "uniform": 2, "exp": 1, "lognormal": 2}
+
+    def __init__(self, spec: Union[str, float] = "fixed:0") -> None:
+        if _is_number(spec):
+            spec = f"fixed:{spec:g}"
+        if not isinstance(spec, str):
+            raise ValueError(f"Invalid latency spec {spec!r} (expected a string like 'fixed:0.2' or seconds)")
+        kind, *raw = spec.split(":")
+        if kind not in self.KINDS or len(raw) != self.KINDS[kind]:
+            raise ValueError(f"Invalid latency spec '{spec}'")
+        try:
+            self.params = [float(value) for value in raw]
+        except ValueError as exc:
+            raise ValueError(f"Invalid latency spec '{spec}'") from exc
+        # lognormal's MU is a log and may be negative; every other parameter is seconds or a spread.
+        checked = self.params[1:] if kind == "lognormal" else self.params
+        if any(not value >= 0 for value in checked) or (kind == "uniform" and self.params[0] > self.params[1]):
+            raise ValueError(f"Invalid latency spec '{spec}'")
+        self.kind = kind
+        self.spec = spec
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        if self.kind == "exp":
+            return rng.expovariate(1 / self.params[0]) if self.params[0] > 0 else 0.0
+        return rng.lognormvariate(*self.params)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+@dataclass
+class MockConfig:
+    """Behaviour of the mock backend; every field can be set from a JSON file.
+
+    ``default_outcomes`` weights the outcome of codes that were never registered;
+    the draw is a hash of the code, so an unknown code keeps its outcome.
+    ``rate_limit`` is ``{"rate": tokens_per_second, "burst": tokens}`` per client,
+    shared by checks and redemptions. ``errors`` gives the probability of an
+    ``http_500`` or an ``unexpected`` error page per check or redemption.
+    """
+
+    latency: Dict[str, str] = field(default_factory=lambda: {"page": "fixed:0", "check": "fixed:0", "redeem": "fixed:0"})
+    rate_limit: Optional[Dict[str, float]] = None
+    errors: Dict[str, float] = field(default_factory=dict)
+    default_outcomes: Dict[str, float] = field(default_factory=lambda: {"redeemable": 1.0})
+    codes: Dict[str, str] = field(default_factory=dict)
+    games: Dict[str, str] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "MockConfig":
+        if not isinstance(data, dict):
+            raise ValueError("A mock config must be a JSON object")
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown mock config keys: {', '.join(sorted(unknown))}")
+        config = cls(**data)
+        config.validate()
+        return config
+
+    @classmethod
+    def load(cls, path: Path) -> "MockConfig":
+        try:
+            return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Unable to parse {path}: {exc}") from exc
+
+    def validate(self) -> None:
+        for name in ("latency", "errors", "default_outcomes", "codes", "games"):
+            if not isinstance(getattr(self, name), dict):
+                raise ValueError(f"{name} must be a JSON object")
+        # Numbers of seconds become the equivalent fixed:S spec.
+        self.latency = {name: LatencyModel(spec).spec for name, spec in self.latency.items()}
+        for outcome in [*self.default_outcomes, *self.codes.values()]:
+            if outcome not in OUTCOMES:
+                raise ValueError(f"Unknown outcome '{outcome}' (expected one of {', '.join(OUTCOMES)})")
+        weights = self.default_outcomes.values()
+        if not all(_is_number(weight) and weight >= 0 for weight in weights) or not sum(weights) > 0:
+            raise ValueError("default_outcomes weights must be non-negative numbers, not all zero")
+        if not all(isinstance(value, str) for value in [*self.codes, *self.games, *self.games.values()]):
+            raise ValueError("codes and games must map codes to strings")
+        unknown = set(self.errors) - {"http_500", "unexpected"}
+        if unknown:
+            raise ValueError(f"Unknown error kinds: {', '.join(sorted(unknown))} (expected http_500, unexpected)")
+        probabilities = self.errors.values()
+        if not all(_is_number(value) and 0 <= value <= 1 for value in probabilities) or sum(probabilities) > 1:
+            raise ValueError("errors must be probabilities between 0 and 1 that add up to at most 1")
+        if self.rate_limit is not None:
+            if not isinstance(self.rate_limit, dict) or set(self.rate_limit) != {"rate", "burst"}:
+                raise ValueError("rate_limit needs 'rate' and 'burst'")
+            rate, burst = self.rate_limit["rate"], self.rate_limit["burst"]
+            if not _is_number(rate) or not _is_number(burst) or rate < 0 or burst < 1:
+                raise ValueError("rate_limit needs a 'rate' of at least 0 per second and a 'burst' of at least 1")
+        if self.seed is not None and (not isinstance(self.seed, int) or isinstance(self.seed, bool)):
+            raise ValueError("seed must be an integer")
+
+
+def _code_results_inner(html: str) -> str:
+    """Inner HTML of the ``#code_results`` div of a saved page."""
+    start = re.search(r'<div id="code_results"[^>]*>', html)
+    if start is None:
+        raise ValueError("Snapshot has no #code_results element")
+    depth = 1
+    for tag in re.finditer(r"<(/?)div\b[^>]*>", html[start.end():]):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            return html[start.end():start.end() + tag.start()].strip()
+    raise ValueError("Unterminated #code_results element")
+
+
+def load_snapshots(saves_dir: Path = SAVES_DIR) -> Dict[str, str]:
+    return {path.stem: path.read_text(encoding="utf-8") for path in sorted(saves_dir.glob("*.html"))}
+
+
+class MockShiftBackend:
+    def __init__(self, config: Optional[MockConfig] = None, saves_dir: Path = SAVES_DIR) -> None:
+        self.snapshots = load_snapshots(saves_dir)
+        self.fragments = {outcome: _code_results_inner(self.snapshots[name]) for outcome, name in _CHECK_SNAPSHOTS.items()}
+        self.rewards_page = self.snapshots["empty_redeem"].replace("</body>", _CHECK_SCRIPT + "</body>")
+        self._lock = threading.Lock()
+        self._redemption_ids = itertools.count(1)
+        self.configure(config or MockConfig())
+
+    def configure(self, config: MockConfig) -> None:
+        with self._lock:
+            self.config = config
+            self.latency = {name: LatencyModel(spec) for name, spec in config.latency.items()}
+            self.rng = random.Random(config.seed)
+            self.states: Dict[str, str] = dict(config.codes)
+            self.games: Dict[str, str] = dict(config.games)
+            self.redeemed_platforms: Dict[str, set] = {}
+            self.redemptions: Dict[str, str] = {}
+            self.flash: Dict[str, str] = {}
+            self.buckets: Dict[str, TokenBucket] = {}
+            self.stats: Counter = Counter()
+
+    def handle(self, request: Request, now: float) -> Optional[Response]:
+        """Answer a mock SHiFT or admin request, or return None for other paths."""
+        path = request.path
+        if path.startswith("/mock/"):
+            return self._admin(request)
+        if path == "/rewards":
+            return self._delayed("page", self._rewards_page(request))
+        if path == "/entitlement_offer_codes":
+            return self._delayed("check", self._check(request, now))
+        if path == "/code_redemptions" and request.method == "POST":
+            return self._delayed("redeem", self._redeem(request, now))
+        if path.startswith("/code_redemptions/"):
+            return self._delayed("page", self._redemption_result(path.rsplit("/", 1)[-1]))
+        return None
+
+    def outcome(self, code: str) -> str:
+        with self._lock:
+            return self._outcome(code)
+
+    def _outcome(self, code: str) -> str:
+        state = self.states.get(code)
+        if state is None:
+            weights = self.config.default_outcomes
+            digest = hashlib.blake2b(code.encode("utf-8"), digest_size=8).digest()
+            point = int.from_bytes(digest, "big") / 2 ** 64 * sum(weights.values())
+            for candidate, weight in weights.items():
+                state = candidate
+                if point < weight:
+                    break
+                point -= weight
+            self.states[code] = state
+        return state
+
+    def _delayed(self, kind: str, response: Response) -> Response:
+        model = self.latency.get(kind)
+        if model is not None:
+            with self._lock:
+                response.delay += model.sample(self.rng)
+        return response
+
+    def _admitted(self, client: str, now: float) -> bool:
+        limit = self.config.rate_limit
+        if not limit:
+            return True
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = self.buckets[client] = TokenBucket(limit["rate"], limit["burst"], now)
+        return bucket.take(now)
+
+    def _injected_error(self) -> Optional[str]:
+        roll = self.rng.random()
+        for kind in ("http_500", "unexpected"):
+            probability = self.config.errors.get(kind, 0.0)
+            if roll < probability:
+                return kind
+            roll -= probability
+        return None
+
+    def _rewards_page(self, request: Request) -> Response:
+        html = self.rewards_page
+        with self._lock:
+            self.stats["pages"] += 1
+            notice = self.flash.pop(request.client[0], None)
+        if notice:
+            html = html.replace("<body>", f'<body>\n  <div class="alert notice"><p>{notice}</p></div>', 1)
+        return Response(200, [("Content-Type", "text/html; charset=utf-8")], html.encode("utf-8"))
+
+    def _check(self, request: Request, now: float) -> Response:
+        code = (request.query_value("code") or "").strip().upper()
+        with self._lock:
+            self.stats["checks"] += 1
+            if not self._admitted(request.client[0], now):
+                self.stats["rate_limited"] += 1
+                return text_response(429, "Too Many Requests\n")
+            error = self._injected_error()
+            if error:
+                self.stats[f"error_{error}"] += 1
+                if error == "http_500":
+                    return text_response(500, "Internal Server Error\n")
+                return self._fragment(self.fragments["error"])
+            outcome = self._outcome(code)
+            if outcome == "redeemable" and self.redeemed_platforms.get(code):
+                outcome = "redeemed"
+            self.stats[f"check_{outcome}"] += 1
+            if outcome == "redeemed":
+                return self._fragment(_ALREADY_REDEEMED_FRAGMENT)
+            fragment = self.fragments[outcome]
+            if outcome == "redeemable":
+                fragment = self._redeem_forms(fragment, code)
+        return self._fragment(fragment)
+
+    def _redeem_forms(self, fragment: str, code: str) -> str:
+        label = self.games.get(code, DEFAULT_GAME_LABEL)
+        fragment = re.sub(r"<h2>[^<]*</h2>", f"<h2>{label}</h2>", fragment)
+        return re.sub(
+            r'<form([^>]*)data-platform="([^"]+)"([^>]*)>',
+            lambda match: (
+                f'<form{match.group(1)}data-platform="{match.group(2)}"{match.group(3)} '
+                f'action="/code_redemptions" method="post">'
+                f'<input type="hidden" name="code" value="{code}">'
+                f'<input type="hidden" name="platform" value="{match.group(2)}">'
+            ),
+            fragment,
+        )
+
+    def _redeem(self, request: Request, now: float) -> Response:
+        form = parse_qs(request.body.decode("utf-8", "replace"))
+        code = (form.get("code") or [""])[-1].strip().upper()
+        platform = (form.get("platform") or [""])[-1]
+        client = request.client[0]
+        with self._lock:
+            self.stats["redemptions"] += 1
+            if not self._admitted(client, now):
+                self.stats["rate_limited"] += 1
+                self.flash[client] = RATE_LIMIT_NOTICE
+                return Response(302, [("Location", "/rewards")])
+            error = self._injected_error()
+            if error == "http_500":
+                self.stats["error_http_500"] += 1
+                return text_response(500, "Internal Server Error\n")
+            if error == "unexpected":
+                self.stats["error_unexpected"] += 1
+                page = "unexpected_error"
+            elif self._outcome(code) == "redeemable" and platform not in self.redeemed_platforms.get(code, set()):
+                self.redeemed_platforms.setdefault(code, set()).add(platform)
+                self.stats["redeemed"] += 1
+                page = "successful_redeem"
+            else:
+                self.stats["already_redeemed"] += 1
+                page = "already_redeemed"
+            redemption_id = str(next(self._redemption_ids))
+            self.redemptions[redemption_id] = page
+        return Response(302, [("Location", f"/code_redemptions/{redemption_id}")])
+
+    def _redemption_result(self, redemption_id: str) -> Response:
+        with self._lock:
+            page = self.redemptions.pop(redemption_id, None)
+        if page is None:
+            return text_response(404, "Unknown redemption\n")
+        body = self.snapshots[page].encode("utf-8")
+        return Response(200, [("Content-Type", "text/html; charset=utf-8")], body)
+
+    @staticmethod
+    def _fragment(html: str) -> Response:
+        return Response(200, [("Content-Type", "text/html; charset=utf-8")], html.encode("utf-8"))
+
+    def _admin(self, request: Request) -> Response:
+        if request.path == "/mock/stats" and request.method == "GET":
+            with self._lock:
+                return json_response({"stats": dict(self.stats), "codes": len(self.states)})
+        if request.method != "POST":
+            return text_response(405, "Use POST for mock admin changes\n")
+        try:
+            payload = json.loads(request.body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Expected a JSON object")
+            if request.path == "/mock/config":
+                self.configure(MockConfig.from_dict(payload))
+            elif request.path == "/mock/codes":
+                # {"codes": {"CODE": "expired", ...}, "games": {"CODE": "Borderlands 3"}}
+                update = MockConfig.from_dict({"codes": payload.get("codes", {}), "games": payload.get("games", {})})
+                with self._lock:
+                    self.states.update(update.codes)
+                    self.games.update(update.games)
+            elif request.path == "/mock/reset":
+                self.configure(self.config)
+            else:
+                return text_response(404, "Unknown mock endpoint\n")
+        except (ValueError, TypeError) as exc:
+            return text_response(400, f"{exc}\n")
+        return json_response({"ok": True})
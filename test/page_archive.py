@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Record/replay archive of code-source pages.
+
+Pages are appended to one archive file, each record holding the URL, fetch
+time, status, content type, body and the codes found in the body (packed as in
+:mod:`code_extractor`, 17 bytes each). A sidecar ``<archive>.index`` lists
+``(url hash, fetch time, offset)`` entries sorted by URL and time, so the page
+a URL served at any moment is a binary search away. Readers map both files
+with ``mmap`` and hand out bodies as ``memoryview`` slices of the archive, which
+the test server sends without copying.
+
+The archive is only ever appended to. A record cut short by a crash is dropped
+the next time the archive is opened for writing, and an index that is missing
+or behind the archive is brought up to date from the records after the part it
+covers.
+
+    python3 page_archive.py record archive.pages http://localhost:8000/ --every 300
+    python3 page_archive.py import archive.pages saves/*.html --url-prefix https://shift.gearboxsoftware.com/
+    python3 page_archive.py get archive.pages http://localhost:8000/ --at 2025-09-12T10:00
+    python3 ../test-server.py --replay archive.pages   # then GET /replay?url=...&at=...
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from code_extractor import CODE_PATTERN, PACKED_BYTES, pack_code, unpack_code
+from http_client import ConnectionPool, HTTPClientError
+from virtual_clock import parse_duration, parse_time
+
+ARCHIVE_MAGIC = b"SHFTARC1"
+INDEX_MAGIC = b"SHFTIDX1"
+RECORD_MARKER = b"PAGE"
+# marker, fetched at, status, URL length, content type length, body length, code count, CRC-32 of the rest
+RECORD_HEADER = struct.Struct("<4sdHHHIII")
+# magic, archive bytes covered, entry count
+INDEX_HEADER = struct.Struct("<8sQQ")
+# URL hash, fetched at, record offset
+INDEX_ENTRY = struct.Struct("<8sdQ")
+DEFAULT_CONTENT_TYPE = "text/html; charset=utf-8"
+
+
+def url_key(url: str) -> bytes:
+    return hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest()
+
+
+def index_path(path: Path) -> Path:
+    return path.with_name(path.name + ".index")
+
+
+def _record_crc(*parts: Union[bytes, memoryview]) -> int:
+    crc = 0
+    for part in parts:
+        crc = zlib.crc32(part, crc)
+    return crc
+
+
+@dataclass
+class ArchivedPage:
+    """A record as stored; ``body`` and ``packed_codes`` are views into the archive, not copies."""
+
+    offset: int
+    url: str
+    fetched_at: float
+    status: int
+    content_type: str
+    body: memoryview
+    packed_codes: memoryview
+
+    @property
+    def code_count(self) -> int:
+        return len(self.packed_codes) // PACKED_BYTES
+
+    def packed(self) -> Iterator[int]:
+        data = self.packed_codes
+        for start in range(0, len(data), PACKED_BYTES):
+            yield int.from_bytes(data[start:start + PACKED_BYTES], "big")
+
+    def codes(self) -> List[str]:
+        """The codes on the page, in order of first appearance."""
+        return [unpack_code(value) for value in self.packed()]
+
+    def summary(self) -> dict:
+        return {
+            "url": self.url,
+            "fetched_at": self.fetched_at,
+            "status": self.status,
+            "content_type": self.content_type,
+            "bytes": len(self.body),
+            "code_count": self.code_count,
+            "offset": self.offset,
+        }
+
+
+def _read_record(buffer, offset: int, end: int, verify: bool = False) -> Optional[Tuple[ArchivedPage, int]]:
+    """The record at ``offset`` and the offset after it, or None if it is incomplete or damaged."""
+    if offset + RECORD_HEADER.size > end:
+        return None
+    marker, fetched_at, status, url_length, type_length, body_length, code_count, crc = RECORD_HEADER.unpack_from(
+        buffer, offset
+    )
+    start = offset + RECORD_HEADER.size
+    body_start = start + url_length + type_length
+    codes_start = body_start + body_length
+    record_end = codes_start + code_count * PACKED_BYTES
+    if marker != RECORD_MARKER or record_end > end:
+        return None
+    view = memoryview(buffer)
+    if verify and _record_crc(view[start:record_end]) != crc:
+        return None
+    page = ArchivedPage(
+        offset,
+        bytes(view[start:start + url_length]).decode("utf-8"),
+        fetched_at,
+        status,
+        bytes(view[start + url_length:body_start]).decode("utf-8"),
+        view[body_start:codes_start],
+        view[codes_start:record_end],
+    )
+    return page, record_end
+
+
+def _scan(buffer, start: int, end: int) -> Tuple[List[Tuple[bytes, float, int]], int]:
+    """Index entries for the intact records from ``start``, and where the intact part ends."""
+    entries = []
+    offset = start
+    while True:
+        record = _read_record(buffer, offset, end, verify=True)
+        if record is None:
+            return entries, offset
+        page, next_offset = record
+        entries.append((url_key(page.url), page.fetched_at, offset))
+        page.body.release()
+        page.packed_codes.release()
+        offset = next_offset
+
+
+def _check_magic(buffer, path: Path) -> None:
+    if bytes(buffer[:len(ARCHIVE_MAGIC)]) != ARCHIVE_MAGIC:
+        raise ValueError(f"{path} is not a page archive")
+
+
+def _read_index(path: Path) -> Tuple[List[Tuple[bytes, float, int]], int]:
+    """The entries of an archive's index and the archive bytes it covers; nothing when it is missing or unusable."""
+    try:
+        data = index_path(path).read_bytes()
+    except FileNotFoundError:
+        return [], len(ARCHIVE_MAGIC)
+    if len(data) < INDEX_HEADER.size:
+        return [], len(ARCHIVE_MAGIC)
+    magic, covered, count = INDEX_HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or len(data) != INDEX_HEADER.size + count * INDEX_ENTRY.size:
+        return [], len(ARCHIVE_MAGIC)
+    return list(INDEX_ENTRY.iter_unpack(memoryview(data)[INDEX_HEADER.size:])), covered
+
+
+def _write_index(path: Path, entries: List[Tuple[bytes, float, int]], covered: int) -> None:
+    entries.sort()
+    target = index_path(path)
+    partial = target.with_name(target.name + ".tmp")
+    with partial.open("wb") as handle:
+        handle.write(INDEX_HEADER.pack(INDEX_MAGIC, covered, len(entries)))
+        handle.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+    os.replace(partial, target)
+
+
+def update_index(path: Path, rebuild: bool = False) -> Tuple[int, int]:
+    """Bring the index up to date with the archive; return (entries, bytes of intact records)."""
+    entries, covered = ([], len(ARCHIVE_MAGIC)) if rebuild else _read_index(path)
+    with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        _check_magic(buffer, path)
+        if covered > len(buffer):
+            entries, covered = [], len(ARCHIVE_MAGIC)
+        new_entries, end = _scan(buffer, covered, len(buffer))
+    if new_entries or rebuild or not index_path(path).exists():
+        _write_index(path, entries + new_entries, end)
+    return len(entries) + len(new_entries), end
+
+
+class ArchiveWriter:
+    """Appends pages to an archive, creating it if needed; the index is updated on :meth:`close`."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        if not path.exists() or path.stat().st_size == 0:
+            path.write_bytes(ARCHIVE_MAGIC)
+        # Whatever follows the last intact record is a write cut short and is dropped.
+        _, end = update_index(path)
+        self._handle = path.open("r+b")
+        self._handle.truncate(end)
+        self._handle.seek(end)
+        self.appended = 0
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def append(
+        self,
+        url: str,
+        body: bytes,
+        fetched_at: Optional[float] = None,
+        status: int = 200,
+        content_type: str = DEFAULT_CONTENT_TYPE,
+    ) -> int:
+        """Add a page and return its offset; the codes in ``body`` are extracted and stored with it."""
+        url_bytes = url.encode("utf-8")
+        type_bytes = content_type.encode("utf-8")
+        codes = dict.fromkeys(code.decode("ascii") for code in CODE_PATTERN.findall(body))
+        packed = b"".join(pack_code(code).to_bytes(PACKED_BYTES, "big") for code in codes)
+        header = RECORD_HEADER.pack(
+            RECORD_MARKER,
+            time.time() if fetched_at is None else fetched_at,
+            status,
+            len(url_bytes),
+            len(type_bytes),
+            len(body),
+            len(codes),
+            _record_crc(url_bytes, type_bytes, body, packed),
+        )
+        offset = self._handle.tell()
+        self._handle.writelines((header, url_bytes, type_bytes, body, packed))
+        self.appended += 1
+        return offset
+
+    def flush(self) -> None:
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+
+    def close(self) -> None:
+        if self._handle.closed:
+            return
+        self.flush()
+        self._handle.close()
+        update_index(self.path)
+
+
+class PageArchive:
+    """Read side of an archive: lookups by URL and time, code queries, and zero-copy page bodies.
+
+    Pages hold views into the archive's ``mmap``; while any of them is still
+    referenced, :meth:`close` leaves the mapping to be released with the last one.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        try:
+            self.entries, self.size = update_index(path)
+        except OSError:
+            # A read-only archive is still readable; a stale index is then only brought up to date in memory.
+            self.entries, self.size = None, None
+        self._handle = path.open("rb")
+        self._map = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        _check_magic(self._map, path)
+        self._index = self._map_index()
+        self._codes: Optional[Dict[int, array]] = None
+
+    def _map_index(self):
+        if self.entries is not None:
+            with index_path(self.path).open("rb") as handle:
+                return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        entries, covered = _read_index(self.path)
+        new_entries, self.size = _scan(self._map, min(covered, len(self._map)), len(self._map))
+        entries = sorted(entries + new_entries)
+        self.entries = len(entries)
+        return INDEX_HEADER.pack(INDEX_MAGIC, self.size, len(entries)) + b"".join(
+            INDEX_ENTRY.pack(*entry) for entry in entries
+        )
+
+    def __enter__(self) -> "PageArchive":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.entries
+
+    def _entry(self, position: int) -> Tuple[bytes, float, int]:
+        return INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + position * INDEX_ENTRY.size)
+
+    def _bisect(self, key: bytes, at: float) -> int:
+        """Position of the first index entry after ``(key, at)``."""
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[:2] <= (key, at):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def page(self, offset: int) -> ArchivedPage:
+        record = _read_record(self._map, offset, self.size)
+        if record is None:
+            raise ValueError(f"No record at offset {offset} of {self.path}")
+        return record[0]
+
+    def find(self, url: str, at: Optional[float] = None) -> Optional[ArchivedPage]:
+        """The page ``url`` served at ``at`` (its latest record fetched by then), or None."""
+        key = url_key(url)
+        position = self._bisect(key, math.inf if at is None else at)
+        while position > 0:
+            position -= 1
+            entry_key, _, offset = self._entry(position)
+            if entry_key != key:
+                break
+            page = self.page(offset)
+            # Two URLs can share a hash; the record itself says which one it is.
+            if page.url == url:
+                return page
+        return None
+
+    def history(self, url: str) -> List[ArchivedPage]:
+        """Every record of ``url``, oldest first."""
+        key = url_key(url)
+        position = self._bisect(key, -math.inf)
+        pages = []
+        while position < self.entries:
+            entry_key, _, offset = self._entry(position)
+            if entry_key != key:
+                break
+            page = self.page(offset)
+            if page.url == url:
+                pages.append(page)
+            position += 1
+        return pages
+
+    def __iter__(self) -> Iterator[ArchivedPage]:
+        """Every record in the order it was appended."""
+        offset = len(ARCHIVE_MAGIC)
+        while offset < self.size:
+            page, offset = _read_record(self._map, offset, self.size)
+            yield page
+
+    def describe(self) -> List[dict]:
+        """One entry per URL: how many records it has and the time span they cover."""
+        urls: Dict[str, dict] = {}
+        for position in range(self.entries):
+            _, fetched_at, offset = self._entry(position)
+            url = self.page(offset).url
+            described = urls.setdefault(url, {"url": url, "records": 0, "first": fetched_at, "last": fetched_at})
+            described["records"] += 1
+            described["first"] = min(described["first"], fetched_at)
+            described["last"] = max(described["last"], fetched_at)
+        return sorted(urls.values(), key=lambda described: described["url"])
+
+    def _code_table(self) -> Dict[int, array]:
+        # Built from the code sections alone, so no page body is read.
+        if self._codes is None:
+            table: Dict[int, array] = {}
+            for page in self:
+                for value in page.packed():
+                    table.setdefault(value, array("Q")).append(page.offset)
+            self._codes = table
+        return self._codes
+
+    def pages_with(self, code: str) -> List[ArchivedPage]:
+        """Every record whose page contains ``code``, in the order they were appended."""
+        return [self.page(offset) for offset in self._code_table().get(pack_code(code), ())]
+
+    def first_seen(self, code: str) -> Optional[ArchivedPage]:
+        """The earliest-fetched record containing ``code``."""
+        return min(self.pages_with(code), key=lambda page: page.fetched_at, default=None)
+
+    def close(self) -> None:
+        if isinstance(self._index, mmap.mmap):
+            self._index.close()
+        self._handle.close()
+        try:
+            self._map.close()
+        except BufferError:
+            pass
+
+
+async def _fetch_round(pool: ConnectionPool, urls: Sequence[str]) -> List[Tuple[str, float, object]]:
+    async def fetch(url: str):
+        fetched_at = time.time()
+        try:
+            return url, fetched_at, await pool.request("GET", url, {"Accept-Encoding": "gzip"})
+        except (HTTPClientError, OSError, asyncio.TimeoutError) as exc:
+            return url, fetched_at, exc
+
+    return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+async def record(
+    writer: ArchiveWriter, urls: Sequence[str], every: float = 0.0, rounds: int = 1, timeout: float = 30.0
+) -> int:
+    """Fetch every URL ``rounds`` times (0 = until interrupted), ``every`` seconds apart; return pages recorded."""
+    pool = ConnectionPool(timeout=timeout)
+    recorded = 0
+    try:
+        completed = 0
+        while True:
+            started = time.monotonic()
+            for url, fetched_at, result in await _fetch_round(pool, urls):
+                if isinstance(result, Exception):
+                    sys.stderr.write(f"Unable to fetch {url}: {result or type(result).__name__}\n")
+                    continue
+                content_type = result.header("content-type", DEFAULT_CONTENT_TYPE)
+                writer.append(url, result.content(), fetched_at, result.status, content_type)
+                recorded += 1
+            writer.flush()
+            completed += 1
+            if rounds and completed >= rounds:
+                return recorded
+            await asyncio.sleep(max(0.0, every - (time.monotonic() - started)))
+    finally:
+        await pool.close()
+
+
+def import_files(
+    writer: ArchiveWriter, paths: Iterable[Path], url: Optional[str], url_prefix: Optional[str], at: Optional[float]
+) -> int:
+    """Add saved pages, fetched at ``at`` or else at their modification time; return pages added."""
+    added = 0
+    for path in paths:
+        page_url = url or (url_prefix or "file:///") + path.name
+        fetched_at = path.stat().st_mtime if at is None else at
+        writer.append(page_url, path.read_bytes(), fetched_at)
+        added += 1
+    return added
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Record source pages into an archive and read them back.")
+    commands = parser.add_subparsers(dest="command", metavar="command", required=True)
+
+    recorder = commands.add_parser("record", help="Fetch URLs into the archive, once or repeatedly")
+    recorder.add_argument("archive", type=Path)
+    recorder.add_argument("urls", nargs="+")
+    recorder.add_argument("--every", default="0", help="Time between rounds, e.g. 300 or 5m (default: back to back)")
+    recorder.add_argument("--rounds", type=int, default=1, help="Rounds to record (default 1; 0 until Ctrl+C)")
+    recorder.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+
+    importer = commands.add_parser("import", help="Add saved pages to the archive")
+    importer.add_argument("archive", type=Path)
+    importer.add_argument("files", nargs="+", type=Path)
+    source = importer.add_mutually_exclusive_group()
+    source.add_argument("--url", help="URL the pages were saved from (all files)")
+    source.add_argument("--url-prefix", help="URL the file names are relative to (default file:///)")
+    importer.add_argument("--at", help="Fetch time as a Unix timestamp or ISO 8601 (default: file modification time)")
+
+    commands.add_parser("list", help="List the URLs and the time span recorded for each").add_argument(
+        "archive", type=Path
+    )
+
+    getter = commands.add_parser("get", help="Write the page a URL served at a given time to stdout")
+    getter.add_argument("archive", type=Path)
+    getter.add_argument("url")
+    getter.add_argument("--at", help="Time as a Unix timestamp or ISO 8601 (default: latest)")
+    getter.add_argument("--codes", action="store_true", help="Print the record and its codes as JSON instead")
+
+    finder = commands.add_parser("find-code", help="List the records whose page contains a code")
+    finder.add_argument("archive", type=Path)
+    finder.add_argument("code")
+
+    commands.add_parser("reindex", help="Rebuild the index from the records").add_argument("archive", type=Path)
+    return parser.parse_args(argv)
+
+
+def _print_json(payload) -> None:
+    sys.stdout.write(json.dumps(payload, indent=2) + "\n")
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        if args.command == "record":
+            with ArchiveWriter(args.archive) as writer:
+                try:
+                    asyncio.run(record(writer, args.urls, parse_duration(args.every), args.rounds, args.timeout))
+                finally:
+                    print(f"Recorded {writer.appended} pages into {args.archive}")
+        elif args.command == "import":
+            at = parse_time(args.at) if args.at else None
+            with ArchiveWriter(args.archive) as writer:
+                added = import_files(writer, args.files, args.url, args.url_prefix, at)
+            print(f"Imported {added} pages into {args.archive}")
+        elif args.command == "reindex":
+            entries, size = update_index(args.archive, rebuild=True)
+            print(f"Indexed {entries} records ({size} bytes) in {index_path(args.archive)}")
+        else:
+            with PageArchive(args.archive) as archive:
+                if args.command == "list":
+                    _print_json({"records": len(archive), "bytes": archive.size, "urls": archive.describe()})
+                elif args.command == "find-code":
+                    _print_json([page.summary() for page in archive.pages_with(args.code)])
+                else:
+                    page = archive.find(args.url, parse_time(args.at) if args.at else None)
+                    if page is None:
+                        sys.stderr.write(f"Error: {args.url} has no record{' by then' if args.at else ''}\n")
+                        return 1
+                    if args.codes:
+                        _print_json({**page.summary(), "codes": page.codes()})
+                    else:
+                        sys.stdout.buffer.write(page.body)
+    except (OSError, ValueError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
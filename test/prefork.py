@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Prefork serving: several worker processes each run their own server on the
+same port, bound with ``SO_REUSEPORT`` so the kernel spreads connections over
+them and every worker gets a core (and a GIL) of its own.
+
+The parent reserves the port first, so a port that is in use fails before any
+worker starts. It then forks the workers and restarts any that die. On Ctrl+C
+or SIGTERM it asks them to stop: each worker stops accepting, gives the
+requests in flight up to ``grace`` seconds and exits. Workers publish their
+stats to a directory they share through :class:`SharedStats`, so whichever
+worker answers can report on the whole server, and :class:`AdminJournal`
+carries admin changes made on one worker over to the others.
+"""
+
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Set, Tuple
+
+from server_core import App, Exchange, Observer, Request, Response, make_server
+
+GRACE_SECONDS = 5.0
+PUBLISH_INTERVAL = 1.0
+# A worker that dies sooner than this after starting is broken, not unlucky, and is not restarted.
+MIN_WORKER_LIFETIME = 2.0
+
+
+class SharedStats:
+    """Each worker's ``collect()`` result, published as ``worker-<pid>.json`` in a shared directory.
+
+    Files of workers that have exited are kept, so totals never go backwards
+    when a worker is restarted.
+    """
+
+    def __init__(self, collect: Callable[[], dict], interval: float = PUBLISH_INTERVAL) -> None:
+        self.collect = collect
+        self.interval = interval
+        self.directory: Optional[Path] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def publish(self) -> None:
+        path = self.directory / f"worker-{os.getpid()}.json"
+        partial = path.with_suffix(".tmp")
+        partial.write_text(json.dumps(self.collect()), encoding="utf-8")
+        os.replace(partial, path)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._publish()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._publish()
+
+    def _publish(self) -> None:
+        try:
+            self.publish()
+        except OSError as exc:
+            sys.stderr.write(f"Unable to publish worker stats: {exc}\n")
+
+    def gather(self) -> Dict[int, dict]:
+        """Every worker's latest stats by pid; this worker's are collected fresh."""
+        own = os.getpid()
+        gathered = {own: self.collect()}
+        for path in sorted(self.directory.glob("worker-*.json")):
+            pid = int(path.stem.partition("-")[2])
+            if pid == own:
+                continue
+            try:
+                gathered[pid] = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                continue
+        return gathered
+
+
+class AdminJournal:
+    """Admin changes made on one worker, replayed by the others before their next request.
+
+    Every worker has its own copy of state such as the simulated clock or the
+    fault rules. A change is made inside :meth:`exclusive`, which applies the
+    changes of other workers first and keeps the journal locked, and is then
+    appended with :meth:`record` as ``(name, payload)``. Every worker calls
+    :meth:`sync` before handling a request, which hands the entries written
+    since its last look to ``apply`` in order. A restarted worker starts from
+    the state it was forked with and replays the whole journal.
+    """
+
+    def __init__(self, apply: Callable[[str, object], None]) -> None:
+        self.apply = apply
+        self.directory: Optional[Path] = None
+        self._offset = 0
+        self._lock = threading.RLock()
+
+    @property
+    def path(self) -> Path:
+        return self.directory / "admin.jsonl"
+
+    def sync(self) -> None:
+        try:
+            if self.path.stat().st_size == self._offset:
+                return
+        except FileNotFoundError:
+            return
+        with self._lock:
+            with self.path.open("rb") as journal:
+                journal.seek(self._offset)
+                pending = journal.read()
+            # A line still being written is picked up next time.
+            complete = pending[:pending.rfind(b"\n") + 1]
+            self._offset += len(complete)
+            for line in complete.splitlines():
+                entry = json.loads(line)
+                self.apply(entry["name"], entry["payload"])
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        with self._lock, self.path.open("ab") as journal:
+            fcntl.flock(journal, fcntl.LOCK_EX)
+            self.sync()
+            yield
+
+    def record(self, name: str, payload: object) -> None:
+        """Append a change made inside :meth:`exclusive`; this worker has applied it already."""
+        with self._lock, self.path.open("ab") as journal:
+            journal.write(json.dumps({"name": name, "payload": payload}).encode("utf-8") + b"\n")
+            journal.flush()
+            self._offset = journal.tell()
+
+
+class PreforkServer:
+    """Runs ``processes`` copies of ``make_server(mode, ...)`` on one port; same interface as a single server."""
+
+    def __init__(
+        self,
+        processes: int,
+        mode: str,
+        address: Tuple[str, int],
+        app: App,
+        workers: Optional[int] = None,
+        *,
+        observer: Optional[Observer] = None,
+        log_requests: bool = True,
+        grace: float = GRACE_SECONDS,
+        stats: Optional[SharedStats] = None,
+        journal: Optional[AdminJournal] = None,
+    ) -> None:
+        if processes < 1:
+            raise ValueError("A prefork server needs at least one process")
+        if not hasattr(os, "fork") or not hasattr(socket, "SO_REUSEPORT"):
+            raise ValueError("Prefork mode needs fork() and SO_REUSEPORT (Linux, macOS or BSD)")
+        self.processes = processes
+        self.mode = mode
+        self.app = app
+        self.workers = workers
+        self.observer = observer
+        self.log_requests = log_requests
+        self.grace = grace
+        self.stats = stats
+        self.journal = journal
+        family = socket.AF_INET6 if ":" in address[0] else socket.AF_INET
+        # SO_REUSEPORT would happily share the port with another server, so check it is free without it.
+        with socket.socket(family) as probe:
+            probe.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            probe.bind(address)
+            address = (address[0], probe.getsockname()[1])
+        # Holding the port bound (but not listening) keeps other programs off it without taking connections.
+        self._reservation = socket.socket(family)
+        self._reservation.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._reservation.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            self._reservation.bind(address)
+        except OSError:
+            self._reservation.close()
+            raise
+        self.server_address = address
+        self.directory: Optional[Path] = None
+        if stats is not None or journal is not None:
+            self.directory = Path(tempfile.mkdtemp(prefix="shift-test-server-"))
+        for shared in (stats, journal):
+            if shared is not None:
+                shared.directory = self.directory
+        self._children: Dict[int, float] = {}
+
+    def __enter__(self) -> "PreforkServer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server_close()
+
+    def serve_forever(self) -> None:
+        previous = signal.signal(signal.SIGTERM, _interrupt)
+        # Anything still buffered would otherwise be written once more by every worker.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        try:
+            for _ in range(self.processes):
+                self._spawn()
+            while self._children:
+                pid, status = os.wait()
+                started = self._children.pop(pid, None)
+                if started is None:
+                    continue
+                code = os.waitstatus_to_exitcode(status)
+                if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                    raise RuntimeError(f"Worker {pid} exited with status {code} right after starting")
+                sys.stderr.write(f"Worker {pid} exited with status {code}; starting a new one\n")
+                self._spawn()
+        finally:
+            self._stop_children()
+            signal.signal(signal.SIGTERM, previous)
+
+    def shutdown(self) -> None:
+        os.kill(os.getpid(), signal.SIGTERM)
+
+    def server_close(self) -> None:
+        self._reservation.close()
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.monotonic()
+            return
+        code = 1
+        try:
+            code = self._run_worker()
+        except BaseException:  # noqa: BLE001 - nothing may escape a forked child
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _run_worker(self) -> int:
+        # Ctrl+C reaches the whole process group; only the parent acts on it.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self._reservation.close()
+        # Requests the app has seen and the observer has not: the server may observe exchanges it answered
+        # itself (a malformed request, say), which must not count against these.
+        in_flight: Set[int] = set()
+        lock = threading.Lock()
+
+        def app(request: Request) -> Response:
+            with lock:
+                in_flight.add(id(request))
+            return self.app(request)
+
+        def observer(exchange: Exchange) -> None:
+            try:
+                if self.observer is not None:
+                    self.observer(exchange)
+            finally:
+                with lock:
+                    in_flight.discard(id(exchange.request))
+
+        server = make_server(
+            self.mode,
+            self.server_address,
+            app,
+            self.workers,
+            observer=observer,
+            log_requests=self.log_requests,
+            reuse_port=True,
+        )
+        if self.mode == "asyncio":
+            server.grace = self.grace
+
+        def stop(signum, frame) -> None:
+            # shutdown() waits for serve_forever to return, so it cannot run on this thread.
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        if self.stats is not None:
+            self.stats.start()
+        with server:
+            server.serve_forever()
+        # The threaded servers leave their connections running; wait for the requests in flight.
+        deadline = time.monotonic() + self.grace
+        while in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if self.stats is not None:
+            self.stats.stop()
+        return 0
+
+    def _stop_children(self) -> None:
+        for pid in self._children:
+            _signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.grace + 1
+        while self._children and time.monotonic() < deadline:
+            for pid in list(self._children):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    del self._children[pid]
+            time.sleep(0.05)
+        for pid in self._children:
+            _signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        self._children.clear()
+
+
+def _interrupt(signum, frame) -> None:
+    raise KeyboardInterrupt
+
+
+def _signal(pid: int, signum: int) -> None:
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
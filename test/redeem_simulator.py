@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Discrete-event simulation of redemption runs, to pick the redeem-runner.js
+delays from data.
+
+Each (game, platform) run follows ``createRedeemRunner().run``: load the
+rewards page and inject the scripts, check every code, submit the redeemable
+ones and wait for the result page, pause between codes, then retry the codes
+that errored in up to three rounds with their growing waits. The SHiFT side
+follows :mod:`mock_shift`, and the same :class:`~mock_shift.MockConfig` file
+supplies the latency models, outcome weights, error rates and the account's
+token bucket. A code redeemed on one platform checks as already redeemed on
+the others, and a rate-limited redemption leaves the notice that makes the
+runner give up.
+
+How requests are paced is up to a scheduler, given as ``kind:param:...``:
+
+    fixed:CODE_DELAY:RETRY_DELAY   the runner as it is (default fixed:5:15); a rate-limit notice ends the run
+    token-bucket:RATE:BURST        requests spaced to RATE per second, BURST at once; rate-limited codes are retried
+    aimd:INITIAL:MIN:MAX           the delay between codes drops 0.5 s per success and doubles per rate limit
+
+``--lanes N`` runs N platforms at once in separate tabs, sharing the
+account's rate limit. Every scenario is simulated ``--runs`` times with
+different seeds on a process pool, and the report gives makespan, outcomes
+and rate-limit hits:
+
+    python3 redeem_simulator.py --codes 500 --scheduler fixed:5:15 aimd:5:1:60 --lanes 1 3 6 --runs 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+from bisect import bisect
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from mock_shift import LatencyModel, MockConfig, TokenBucket
+from shift_config import load_games, load_shift_config
+
+# Fixed waits in redeem-runner.js and shift-handler.js, in seconds.
+MAX_RETRY_ROUNDS = 3
+INJECT_WAIT = 1.0  # waitForReloadAndInject, after injecting the content scripts
+RESULT_WAIT = 0.5  # before checkFinalResult
+RETRY_RELOAD_WAIT = 3.0  # after reloading the rewards page for a retry round
+CODE_DELAY_STEP = 2.0  # added to the delay between codes per retry round
+RETRY_DELAY_STEP = 5.0  # added to the wait before each retry round
+CHECK_POLL = 0.3  # shift-handler looks at #code_results this often
+CHECK_POLLS = 30  # and reports "Check took too long" after this many looks
+
+AIMD_STEP = 0.5
+AIMD_FACTOR = 2.0
+# The mock config example in the README, without its per-code overrides.
+DEFAULT_MOCK = {
+    "latency": {"page": "fixed:0.2", "check": "lognormal:-1.5:0.5", "redeem": "uniform:0.5:1.5"},
+    "rate_limit": {"rate": 0.2, "burst": 5},
+    "errors": {"http_500": 0.01, "unexpected": 0.02},
+    "default_outcomes": {"redeemable": 0.6, "redeemed": 0.2, "expired": 0.15, "invalid": 0.05},
+}
+RESULTS = ("redeemed", "validated", "expired", "invalid", "error")
+# Check outcome -> runner result; "redeemable" codes go on to be submitted.
+_CHECK_RESULTS = {"redeemed": "validated", "expired": "expired", "invalid": "invalid", "link_required": "error"}
+
+_START, _CHECK, _REDEEM, _RETRY = range(4)
+
+
+class FixedDelay:
+    """The runner's own pacing: ``code_delay`` between codes and ``retry_delay`` before retry rounds."""
+
+    abort_on_rate_limit = True
+
+    def __init__(self, code_delay: float = 5.0, retry_delay: float = 15.0) -> None:
+        self.delay = code_delay
+        self.retry = retry_delay
+
+    def code_delay(self, retry_round: int) -> float:
+        return self.delay + retry_round * CODE_DELAY_STEP
+
+    def retry_delay(self, retry_round: int) -> float:
+        return self.retry + retry_round * RETRY_DELAY_STEP
+
+    def request_time(self, now: float) -> float:
+        """When a request wanted at ``now`` may go out."""
+        return now
+
+    def record(self, now: float, rate_limited: bool) -> None:
+        pass
+
+
+class TokenBucketPacing(FixedDelay):
+    """No delay between codes; every request waits for a token of a client-side bucket instead."""
+
+    abort_on_rate_limit = False
+
+    def __init__(self, rate: float = 0.2, burst: float = 5.0, retry_delay: float = 15.0) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError("token-bucket needs a rate above 0 and a burst of at least 1")
+        super().__init__(0.0, retry_delay)
+        self.bucket = TokenBucket(rate, burst, 0.0)
+
+    def code_delay(self, retry_round: int) -> float:
+        return 0.0
+
+    def request_time(self, now: float) -> float:
+        if self.bucket.take(now):
+            return now
+        return now + (1 - self.bucket.tokens) / self.bucket.rate + 1e-9
+
+
+class AIMDDelay(FixedDelay):
+    """Additive decrease of the delay between codes on success, multiplicative increase on a rate limit."""
+
+    abort_on_rate_limit = False
+
+    def __init__(self, initial: float = 5.0, minimum: float = 1.0, maximum: float = 60.0) -> None:
+        if not 0 <= minimum <= initial <= maximum:
+            raise ValueError("aimd needs MIN <= INITIAL <= MAX")
+        super().__init__(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def code_delay(self, retry_round: int) -> float:
+        return self.delay
+
+    def record(self, now: float, rate_limited: bool) -> None:
+        if rate_limited:
+            self.delay = min(self.maximum, max(self.delay, AIMD_STEP) * AIMD_FACTOR)
+        else:
+            self.delay = max(self.minimum, self.delay - AIMD_STEP)
+
+
+SCHEDULERS: Dict[str, Callable[..., FixedDelay]] = {
+    "fixed": FixedDelay,
+    "token-bucket": TokenBucketPacing,
+    "aimd": AIMDDelay,
+}
+
+
+def make_scheduler(spec: str) -> FixedDelay:
+    """A fresh scheduler from ``kind:param:...``; left-out parameters keep their defaults."""
+    kind, *raw = spec.split(":")
+    factory = SCHEDULERS.get(kind)
+    if factory is None:
+        raise ValueError(f"Unknown scheduler '{kind}' (expected one of {', '.join(SCHEDULERS)})")
+    try:
+        return factory(*(float(value) for value in raw))
+    except TypeError as exc:
+        raise ValueError(f"Too many parameters in scheduler '{spec}'") from exc
+    except ValueError as exc:
+        raise ValueError(f"Invalid scheduler '{spec}': {exc}") from exc
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """One workload and schedule to simulate: ``codes`` backlog codes per game, redeemed on every platform."""
+
+    scheduler: str
+    lanes: int
+    games: Tuple[str, ...]
+    platforms: Tuple[str, ...]
+    codes: int
+
+    def lane_jobs(self) -> List[List[Tuple[int, str]]]:
+        """The (game, platform) runs of each tab: platforms are dealt out over the tabs, games in order."""
+        lanes = max(1, min(self.lanes, len(self.platforms)))
+        return [
+            [(game, platform) for game in range(len(self.games)) for platform in self.platforms[lane::lanes]]
+            for lane in range(lanes)
+        ]
+
+
+class _Lane:
+    __slots__ = ("jobs", "game", "batch", "position", "retry_round", "errored", "finished")
+
+    def __init__(self, jobs: List[Tuple[int, str]]) -> None:
+        self.jobs = iter(jobs)
+        self.game = 0
+        self.batch: List[int] = []
+        self.position = 0
+        self.retry_round = 0
+        self.errored: List[int] = []
+        self.finished = 0.0
+
+
+def simulate(scenario: Scenario, config: MockConfig, seed: int) -> dict:
+    """Simulate one redemption of the whole backlog and return its outcome counts and timings."""
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    scheduler = make_scheduler(scenario.scheduler)
+    models = {name: LatencyModel(spec) for name, spec in config.latency.items()}
+    no_latency = LatencyModel()
+    page, check, redeem = (models.get(name, no_latency) for name in ("page", "check", "redeem"))
+    limit = config.rate_limit
+    bucket = TokenBucket(limit["rate"], limit["burst"], 0.0) if limit else None
+    error_500 = config.errors.get("http_500", 0.0)
+    error_any = error_500 + config.errors.get("unexpected", 0.0)
+    outcome_names = list(config.default_outcomes)
+    cumulative = list(itertools.accumulate(config.default_outcomes.values()))
+    outcomes = [
+        [outcome_names[bisect(cumulative, rng.random() * cumulative[-1])] for _ in range(scenario.codes)]
+        for _ in scenario.games
+    ]
+    redeemed = [bytearray(scenario.codes) for _ in scenario.games]
+    stats: Counter = Counter()
+    lanes = [_Lane(jobs) for jobs in scenario.lane_jobs()]
+    events: List[Tuple[float, int, _Lane, int]] = []
+    sequence = itertools.count()
+    push, pop = heapq.heappush, heapq.heappop
+    page_time, check_time, redeem_time = page.sample, check.sample, redeem.sample
+
+    def checked_after(latency: float) -> float:
+        polls = math.ceil(latency / CHECK_POLL)
+        return polls * CHECK_POLL if polls < CHECK_POLLS else CHECK_POLLS * CHECK_POLL
+
+    def finish(lane: _Lane, done: float, result: str, rate_limited: bool, notice: bool) -> None:
+        scheduler.record(done, rate_limited)
+        code = lane.batch[lane.position]
+        lane.position += 1
+        if result == "error" and lane.retry_round < MAX_RETRY_ROUNDS:
+            lane.errored.append(code)
+            stats["retries"] += 1
+        else:
+            stats[result] += 1
+        remaining = len(lane.batch) - lane.position
+        if remaining:
+            done += scheduler.code_delay(lane.retry_round)
+        if notice and scheduler.abort_on_rate_limit:
+            # The runner sees the rate-limit notice after its pause and ends the run; the rest stay new.
+            stats["aborted_runs"] += 1
+            stats["unfinished"] += remaining + len(lane.errored)
+            push(events, (done, next(sequence), lane, _START))
+        elif remaining:
+            push(events, (done, next(sequence), lane, _CHECK))
+        elif lane.errored and lane.retry_round < MAX_RETRY_ROUNDS:
+            lane.retry_round += 1
+            lane.batch, lane.errored, lane.position = lane.errored, [], 0
+            stats["retry_rounds"] += 1
+            push(events, (done + scheduler.retry_delay(lane.retry_round), next(sequence), lane, _RETRY))
+        else:
+            push(events, (done, next(sequence), lane, _START))
+
+    for lane in lanes:
+        push(events, (0.0, next(sequence), lane, _START))
+    while events:
+        now, _, lane, phase = pop(events)
+        stats["events"] += 1
+        if phase == _START:
+            job = next(lane.jobs, None)
+            if job is None:
+                lane.finished = now
+                continue
+            lane.game = job[0]
+            lane.batch, lane.errored, lane.position, lane.retry_round = list(range(scenario.codes)), [], 0, 0
+            stats["runs"] += 1
+            push(events, (now + page_time(rng) + INJECT_WAIT, next(sequence), lane, _CHECK))
+            continue
+        if phase == _RETRY:
+            ready = now + page_time(rng) + INJECT_WAIT + RETRY_RELOAD_WAIT
+            push(events, (ready, next(sequence), lane, _CHECK))
+            continue
+        ready = scheduler.request_time(now)
+        if ready > now:
+            push(events, (ready, next(sequence), lane, phase))
+            continue
+        admitted = bucket is None or bucket.take(now)
+        code = lane.batch[lane.position]
+        if phase == _CHECK:
+            stats["checks"] += 1
+            done = now + checked_after(check_time(rng))
+            if not admitted:
+                stats["rate_limited_checks"] += 1
+                finish(lane, done, "error", True, False)
+                continue
+            outcome = outcomes[lane.game][code]
+            if rng.random() < error_any:
+                finish(lane, done, "error", False, False)
+            elif outcome == "redeemable" and not redeemed[lane.game][code]:
+                push(events, (done, next(sequence), lane, _REDEEM))
+            else:
+                finish(lane, done, "validated" if outcome == "redeemable" else _CHECK_RESULTS[outcome], False, False)
+            continue
+        stats["redemptions"] += 1
+        done = now + redeem_time(rng) + page_time(rng) + INJECT_WAIT + RESULT_WAIT
+        if not admitted:
+            stats["rate_limited_redemptions"] += 1
+            finish(lane, done, "error", True, True)
+        elif rng.random() < error_any:
+            finish(lane, done, "error", False, False)
+        elif redeemed[lane.game][code]:
+            finish(lane, done, "validated", False, False)
+        else:
+            redeemed[lane.game][code] = 1
+            finish(lane, done, "redeemed", False, False)
+
+    makespan = max(lane.finished for lane in lanes)
+    seconds = time.perf_counter() - started
+    attempts = stats["checks"]
+    done_codes = sum(stats[result] for result in RESULTS)
+    return {
+        "seed": seed,
+        "makespan": makespan,
+        "codes": scenario.codes * len(scenario.games) * len(scenario.platforms),
+        **{result: stats[result] for result in RESULTS},
+        "unfinished": stats["unfinished"],
+        "attempts": attempts,
+        "redemptions": stats["redemptions"],
+        "rate_limited": stats["rate_limited_checks"] + stats["rate_limited_redemptions"],
+        "rate_limited_checks": stats["rate_limited_checks"],
+        "rate_limited_redemptions": stats["rate_limited_redemptions"],
+        "runs": stats["runs"],
+        "aborted_runs": stats["aborted_runs"],
+        "retry_rounds": stats["retry_rounds"],
+        "codes_per_hour": done_codes / makespan * 3600 if makespan else 0.0,
+        "events": stats["events"],
+        "wall_seconds": seconds,
+    }
+
+
+def _simulate_job(job: Tuple[Scenario, MockConfig, int]) -> dict:
+    return simulate(*job)
+
+
+def run_scenarios(
+    scenarios: Sequence[Scenario], config: MockConfig, runs: int, seed: int = 0, workers: Optional[int] = None
+) -> List[dict]:
+    """Simulate each scenario ``runs`` times (the same seeds for every scenario) and summarise them."""
+    jobs = [(scenario, config, seed + run) for scenario in scenarios for run in range(runs)]
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+    if workers == 1 or len(jobs) < 2:
+        results = [_simulate_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_simulate_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    elapsed = time.perf_counter() - started
+    attempts_per_second = sum(result["attempts"] for result in results) / elapsed if elapsed else 0.0
+    return [
+        summarize(scenario, results[index * runs:(index + 1) * runs], attempts_per_second)
+        for index, scenario in enumerate(scenarios)
+    ]
+
+
+def _percentile(values: Sequence[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(scenario: Scenario, results: List[dict], attempts_per_second: float) -> dict:
+    makespans = [result["makespan"] for result in results]
+
+    def mean(name: str) -> float:
+        return statistics.fmean(result[name] for result in results)
+
+    return {
+        "scheduler": scenario.scheduler,
+        "lanes": scenario.lanes,
+        "runs": len(results),
+        "codes": results[0]["codes"],
+        "makespan": {
+            "mean": statistics.fmean(makespans),
+            "p50": _percentile(makespans, 0.5),
+            "p95": _percentile(makespans, 0.95),
+            "max": max(makespans),
+        },
+        **{
+            name: mean(name)
+            for name in (
+                *RESULTS,
+                "unfinished",
+                "attempts",
+                "rate_limited",
+                "rate_limited_checks",
+                "rate_limited_redemptions",
+                "aborted_runs",
+                "retry_rounds",
+                "codes_per_hour",
+            )
+        },
+        "simulated_attempts_per_second": attempts_per_second,
+        "results": results,
+    }
+
+
+def format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(round(seconds)), 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}"
+
+
+def print_report(summaries: List[dict], stream=sys.stdout) -> None:
+    header = (
+        f"{'scheduler':<22} {'lanes':>5} {'makespan':>10} {'p95':>10} {'codes/h':>8} {'redeemed':>9} "
+        f"{'errors':>7} {'unfinished':>10} {'limited':>8} {'aborted':>8}"
+    )
+    stream.write(header + "\n" + "-" * len(header) + "\n")
+    for summary in summaries:
+        stream.write(
+            f"{summary['scheduler']:<22} {summary['lanes']:>5} {format_duration(summary['makespan']['mean']):>10} "
+            f"{format_duration(summary['makespan']['p95']):>10} {summary['codes_per_hour']:>8.0f} "
+            f"{summary['redeemed']:>9.1f} {summary['error']:>7.1f} {summary['unfinished']:>10.1f} "
+            f"{summary['rate_limited']:>8.1f} {summary['aborted_runs']:>8.1f}\n"
+        )
+    if summaries:
+        stream.write(f"\n{summaries[0]['simulated_attempts_per_second']:,.0f} simulated code attempts per second\n")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Simulate redemption runs under different schedules.")
+    parser.add_argument("--codes", type=int, default=200, help="Backlog codes per game (default 200)")
+    parser.add_argument("--games", help="Comma-separated game ids (default: every game in shift-config.js)")
+    parser.add_argument("--platforms", help="Comma-separated platform ids (default: every platform in shift-config.js)")
+    parser.add_argument(
+        "--scheduler",
+        nargs="+",
+        default=["fixed:5:15"],
+        help="Schedulers to compare: fixed:CODE_DELAY:RETRY_DELAY, token-bucket:RATE:BURST, aimd:INITIAL:MIN:MAX",
+    )
+    parser.add_argument("--lanes", type=int, nargs="+", default=[1], help="Platforms redeemed at once (default 1)")
+    parser.add_argument(
+        "--mock-config",
+        type=Path,
+        help="Mock SHiFT config (latency, rate_limit, errors, default_outcomes) as for test-server.py "
+        "(default: the README example)",
+    )
+    parser.add_argument("--runs", type=int, default=10, help="Simulations per scenario (default 10)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the first simulation of each scenario")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--output", "-o", help="Also write the summaries and every run as JSON to this file")
+    args = parser.parse_args(argv)
+    if args.codes < 1 or args.runs < 1 or min(args.lanes) < 1:
+        parser.error("--codes, --runs and --lanes must be at least 1")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        config = MockConfig.load(args.mock_config) if args.mock_config else MockConfig.from_dict(DEFAULT_MOCK)
+        shift_config = load_shift_config()
+        games = tuple(args.games.split(",")) if args.games else tuple(game.id for game in load_games())
+        platforms = (
+            tuple(args.platforms.split(","))
+            if args.platforms
+            else tuple(platform["id"] for platform in shift_config.get("platforms", []))
+        )
+        for spec in args.scheduler:
+            make_scheduler(spec)
+        scenarios = [
+            Scenario(spec, lanes, games, platforms, args.codes) for spec in args.scheduler for lanes in args.lanes
+        ]
+        summaries = run_scenarios(scenarios, config, args.runs, args.seed, args.workers)
+    except (OSError, ValueError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    print(
+        f"{args.codes} codes x {len(games)} games x {len(platforms)} platforms, {args.runs} runs per scenario\n"
+    )
+    print_report(summaries)
+    if args.output:
+        Path(args.output).write_text(json.dumps(summaries, indent=2) + "\n", encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,629 @@
+#!/usr/bin/env python3
+"""
+Small HTTP serving layer shared by the local test tools.
+
+Request handling is written once as an ``app`` callable that turns a
+:class:`Request` into a :class:`Response`; the functions here run that app
+behind a single-threaded, threaded or asyncio server.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import http.client
+import json
+import http.server
+import io
+import os
+import posixpath
+import socket
+import socketserver
+import struct
+import sys
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from email.message import Message
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, unquote, urlsplit
+
+SERVER_MODES = ("single", "threaded", "asyncio")
+KEEPALIVE_TIMEOUT = 5.0
+LISTEN_BACKLOG = 1024
+SERVER_VERSION = "ShiftTestServer/1.0"
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+@dataclass
+class Request:
+    method: str
+    target: str
+    headers: Message
+    client: Tuple[str, int]
+    body: bytes = b""
+
+    @property
+    def path(self) -> str:
+        return urlsplit(self.target).path
+
+    @property
+    def query(self) -> Dict[str, List[str]]:
+        return parse_qs(urlsplit(self.target).query)
+
+    def query_value(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[-1] if values else default
+
+
+@dataclass
+class Response:
+    """An HTTP response; an iterable ``body`` is streamed with chunked transfer encoding.
+
+    A ``memoryview`` body (a slice of an ``mmap``, say) is written as is, without copying.
+
+    ``delay`` holds the response back for that many seconds without blocking an
+    asyncio event loop, which is how simulated latency is expressed. ``pace``
+    ``(bytes, seconds)`` writes the body in pieces of that size with a pause
+    after each, for throttled or trickled transfers. ``abort`` drops the
+    connection after ``delay`` instead of answering: ``"reset"`` with a TCP RST,
+    ``"close"`` with an ordinary close.
+    """
+
+    status: int = 200
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    body: Union[bytes, memoryview, Iterable[bytes]] = b""
+    delay: float = 0.0
+    pace: Optional[Tuple[int, float]] = None
+    abort: Optional[str] = None
+
+    @property
+    def streaming(self) -> bool:
+        return not isinstance(self.body, (bytes, bytearray, memoryview, FileBody))
+
+    @property
+    def content_length(self) -> Optional[int]:
+        if isinstance(self.body, FileBody):
+            return self.body.length
+        return None if self.streaming else len(self.body)
+
+    def header(self, name: str) -> Optional[str]:
+        lowered = name.lower()
+        for key, value in self.headers:
+            if key.lower() == lowered:
+                return value
+        return None
+
+
+class FileBody:
+    """``length`` bytes of a file from ``offset``, sent with ``os.sendfile`` instead of through Python buffers.
+
+    The file is only opened while it is being sent, so a response for a HEAD
+    request or a 304 never touches it.
+    """
+
+    def __init__(self, path: Path, offset: int = 0, length: Optional[int] = None) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = path.stat().st_size - offset if length is None else length
+
+    def __iter__(self) -> Iterator[bytes]:
+        remaining = self.length
+        with self.path.open("rb") as handle:
+            handle.seek(self.offset)
+            while remaining > 0:
+                data = handle.read(min(remaining, FILE_CHUNK_SIZE))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+
+    def send_to(self, sock: socket.socket) -> int:
+        with self.path.open("rb") as handle:
+            return sock.sendfile(handle, self.offset, self.length)
+
+    async def send_to_transport(self, transport: asyncio.WriteTransport) -> int:
+        with self.path.open("rb") as handle:
+            return await asyncio.get_running_loop().sendfile(transport, handle, self.offset, self.length)
+
+
+App = Callable[[Request], Response]
+
+
+@dataclass
+class Exchange:
+    """A finished request as seen by an observer: timings in seconds, body bytes on the wire."""
+
+    request: Request
+    response: Response
+    render_seconds: float
+    total_seconds: float
+    bytes_sent: int
+
+
+Observer = Callable[[Exchange], None]
+
+
+def status_phrase(status: int) -> str:
+    try:
+        return http.HTTPStatus(status).phrase
+    except ValueError:
+        return ""
+
+
+def text_response(status: int, text: str, content_type: str = "text/plain; charset=utf-8") -> Response:
+    return Response(status, [("Content-Type", content_type)], text.encode("utf-8"))
+
+
+def json_response(payload, status: int = 200) -> Response:
+    body = json.dumps(payload, indent=2, sort_keys=True).encode("utf-8") + b"\n"
+    return Response(status, [("Content-Type", "application/json")], body)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def validator_headers(etag: str, last_modified: float) -> List[Tuple[str, str]]:
+    return [("ETag", etag), ("Last-Modified", formatdate(last_modified, usegmt=True))]
+
+
+def is_not_modified(request: Request, etag: str, last_modified: float) -> bool:
+    """Evaluate If-None-Match / If-Modified-Since for a GET or HEAD (RFC 9110 section 13.2.2)."""
+    if request.method not in ("GET", "HEAD"):
+        return False
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: W/"x" matches "x".
+        return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+def has_body(status: int) -> bool:
+    return not (100 <= status < 200 or status in (204, 304))
+
+
+def encode_chunk(data: bytes) -> bytes:
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+def _body_pieces(response: Response) -> Iterator[bytes]:
+    """The body as the pieces to write, cut to ``pace`` size when the response is paced."""
+    pieces = [response.body] if isinstance(response.body, (bytes, bytearray, memoryview)) else response.body
+    size = response.pace[0] if response.pace else 0
+    for data in pieces:
+        if size <= 0:
+            if data:
+                yield data
+            continue
+        for offset in range(0, len(data), size):
+            yield data[offset:offset + size]
+
+
+def _linger_reset(sock) -> None:
+    """Make the next close of ``sock`` send a TCP RST instead of a FIN."""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+
+
+def _close_body(response: Response) -> None:
+    close = getattr(response.body, "close", None)
+    if response.streaming and close is not None:
+        close()
+
+
+def resolve_static_path(root: Path, request_path: str) -> Optional[Path]:
+    """Map a URL path onto a file below ``root``, refusing anything outside it.
+
+    A directory maps onto its ``index.html``, or onto the directory itself when it has none.
+    """
+    parts = [part for part in posixpath.normpath(unquote(request_path)).split("/") if part]
+    if any(part in (os.curdir, os.pardir) or os.sep in part for part in parts):
+        return None
+    candidate = root.joinpath(*parts)
+    if candidate.is_dir():
+        index = candidate / "index.html"
+        return index if index.is_file() else candidate
+    return candidate if candidate.is_file() else None
+
+
+def _content_length(headers: Message) -> Optional[int]:
+    """The request's Content-Length (0 without one), or None when it is malformed."""
+    value = (headers.get("Content-Length") or "0").strip()
+    return int(value) if value.isdigit() else None
+
+
+def _call_app(app: App, request: Request) -> Response:
+    try:
+        return app(request)
+    except Exception:  # noqa: BLE001 - a broken route must not take the server down
+        traceback.print_exc()
+        return text_response(500, "Internal server error\n")
+
+
+def _wants_keep_alive(version: str, headers: Message) -> bool:
+    connection = (headers.get("Connection") or "").lower()
+    if version == "HTTP/1.1":
+        return connection != "close"
+    return connection == "keep-alive"
+
+
+class AppRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Adapter that feeds ``http.server`` requests through ``server.app``."""
+
+    protocol_version = "HTTP/1.1"
+    server_version = SERVER_VERSION
+    timeout = KEEPALIVE_TIMEOUT
+    # Buffer headers and body into one send; handle_one_request flushes after each request.
+    wbufsize = io.DEFAULT_BUFFER_SIZE
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self._dispatch()
+
+    def do_HEAD(self) -> None:
+        self._dispatch()
+
+    def do_POST(self) -> None:
+        self._dispatch()
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.log_requests:
+            super().log_message(format, *args)
+
+    def _dispatch(self) -> None:
+        started = time.perf_counter()
+        length = _content_length(self.headers)
+        body = self.rfile.read(length) if length else b""
+        request = Request(self.command, self.path, self.headers, self.client_address, body)
+        if length is None:
+            # Where the body ends is unknown, so the connection cannot be reused.
+            response = text_response(400, "Bad Content-Length\n")
+            response.headers.append(("Connection", "close"))
+        else:
+            response = _call_app(self.server.app, request)
+        rendered = time.perf_counter()
+        sent = 0
+        try:
+            sent = self._send(response)
+        finally:
+            if self.server.observer is not None:
+                self.server.observer(
+                    Exchange(request, response, rendered - started, time.perf_counter() - started, sent)
+                )
+
+    def _send(self, response: Response) -> int:
+        if response.delay > 0:
+            time.sleep(response.delay)
+        if response.abort:
+            self.close_connection = True
+            if response.abort == "reset":
+                _linger_reset(self.connection)
+                # The socket really closes once the handler's files are, which then sends the RST.
+                self.connection.close()
+            _close_body(response)
+            return 0
+        send_body = self.command != "HEAD" and has_body(response.status)
+        chunked = response.streaming and self.request_version == "HTTP/1.1" and self.protocol_version == "HTTP/1.1"
+        self.send_response(response.status)
+        for name, value in response.headers:
+            self.send_header(name, value)
+        if not has_body(response.status):
+            pass
+        elif chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        elif response.streaming:
+            # HTTP/1.0 peers cannot take chunks; the end of the body is the end of the connection.
+            self.close_connection = True
+            self.send_header("Connection", "close")
+        else:
+            self.send_header("Content-Length", str(response.content_length))
+        self.end_headers()
+        sent = 0
+        try:
+            if send_body and isinstance(response.body, FileBody) and not response.pace:
+                self.wfile.flush()
+                sent = response.body.send_to(self.connection)
+            elif send_body:
+                for data in _body_pieces(response):
+                    self.wfile.write(encode_chunk(data) if chunked else data)
+                    sent += len(data)
+                    if response.pace:
+                        self.wfile.flush()
+                        time.sleep(response.pace[1])
+                if chunked:
+                    self.wfile.write(LAST_CHUNK)
+            self.wfile.flush()
+        finally:
+            _close_body(response)
+        return sent
+
+
+class SingleThreadedServer(socketserver.TCPServer):
+    allow_reuse_address = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        app: App,
+        *,
+        observer: Optional[Observer] = None,
+        log_requests: bool = True,
+        reuse_port: bool = False,
+    ) -> None:
+        # One connection at a time, so never hold a socket open for keep-alive.
+        handler = type("SingleRequestHandler", (AppRequestHandler,), {"protocol_version": "HTTP/1.0"})
+        self.allow_reuse_port = reuse_port
+        super().__init__(address, handler)
+        self.app = app
+        self.observer = observer
+        self.log_requests = log_requests
+
+
+class ThreadedServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Thread-per-connection server, or a bounded pool when ``workers`` is set.
+
+    With keep-alive a connection occupies its worker until the client closes it
+    or it sits idle for ``KEEPALIVE_TIMEOUT`` seconds, so size ``workers`` to the
+    number of concurrent clients rather than to the CPU count.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        app: App,
+        workers: Optional[int] = None,
+        *,
+        observer: Optional[Observer] = None,
+        log_requests: bool = True,
+        reuse_port: bool = False,
+    ) -> None:
+        self.allow_reuse_port = reuse_port
+        super().__init__(address, AppRequestHandler)
+        self.app = app
+        self.observer = observer
+        self.log_requests = log_requests
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http") if workers else None
+
+    def process_request(self, request, client_address) -> None:
+        if self._pool is None:
+            super().process_request(request, client_address)
+            return
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AsyncHTTPServer:
+    """Minimal HTTP/1.1 server on asyncio with keep-alive and pipelining-safe reads.
+
+    The app runs inline on the event loop unless ``workers`` is set, in which case
+    calls are handed to a thread pool of that size (useful for routes that block).
+    After :meth:`shutdown` the server stops accepting and gives requests in flight
+    up to ``grace`` seconds to finish before their connections are dropped.
+    """
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        app: App,
+        workers: Optional[int] = None,
+        *,
+        observer: Optional[Observer] = None,
+        log_requests: bool = True,
+        reuse_port: bool = False,
+    ) -> None:
+        self.server_address = address
+        self.app = app
+        self.workers = workers
+        self.observer = observer
+        self.log_requests = log_requests
+        self.reuse_port = reuse_port
+        self.grace = 0.0
+        self._busy = 0
+        self._stopping: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def __enter__(self) -> "AsyncHTTPServer":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server_close()
+
+    def serve_forever(self) -> None:
+        asyncio.run(self._serve())
+
+    def shutdown(self) -> None:
+        if self._loop is not None and self._stopping is not None:
+            self._loop.call_soon_threadsafe(self._stopping.set)
+
+    def server_close(self) -> None:
+        pass
+
+    async def _serve(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        if self.workers:
+            self._loop.set_default_executor(ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http"))
+        host, port = self.server_address
+        server = await asyncio.start_server(
+            self._handle_connection,
+            host or None,
+            port,
+            backlog=LISTEN_BACKLOG,
+            reuse_address=True,
+            reuse_port=self.reuse_port,
+        )
+        async with server:
+            await self._stopping.wait()
+            server.close()
+            deadline = time.monotonic() + self.grace
+            while self._busy and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client = writer.get_extra_info("peername") or ("", 0)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                request_line, _, header_blob = head.partition(b"\r\n")
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                    await self._write(writer, "HTTP/1.1", "GET", text_response(400, "Bad request\n"), False)
+                    break
+                headers = http.client.parse_headers(io.BytesIO(header_blob))
+                self._busy += 1
+                try:
+                    keep_alive = await self._respond(reader, writer, client, request_line, headers)
+                finally:
+                    self._busy -= 1
+                # Once shutting down, finish the request at hand but take no more on this connection.
+                if self._stopping.is_set():
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(
+        self,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+        client: Tuple[str, int],
+        request_line: bytes,
+        headers: Message,
+    ) -> bool:
+        """Read the body, run the app and write its response; return whether to keep the connection."""
+        method, target, version = request_line.decode("latin-1").split()
+        length = _content_length(headers)
+        if length is None:
+            request = Request(method, target, headers, client[:2])
+            response = text_response(400, "Bad Content-Length\n")
+            started = rendered = time.perf_counter()
+        else:
+            body = await reader.readexactly(length) if length else b""
+            request = Request(method, target, headers, client[:2], body)
+            started = time.perf_counter()
+            if self.workers:
+                response = await asyncio.get_running_loop().run_in_executor(None, _call_app, self.app, request)
+            else:
+                response = _call_app(self.app, request)
+            rendered = time.perf_counter()
+        sent = 0
+        # Every exchange is observed, including failed writes and ones cancelled on shutdown.
+        try:
+            if response.delay > 0:
+                await asyncio.sleep(response.delay)
+            if response.abort:
+                if response.abort == "reset":
+                    _linger_reset(writer.get_extra_info("socket"))
+                _close_body(response)
+                writer.transport.abort()
+                return False
+            # Without a usable Content-Length, where the body ends is unknown, so the connection cannot be reused.
+            keep_alive = length is not None and _wants_keep_alive(version, headers)
+            if response.streaming and version != "HTTP/1.1":
+                keep_alive = False
+            sent = await self._write(writer, version, method, response, keep_alive)
+        finally:
+            if self.observer is not None:
+                self.observer(Exchange(request, response, rendered - started, time.perf_counter() - started, sent))
+        if self.log_requests:
+            self._log(client, request_line.decode("latin-1"), response, sent)
+        return keep_alive
+
+    async def _write(
+        self,
+        writer: asyncio.StreamWriter,
+        version: str,
+        method: str,
+        response: Response,
+        keep_alive: bool,
+    ) -> int:
+        """Write ``response`` and return the number of body bytes sent."""
+        chunked = response.streaming and version == "HTTP/1.1"
+        send_body = method != "HEAD" and has_body(response.status)
+        lines = [f"HTTP/1.1 {response.status} {status_phrase(response.status)}", f"Server: {SERVER_VERSION}"]
+        lines.append(f"Date: {formatdate(usegmt=True)}")
+        lines.extend(f"{name}: {value}" for name, value in response.headers)
+        if not has_body(response.status):
+            pass
+        elif chunked:
+            lines.append("Transfer-Encoding: chunked")
+        elif not response.streaming:
+            lines.append(f"Content-Length: {response.content_length}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        sent = 0
+        try:
+            if send_body and isinstance(response.body, FileBody) and not response.pace:
+                await writer.drain()
+                sent = await response.body.send_to_transport(writer.transport)
+            elif send_body:
+                for data in _body_pieces(response):
+                    writer.write(encode_chunk(data) if chunked else data)
+                    sent += len(data)
+                    if response.streaming or response.pace:
+                        await writer.drain()
+                    if response.pace:
+                        await asyncio.sleep(response.pace[1])
+                if chunked:
+                    writer.write(LAST_CHUNK)
+        finally:
+            _close_body(response)
+        await writer.drain()
+        return sent
+
+    def _log(self, client: Tuple[str, int], request_line: str, response: Response, sent: int) -> None:
+        sys.stderr.write(f'{client[0]} - - "{request_line}" {response.status} {sent}\n')
+
+
+def make_server(
+    mode: str,
+    address: Tuple[str, int],
+    app: App,
+    workers: Optional[int] = None,
+    *,
+    observer: Optional[Observer] = None,
+    log_requests: bool = True,
+    reuse_port: bool = False,
+):
+    """Create a server for ``mode``; every variant offers ``serve_forever`` and context management.
+
+    ``observer`` is called with an :class:`Exchange` after each response has been
+    written; ``log_requests=False`` silences the per-request lines on stderr.
+    ``reuse_port`` binds with ``SO_REUSEPORT`` so several processes can share the port.
+    """
+    options = {"observer": observer, "log_requests": log_requests, "reuse_port": reuse_port}
+    if mode == "single":
+        return SingleThreadedServer(address, app, **options)
+    if mode == "threaded":
+        return ThreadedServer(address, app, workers, **options)
+    if mode == "asyncio":
+        return AsyncHTTPServer(address, app, workers, **options)
+    raise ValueError(f"Unknown server mode '{mode}' (expected one of {', '.join(SERVER_MODES)})")
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Request metrics for the test server: counts, bytes and latency histograms per
+path, polling statistics per client, and an optional JSON-lines access log.
+
+Exposed as JSON or in the Prometheus text format (see :meth:`ServerMetrics.prometheus`).
+Metrics of several processes add up with :meth:`ServerMetrics.merged`.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from http.cookies import SimpleCookie
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, TextIO
+
+from server_core import Exchange, Request, Response
+
+CLIENT_HEADER = "X-Client-Id"
+CLIENT_COOKIE = "shift_client"
+MAX_PATHS = 256
+MAX_CLIENTS = 10_000
+METRIC_PREFIX = "shift_test"
+
+# 100 microseconds to ~105 seconds in steps of sqrt(2).
+LATENCY_BUCKETS: List[float] = [0.0001 * 2 ** (step / 2) for step in range(41)]
+
+_ID_SEGMENT = re.compile(r"^(?:\d+|[0-9a-f]{16,}|[0-9a-f-]{36})$", re.IGNORECASE)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with interpolated quantiles."""
+
+    def __init__(self, bounds: List[float] = LATENCY_BUCKETS) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        low, high = 0, len(self.bounds)
+        while low < high:
+            middle = (low + high) // 2
+            if value <= self.bounds[middle]:
+                high = middle
+            else:
+                low = middle + 1
+        self.counts[low] += 1
+        self.total += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        if not self.total:
+            return 0.0
+        rank = q * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                upper = self.bounds[index] if index < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def merge(self, other: "Histogram") -> None:
+        if other.bounds != self.bounds:
+            raise ValueError("Cannot merge histograms with different buckets")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.sum += other.sum
+
+    def state(self) -> dict:
+        return {"counts": list(self.counts), "sum": self.sum}
+
+    @classmethod
+    def from_state(cls, state: dict, bounds: List[float] = LATENCY_BUCKETS) -> "Histogram":
+        histogram = cls(bounds)
+        if len(state["counts"]) != len(histogram.counts):
+            raise ValueError("Histogram state does not match the buckets")
+        histogram.counts = list(state["counts"])
+        histogram.total = sum(histogram.counts)
+        histogram.sum = state["sum"]
+        return histogram
+
+    def summary(self) -> dict:
+        return {
+            "count": self.total,
+            "mean": self.sum / self.total if self.total else 0.0,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+@dataclass
+class PathStats:
+    statuses: Counter = field(default_factory=Counter)
+    bytes_sent: int = 0
+    render: Histogram = field(default_factory=Histogram)
+    latency: Histogram = field(default_factory=Histogram)
+
+
+@dataclass
+class ClientStats:
+    requests: int = 0
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+    user_agent: str = ""
+
+    def as_dict(self) -> dict:
+        interval = (self.last_seen - self.first_seen) / (self.requests - 1) if self.requests > 1 else None
+        return {
+            "requests": self.requests,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "mean_poll_interval": interval,
+            "user_agent": self.user_agent,
+        }
+
+
+def normalize_path(path: str) -> str:
+    """Collapse id-like path segments so per-path series stay bounded."""
+    return "/".join(":id" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")) or "/"
+
+
+def client_id(request: Request) -> str:
+    """Identify a polling client: explicit header, ``client`` query, cookie, then address and user agent."""
+    explicit = request.headers.get(CLIENT_HEADER) or request.query_value("client")
+    if explicit:
+        return explicit
+    cookie_header = request.headers.get("Cookie")
+    if cookie_header:
+        cookie = SimpleCookie()
+        try:
+            cookie.load(cookie_header)
+        except Exception:  # noqa: BLE001 - malformed cookies just fall through
+            cookie = SimpleCookie()
+        if CLIENT_COOKIE in cookie:
+            return cookie[CLIENT_COOKIE].value
+    return f"{request.client[0]} {request.headers.get('User-Agent', '-')}"
+
+
+def tag_client(request: Request, response: Response) -> None:
+    """Hand out a client cookie so separate browser profiles show up as separate clients.
+
+    Only full HTML pages carry it: a cookie on 304s, redirects, errors or
+    static files would make every poll of a cookieless client look like a new
+    client, and make those responses uncacheable for shared caches.
+    """
+    if request.headers.get(CLIENT_HEADER) or CLIENT_COOKIE in (request.headers.get("Cookie") or ""):
+        return
+    if response.status != 200 or not (response.header("Content-Type") or "").startswith("text/html"):
+        return
+    if "public" in (response.header("Cache-Control") or ""):
+        return
+    response.headers.append(("Set-Cookie", f"{CLIENT_COOKIE}={uuid.uuid4().hex}; Path=/; Max-Age=31536000"))
+
+
+class ServerMetrics:
+    """Thread-safe request metrics; pass :meth:`observe` to ``make_server(observer=...)``."""
+
+    def __init__(self, access_log: Optional[Path] = None) -> None:
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.paths: Dict[str, PathStats] = {}
+        self.clients: Dict[str, ClientStats] = {}
+        self.render = Histogram()
+        self.latency = Histogram()
+        self._access_log: Optional[TextIO] = (
+            open(access_log, "a", encoding="utf-8", buffering=1) if access_log else None
+        )
+
+    def close(self) -> None:
+        if self._access_log is not None:
+            self._access_log.close()
+            self._access_log = None
+
+    def observe(self, exchange: Exchange) -> None:
+        request = exchange.request
+        path = normalize_path(request.path)
+        client = client_id(request)
+        now = time.time()
+        with self._lock:
+            stats = self.paths.get(path)
+            if stats is None:
+                if len(self.paths) >= MAX_PATHS:
+                    path = "other"
+                stats = self.paths.setdefault(path, PathStats())
+            stats.statuses[exchange.response.status] += 1
+            stats.bytes_sent += exchange.bytes_sent
+            stats.render.observe(exchange.render_seconds)
+            stats.latency.observe(exchange.total_seconds)
+            self.render.observe(exchange.render_seconds)
+            self.latency.observe(exchange.total_seconds)
+            client_stats = self.clients.get(client)
+            if client_stats is None and len(self.clients) < MAX_CLIENTS:
+                client_stats = self.clients[client] = ClientStats(first_seen=now, user_agent=request.headers.get("User-Agent", ""))
+            if client_stats is not None:
+                client_stats.requests += 1
+                client_stats.last_seen = now
+            if self._access_log is not None:
+                self._access_log.write(json.dumps({
+                    "ts": now,
+                    "client": client,
+                    "method": request.method,
+                    "path": request.target,
+                    "status": exchange.response.status,
+                    "bytes": exchange.bytes_sent,
+                    "render_ms": round(exchange.render_seconds * 1000, 3),
+                    "total_ms": round(exchange.total_seconds * 1000, 3),
+                    "user_agent": request.headers.get("User-Agent", ""),
+                }) + "\n")
+
+    def state(self) -> dict:
+        """Raw counters and histogram buckets as plain JSON, for :meth:`merged`."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "render": self.render.state(),
+                "latency": self.latency.state(),
+                "paths": {
+                    path: {
+                        "statuses": {str(status): count for status, count in stats.statuses.items()},
+                        "bytes_sent": stats.bytes_sent,
+                        "render": stats.render.state(),
+                        "latency": stats.latency.state(),
+                    }
+                    for path, stats in self.paths.items()
+                },
+                "clients": {client: asdict(stats) for client, stats in self.clients.items()},
+            }
+
+    @classmethod
+    def merged(cls, states: Iterable[dict]) -> "ServerMetrics":
+        """Add up the :meth:`state` of several servers, such as the workers of a prefork server."""
+        merged = cls()
+        for state in states:
+            merged.started = min(merged.started, state["started"])
+            merged.render.merge(Histogram.from_state(state["render"]))
+            merged.latency.merge(Histogram.from_state(state["latency"]))
+            for path, data in state["paths"].items():
+                if path not in merged.paths and len(merged.paths) >= MAX_PATHS:
+                    path = "other"
+                stats = merged.paths.setdefault(path, PathStats())
+                stats.statuses.update({int(status): count for status, count in data["statuses"].items()})
+                stats.bytes_sent += data["bytes_sent"]
+                stats.render.merge(Histogram.from_state(data["render"]))
+                stats.latency.merge(Histogram.from_state(data["latency"]))
+            for client, data in state["clients"].items():
+                stats = merged.clients.get(client)
+                if stats is None:
+                    if len(merged.clients) < MAX_CLIENTS:
+                        merged.clients[client] = ClientStats(**data)
+                    continue
+                stats.requests += data["requests"]
+                stats.first_seen = min(stats.first_seen, data["first_seen"])
+                stats.last_seen = max(stats.last_seen, data["last_seen"])
+        return merged
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "requests": self.latency.total,
+                "render_seconds": self.render.summary(),
+                "latency_seconds": self.latency.summary(),
+                "paths": {
+                    path: {
+                        "requests": sum(stats.statuses.values()),
+                        "statuses": {str(status): count for status, count in sorted(stats.statuses.items())},
+                        "bytes_sent": stats.bytes_sent,
+                        "render_seconds": stats.render.summary(),
+                        "latency_seconds": stats.latency.summary(),
+                    }
+                    for path, stats in sorted(self.paths.items())
+                },
+                "clients": {client: stats.as_dict() for client, stats in sorted(self.clients.items())},
+            }
+
+    def prometheus(self) -> str:
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        with self._lock:
+            family("requests_total", "counter", "Requests served by path and status.")
+            for path, stats in sorted(self.paths.items()):
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(f'{METRIC_PREFIX}_requests_total{{path="{_escape(path)}",status="{status}"}} {count}')
+            family("response_bytes_total", "counter", "Response body bytes sent by path.")
+            for path, stats in sorted(self.paths.items()):
+                lines.append(f'{METRIC_PREFIX}_response_bytes_total{{path="{_escape(path)}"}} {stats.bytes_sent}')
+            for name, attr, help_text in (
+                ("render_seconds", "render", "Time spent building the response."),
+                ("request_seconds", "latency", "Time from request parsed to last byte written."),
+            ):
+                family(name, "histogram", help_text)
+                for path, stats in sorted(self.paths.items()):
+                    _histogram_lines(lines, f"{METRIC_PREFIX}_{name}", f'path="{_escape(path)}"', getattr(stats, attr))
+            family("client_requests_total", "counter", "Requests per identified client.")
+            for client, stats in sorted(self.clients.items()):
+                lines.append(f'{METRIC_PREFIX}_client_requests_total{{client="{_escape(client)}"}} {stats.requests}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _histogram_lines(lines: List[str], name: str, labels: str, histogram: Histogram) -> None:
+    cumulative = 0
+    for bound, count in zip(histogram.bounds, histogram.counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound:.6g}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.9g}")
+    lines.append(f"{name}_count{{{labels}}} {histogram.total}")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+SHiFT code helpers shared by the test server and the local tooling.
+
+Run as a script to dump a corpus of random codes:
+    python3 shift_codes.py --count 1000000 --seed 42 --output corpus.txt
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional, TextIO, Union
+
+try:  # Optional acceleration for very large corpora.
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is not a dependency
+    np = None
+
+# SHiFT codes use uppercase letters and numbers, but exclude some characters
+# for clarity (no 0, O, I, 1, etc.)
+CODE_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+SEGMENT_LENGTH = 5
+SEGMENT_COUNT = 5
+RAW_LENGTH = SEGMENT_LENGTH * SEGMENT_COUNT
+CODE_LENGTH = RAW_LENGTH + (SEGMENT_COUNT - 1)
+BACKENDS = ("python", "numpy")
+DEFAULT_BATCH_SIZE = 65536
+
+# Same rule as the extraction regex in background.js; re.ASCII keeps \b in line with JavaScript.
+SHIFT_CODE_PATTERN = re.compile(r"\b[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}-[A-Z0-9]{5}\b", re.ASCII)
+
+# Random bytes map onto the alphabet with one bytes.translate call. Bytes at or
+# above the largest multiple of the alphabet size are dropped so every character
+# stays equally likely.
+_ACCEPT_BELOW = 256 - 256 % len(CODE_ALPHABET)
+_BYTE_TO_CHAR = bytes(
+    CODE_ALPHABET.encode("ascii")[value % len(CODE_ALPHABET)] if value < _ACCEPT_BELOW else 0
+    for value in range(256)
+)
+_REJECTED_BYTES = bytes(range(_ACCEPT_BELOW, 256))
+
+
+def format_code(raw: str) -> str:
+    """Insert the dashes into a 25 character code body."""
+    return "-".join(raw[i:i + SEGMENT_LENGTH] for i in range(0, RAW_LENGTH, SEGMENT_LENGTH))
+
+
+def generate_shift_code(rng: random.Random = random) -> str:
+    """Generate a random SHiFT code in the format XXXXX-XXXXX-XXXXX-XXXXX-XXXXX"""
+    return format_code("".join(rng.choices(CODE_ALPHABET, k=RAW_LENGTH)))
+
+
+def _python_batches(seed: Optional[int], batch_size: int) -> Iterator[List[str]]:
+    rng = random.Random(seed)
+    pending = b""
+    needed = batch_size * RAW_LENGTH
+    while True:
+        # Roughly 3% of bytes are rejected; over-draw so one call usually suffices.
+        while len(pending) < needed:
+            pending += rng.randbytes(needed + needed // 16 + 64).translate(_BYTE_TO_CHAR, _REJECTED_BYTES)
+        text = pending[:needed].decode("ascii")
+        pending = pending[needed:]
+        yield [
+            f"{text[i:i + 5]}-{text[i + 5:i + 10]}-{text[i + 10:i + 15]}-{text[i + 15:i + 20]}-{text[i + 20:i + 25]}"
+            for i in range(0, needed, RAW_LENGTH)
+        ]
+
+
+def _numpy_batches(seed: Optional[int], batch_size: int) -> Iterator[List[str]]:
+    rng = np.random.default_rng(seed)
+    alphabet = np.frombuffer(CODE_ALPHABET.encode("ascii"), dtype=np.uint8)
+    # Each output row is "XXXXX-XXXXX-XXXXX-XXXXX-XXXXX\n": 25 code characters, 4 dashes, newline.
+    row = np.full(CODE_LENGTH + 1, ord("-"), dtype=np.uint8)
+    row[-1] = ord("\n")
+    char_columns = [column for column in range(CODE_LENGTH) if (column + 1) % (SEGMENT_LENGTH + 1)]
+    while True:
+        indices = rng.integers(0, len(alphabet), size=(batch_size, RAW_LENGTH), dtype=np.uint8)
+        rows = np.tile(row, (batch_size, 1))
+        rows[:, char_columns] = alphabet[indices]
+        yield rows.tobytes().decode("ascii").split("\n")[:-1]
+
+
+def _check_options(count: int, backend: str) -> None:
+    if count < 0:
+        raise ValueError("count must not be negative")
+    if backend not in BACKENDS:
+        raise ValueError(f"backend must be one of {', '.join(BACKENDS)}")
+    if backend == "numpy" and np is None:
+        raise RuntimeError("The numpy backend needs numpy installed (pip install numpy)")
+
+
+def iter_shift_codes(
+    count: int,
+    seed: Optional[int] = None,
+    *,
+    unique: bool = True,
+    backend: str = "python",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> Iterator[str]:
+    """Yield ``count`` random codes, generated in batches from blocks of random bytes.
+
+    The same ``seed`` and ``backend`` always give the same sequence; the python and
+    numpy backends draw differently, so a corpus is only reproducible per backend.
+    With ``unique`` every code is yielded once, at the cost of remembering them all.
+    """
+    _check_options(count, backend)
+    batches = _numpy_batches if backend == "numpy" else _python_batches
+    if count == 0:
+        return
+    seen = set() if unique else None
+    remaining = count
+    for batch in batches(seed, max(1, min(batch_size, count))):
+        if seen is not None:
+            fresh = []
+            for code in batch:
+                if code not in seen:
+                    seen.add(code)
+                    fresh.append(code)
+            batch = fresh
+        if len(batch) > remaining:
+            batch = batch[:remaining]
+        remaining -= len(batch)
+        yield from batch
+        if remaining <= 0:
+            return
+
+
+def generate_shift_codes(count: int, seed: Optional[int] = None, **options) -> List[str]:
+    """Bulk version of :func:`generate_shift_code`; see :func:`iter_shift_codes` for options."""
+    return list(iter_shift_codes(count, seed, **options))
+
+
+@contextmanager
+def _open_output(output: Union[str, Path, TextIO]) -> Iterator[TextIO]:
+    if hasattr(output, "write"):
+        yield output
+    elif str(output) == "-":
+        yield sys.stdout
+    else:
+        with open(output, "w", encoding="ascii", newline="\n") as handle:
+            yield handle
+
+
+def write_shift_codes(
+    output: Union[str, Path, TextIO],
+    count: int,
+    seed: Optional[int] = None,
+    *,
+    fmt: str = "text",
+    **options,
+) -> int:
+    """Stream ``count`` codes to a path, ``-`` for stdout, or an open text stream.
+
+    ``text`` writes one code per line; ``json`` writes a JSON array. Returns the
+    number of codes written.
+    """
+    if fmt not in ("text", "json"):
+        raise ValueError("fmt must be 'text' or 'json'")
+    _check_options(count, options.get("backend", "python"))
+    written = 0
+    pending: List[str] = []
+    with _open_output(output) as stream:
+        if fmt == "json":
+            stream.write("[")
+        for code in iter_shift_codes(count, seed, **options):
+            pending.append(f'"{code}"' if fmt == "json" else code)
+            if len(pending) >= DEFAULT_BATCH_SIZE:
+                stream.write(("," if fmt == "json" and written else "") + _join(pending, fmt))
+                written += len(pending)
+                pending = []
+        if pending:
+            stream.write(("," if fmt == "json" and written else "") + _join(pending, fmt))
+            written += len(pending)
+        if fmt == "json":
+            stream.write("]\n")
+    return written
+
+
+def _join(codes: List[str], fmt: str) -> str:
+    return ",".join(codes) if fmt == "json" else "\n".join(codes) + "\n"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Dump a corpus of random SHiFT codes.")
+    parser.add_argument("--count", "-n", type=int, required=True, help="Number of codes to generate")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for a reproducible corpus")
+    parser.add_argument("--output", "-o", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--format", choices=("text", "json"), default="text", help="One code per line, or a JSON array")
+    parser.add_argument("--backend", choices=BACKENDS, default="python", help="Random source (numpy must be installed)")
+    parser.add_argument("--allow-duplicates", action="store_true", help="Skip the uniqueness check to save memory")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    try:
+        written = write_shift_codes(
+            args.output,
+            args.count,
+            args.seed,
+            fmt=args.format,
+            unique=not args.allow_duplicates,
+            backend=args.backend,
+        )
+    except (RuntimeError, ValueError) as exc:
+        sys.stderr.write(f"Error: {exc}\n")
+        return 1
+    if args.output != "-":
+        print(f"✅ Wrote {written} codes to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
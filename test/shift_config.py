@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Read the games, platforms and default source URLs from shift-config.js.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+SHIFT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "shift-config.js"
+
+# A string literal (left untouched) or a bare object key that needs quoting for JSON.
+_TOKEN = re.compile(r'("(?:[^"\\]|\\.)*")|([A-Za-z_$][\w$]*)(\s*:)')
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+
+
+@dataclass(frozen=True)
+class GameConfig:
+    id: str
+    label: str
+    default_urls: List[str]
+
+
+def _object_literal(source: str) -> str:
+    start = source.index("{", source.index("SHIFT_CONFIG"))
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(source)):
+        char = source[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return source[start:index + 1]
+    raise ValueError("Unterminated SHIFT_CONFIG object")
+
+
+def load_shift_config(path: Path = SHIFT_CONFIG_PATH) -> dict:
+    """Parse the ``SHIFT_CONFIG`` object literal into plain Python data."""
+    literal = _object_literal(Path(path).read_text(encoding="utf-8"))
+    as_json = _TOKEN.sub(lambda match: match.group(1) or f'"{match.group(2)}"{match.group(3)}', literal)
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", as_json))
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Unable to parse {path}: {exc}") from exc
+
+
+def load_games(path: Path = SHIFT_CONFIG_PATH) -> List[GameConfig]:
+    return [
+        GameConfig(game["id"], game["label"], list(game.get("defaultUrls", [])))
+        for game in load_shift_config(path).get("games", [])
+    ]
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Simulated SHiFT code sources mirroring the game list in shift-config.js.
+
+Every default URL of every game is mounted at its own path (so
+``https://mentalmars.com/game-news/borderlands-3-golden-keys/`` becomes
+``/game-news/borderlands-3-golden-keys/``). Each game publishes a new code every
+``rotation`` seconds that stays valid for ``lifetime`` seconds; a source lists a
+``coverage`` share of its game's codes, plus the universal codes every game
+shares, ``lag`` seconds after they are published and only refreshes its page
+every ``update_interval`` seconds. Sources of the same game therefore overlap
+without being identical, which is what cross-source dedup has to cope with.
+
+Codes are a pure function of the seed and the clock, so two servers with the
+same configuration serve the same pages at the same time. A ``timeline`` of
+scripted codes can be layered on top (or replace the generated schedule), and
+with a :class:`~virtual_clock.VirtualClock` weeks of churn replay in seconds.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import random
+import time
+from dataclasses import asdict, dataclass, field, fields, replace
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from shift_codes import generate_shift_code
+from shift_config import SHIFT_CONFIG_PATH, GameConfig, load_games
+from virtual_clock import parse_duration
+
+UNIVERSAL_STREAM = "universal"
+# What each source setting accepts; durations may also be strings such as "30m".
+_SETTING_KINDS = {
+    "rotation": "a duration",
+    "lifetime": "a duration",
+    "update_interval": "a duration",
+    "lag": "a duration",
+    "coverage": "a number",
+    "expired": "an integer",
+}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _settings(name: str, value) -> Dict[str, float]:
+    """Check one block of source settings, reading durations into seconds."""
+    if not isinstance(value, dict):
+        raise ValueError(f"{name} must be an object of source settings")
+    unknown = set(value) - set(_SETTING_KINDS)
+    if unknown:
+        raise ValueError(f"Unknown source settings in {name}: {', '.join(sorted(unknown))}")
+    settings: Dict[str, float] = {}
+    for key, setting in value.items():
+        kind = _SETTING_KINDS[key]
+        if kind == "a duration" and (_is_number(setting) or isinstance(setting, str)):
+            try:
+                settings[key] = parse_duration(setting)
+            except ValueError as exc:
+                raise ValueError(f"{name}.{key}: {exc}") from exc
+        elif kind == "a number" and _is_number(setting):
+            settings[key] = float(setting)
+        elif kind == "an integer" and isinstance(setting, int) and not isinstance(setting, bool):
+            settings[key] = setting
+        else:
+            raise ValueError(f"{name}.{key} must be {kind}, got {setting!r}")
+    try:
+        SourceSettings().merged(settings)
+    except ValueError as exc:
+        raise ValueError(f"{name}: {exc}") from exc
+    return settings
+
+
+@dataclass(frozen=True)
+class SourceSettings:
+    """Publication schedule of one source; all times are in seconds."""
+
+    rotation: float = 1800.0
+    lifetime: float = 6 * 3600.0
+    update_interval: float = 300.0
+    lag: float = 0.0
+    coverage: float = 0.85
+    expired: int = 5
+
+    def validate(self) -> None:
+        if self.rotation <= 0 or self.lifetime <= 0:
+            raise ValueError("rotation and lifetime must be positive")
+        if self.update_interval < 0 or self.lag < 0 or self.expired < 0:
+            raise ValueError("update_interval, lag and expired cannot be negative")
+        if not 0 <= self.coverage <= 1:
+            raise ValueError("coverage must be between 0 and 1")
+
+    def merged(self, overrides: Dict[str, float]) -> "SourceSettings":
+        unknown = set(overrides) - {item.name for item in fields(self)}
+        if unknown:
+            raise ValueError(f"Unknown source settings: {', '.join(sorted(unknown))}")
+        settings = replace(self, **overrides)
+        settings.validate()
+        return settings
+
+
+@dataclass
+class SourceConfig:
+    """Simulation settings, loadable from JSON.
+
+    ``defaults`` applies to every source, ``games`` overrides it per game id and
+    ``sources`` per source URL or path. ``universal`` schedules codes that every
+    game's sources list (``null`` turns them off).
+
+    ``timeline`` scripts individual codes as ``{"code", "appear", "expire",
+    "games", "sources"}``: times are durations after the clock's start (``90``,
+    ``12h``, ``3d``), a code without ``expire`` never expires, and without
+    ``games``/``sources`` it is listed everywhere. An expired code moves to the
+    expired section until newer ones push it out. ``generate: false`` serves
+    only the timeline.
+    """
+
+    defaults: Dict[str, float] = field(default_factory=dict)
+    games: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    sources: Dict[str, Dict[str, float]] = field(default_factory=dict)
+    universal: Optional[Dict[str, float]] = field(default_factory=lambda: {"rotation": 86400.0, "lifetime": 3 * 86400.0})
+    timeline: List[dict] = field(default_factory=list)
+    generate: bool = True
+    seed: int = 0
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SourceConfig":
+        if not isinstance(data, dict):
+            raise ValueError("Source config must be a JSON object")
+        unknown = set(data) - set(cls.__dataclass_fields__)
+        if unknown:
+            raise ValueError(f"Unknown source config keys: {', '.join(sorted(unknown))}")
+        data = dict(data)
+        if "defaults" in data:
+            data["defaults"] = _settings("defaults", data["defaults"])
+        for name in ("games", "sources"):
+            if name in data:
+                if not isinstance(data[name], dict):
+                    raise ValueError(f"{name} must map ids to objects of source settings")
+                data[name] = {key: _settings(f"{name}.{key}", value) for key, value in data[name].items()}
+        if data.get("universal") is not None:
+            data["universal"] = _settings("universal", data["universal"])
+        if not isinstance(data.get("timeline", []), list):
+            raise ValueError("timeline must be a list of codes")
+        if not isinstance(data.get("generate", True), bool):
+            raise ValueError("generate must be true or false")
+        seed = data.get("seed", 0)
+        if not isinstance(seed, int) or isinstance(seed, bool):
+            raise ValueError(f"seed must be an integer, got {seed!r}")
+        config = cls(**data)
+        config.events()
+        return config
+
+    def events(self) -> List["TimelineEvent"]:
+        events = []
+        for entry in self.timeline:
+            if not isinstance(entry, dict):
+                raise ValueError(f"Timeline entries must be objects: {entry!r}")
+            unknown = set(entry) - {"code", "appear", "expire", "games", "sources"}
+            if unknown or "code" not in entry:
+                raise ValueError(f"Timeline entries need a 'code' and may only set appear/expire/games/sources: {entry}")
+            appear = parse_duration(entry.get("appear", 0))
+            expire = parse_duration(entry["expire"]) if entry.get("expire") is not None else None
+            if expire is not None and expire < appear:
+                raise ValueError(f"Timeline code {entry['code']} expires before it appears")
+            events.append(TimelineEvent(
+                entry["code"],
+                appear,
+                expire,
+                tuple(entry["games"]) if entry.get("games") else None,
+                frozenset(entry["sources"]) if entry.get("sources") else None,
+            ))
+        return sorted(events, key=lambda event: event.appear)
+
+    @classmethod
+    def load(cls, path: Path) -> "SourceConfig":
+        try:
+            return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Unable to parse {path}: {exc}") from exc
+
+
+@dataclass(frozen=True)
+class TimelineEvent:
+    code: str
+    appear: float
+    expire: Optional[float]
+    games: Optional[Tuple[str, ...]]
+    sources: Optional[frozenset]
+
+
+@dataclass(frozen=True)
+class SimulatedSource:
+    game_id: str
+    game_label: str
+    url: str
+    path: str
+    settings: SourceSettings
+    phase: float
+
+
+@dataclass(frozen=True)
+class SourceSnapshot:
+    """What a source's page shows at one moment; ``updated_at`` only moves when the page changes."""
+
+    active: Tuple[str, ...]
+    expired: Tuple[str, ...]
+    updated_at: float
+
+
+@lru_cache(maxsize=65536)
+def _stream_code(seed: int, stream: str, index: int) -> str:
+    return generate_shift_code(random.Random(f"{seed}:{stream}:{index}"))
+
+
+def _listed(seed: int, url: str, stream: str, index: int, coverage: float) -> bool:
+    return coverage >= 1 or random.Random(f"{seed}:{url}:{stream}:{index}").random() < coverage
+
+
+class SourceSimulator:
+    """The simulated sources by mount path, with their codes at any point in time."""
+
+    def __init__(
+        self,
+        sources: List[SimulatedSource],
+        config: SourceConfig,
+        clock: Callable[[], float] = time.time,
+        origin: Optional[float] = None,
+    ) -> None:
+        self.sources = {source.path: source for source in sources}
+        self.config = config
+        self.clock = clock
+        self.origin = clock() if origin is None else origin
+        self.universal = SourceSettings().merged(config.universal) if config.universal else None
+        # Timeline events per game, ordered by when they appear.
+        self._timeline: Dict[str, List[TimelineEvent]] = {source.game_id: [] for source in sources}
+        for event in config.events():
+            for game_id in event.games or self._timeline:
+                if game_id not in self._timeline:
+                    raise ValueError(f"Unknown game '{game_id}' in timeline entry for {event.code}")
+                self._timeline[game_id].append(event)
+        self._snapshots: Dict[str, Tuple[float, SourceSnapshot]] = {}
+
+    @classmethod
+    def from_shift_config(
+        cls,
+        config: Optional[SourceConfig] = None,
+        path: Path = SHIFT_CONFIG_PATH,
+        clock: Callable[[], float] = time.time,
+        origin: Optional[float] = None,
+    ) -> "SourceSimulator":
+        config = config or SourceConfig()
+        games: List[GameConfig] = load_games(path)
+        unknown_games = set(config.games) - {game.id for game in games}
+        if unknown_games:
+            raise ValueError(f"Unknown games in source config: {', '.join(sorted(unknown_games))}")
+        defaults = SourceSettings().merged(config.defaults)
+        sources: List[SimulatedSource] = []
+        for game in games:
+            game_settings = defaults.merged(config.games.get(game.id, {}))
+            for url in game.default_urls:
+                mount = urlsplit(url).path or "/"
+                overrides = config.sources.get(url, config.sources.get(mount, {}))
+                settings = game_settings.merged(overrides)
+                phase = random.Random(f"{config.seed}:{url}:phase").uniform(0, settings.update_interval)
+                sources.append(SimulatedSource(game.id, game.label, url, mount, settings, phase))
+        mounts = [source.path for source in sources]
+        duplicates = {mount for mount in mounts if mounts.count(mount) > 1}
+        if duplicates:
+            raise ValueError(f"Several sources share a path: {', '.join(sorted(duplicates))}")
+        known = set(mounts) | {source.url for source in sources}
+        unknown_sources = set(config.sources) - known
+        if unknown_sources:
+            raise ValueError(f"Unknown sources in source config: {', '.join(sorted(unknown_sources))}")
+        return cls(sources, config, clock, origin)
+
+    def get(self, path: str) -> Optional[SimulatedSource]:
+        source = self.sources.get(path)
+        if source is None and path != "/":
+            # Tolerate a missing or extra trailing slash, as the real sites redirect either way.
+            source = self.sources.get(path[:-1] if path.endswith("/") else path + "/")
+        return source
+
+    def snapshot(self, source: SimulatedSource, now: Optional[float] = None) -> SourceSnapshot:
+        now = self.clock() if now is None else now
+        settings = source.settings
+        seen = now - settings.lag
+        if settings.update_interval > 0:
+            # The page only changes at its own update ticks.
+            seen = math.floor((seen - source.phase) / settings.update_interval) * settings.update_interval + source.phase
+            cached = self._snapshots.get(source.path)
+            if cached is not None and cached[0] == seen:
+                return cached[1]
+        streams = []
+        if self.config.generate:
+            streams.append((source.game_id, settings))
+            if self.universal is not None:
+                streams.append((UNIVERSAL_STREAM, replace(self.universal, coverage=settings.coverage)))
+        active: List[Tuple[float, str]] = []
+        expired: List[Tuple[float, str]] = []
+        for event in self._timeline.get(source.game_id, ()):
+            appear = self.origin + event.appear
+            if appear > seen:
+                break
+            if event.sources is not None and not {source.url, source.path} & event.sources:
+                continue
+            if event.expire is None or seen < self.origin + event.expire:
+                active.append((appear, event.code))
+            else:
+                expired.append((appear, event.code))
+        for stream, schedule in streams:
+            newest = math.floor(seen / schedule.rotation)
+            oldest_active = math.floor((seen - schedule.lifetime) / schedule.rotation) + 1
+            for index in range(oldest_active - settings.expired, newest + 1):
+                if not _listed(self.config.seed, source.url, stream, index, schedule.coverage):
+                    continue
+                published = index * schedule.rotation
+                entry = (published, _stream_code(self.config.seed, stream, index))
+                (active if index >= oldest_active else expired).append(entry)
+        active.sort(reverse=True)
+        expired.sort(reverse=True)
+        snapshot = SourceSnapshot(
+            tuple(code for _, code in active),
+            tuple(code for _, code in expired[:settings.expired]),
+            seen + settings.lag,
+        )
+        if settings.update_interval > 0:
+            self._snapshots[source.path] = (seen, snapshot)
+        return snapshot
+
+    def describe(self, now: Optional[float] = None) -> List[dict]:
+        now = self.clock() if now is None else now
+        described = []
+        for source in self.sources.values():
+            snapshot = self.snapshot(source, now)
+            described.append({
+                "game": source.game_id,
+                "url": source.url,
+                "path": source.path,
+                "settings": asdict(source.settings),
+                "active": list(snapshot.active),
+                "expired": list(snapshot.expired),
+                "updated_at": snapshot.updated_at,
+            })
+        return described
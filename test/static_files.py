@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Static file serving for the test server, such as the ``saves/*.html`` snapshots
+and large generated fixtures.
+
+Files up to ``small_file_limit`` bytes are kept in memory in an LRU capped at
+``cache_bytes``; larger files are sent with ``os.sendfile``. Responses carry
+``ETag``/``Last-Modified``/``Cache-Control``, conditional requests get a 304 and
+a single byte range is answered with a 206 (RFC 9110 section 14). With an
+encoder, text files are sent gzip/brotli encoded to clients that accept it.
+"""
+
+from __future__ import annotations
+
+import html
+import mimetypes
+import os
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, unquote, urlsplit, urlunsplit
+
+from content_encoding import ContentEncoder, encoded_etag, is_compressible
+
+from server_core import (
+    FileBody,
+    Request,
+    Response,
+    is_not_modified,
+    resolve_static_path,
+    text_response,
+    validator_headers,
+)
+
+SMALL_FILE_LIMIT = 64 * 1024
+CACHE_BYTES = 16 * 1024 * 1024
+MAX_AGE = 60
+PRECOMPRESSED_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+
+
+@dataclass(frozen=True)
+class _CachedFile:
+    size: int
+    mtime_ns: int
+    inode: int
+    data: bytes
+    # Encoded variants by content coding, filled on first use.
+    variants: Dict[str, bytes] = field(default_factory=dict, compare=False)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Return the inclusive ``(first, last)`` byte positions of a single ``bytes=`` range.
+
+    ``None`` means the header is ignored and the whole file is sent, which covers
+    malformed and multi-range headers; a :class:`ValueError` means the range lies
+    beyond the end of the file.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, dash, last = spec.strip().partition("-")
+    if not dash or not (first or last) or not (first + last).isdigit():
+        return None
+    if not first:
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Range starts beyond the end of the file")
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def _if_range_matches(value: str, etag: str, last_modified: float) -> bool:
+    if value.startswith('"') or value.startswith("W/"):
+        return value == etag
+    try:
+        return int(parsedate_to_datetime(value).timestamp()) == int(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+class StaticFiles:
+    """Serves files below ``root`` with validators, byte ranges and a size-capped LRU of small files."""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        max_age: int = MAX_AGE,
+        cache_bytes: int = CACHE_BYTES,
+        small_file_limit: int = SMALL_FILE_LIMIT,
+        encoder: Optional[ContentEncoder] = None,
+    ) -> None:
+        self.root = root
+        self.encoder = encoder
+        self.max_age = max_age
+        self.cache_bytes = cache_bytes
+        self.small_file_limit = small_file_limit
+        self._cache: "OrderedDict[Path, _CachedFile]" = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Counter = Counter()
+
+    def response(self, request: Request) -> Response:
+        path = resolve_static_path(self.root, request.path)
+        if path is None:
+            return text_response(404, "File not found\n")
+        if path.is_dir():
+            return self._listing(request, path)
+        stat = path.stat()
+        content_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        # Ranges address the identity bytes, so a range request is never encoded.
+        encoding = None
+        if self.encoder is not None and not request.headers.get("Range"):
+            encoding = self.encoder.negotiate(request, content_type, stat.st_size)
+        etag = encoded_etag(f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"', encoding)
+        headers = [
+            ("Accept-Ranges", "bytes"),
+            ("Cache-Control", f"public, max-age={self.max_age}" if self.max_age > 0 else "no-cache"),
+            *validator_headers(etag, stat.st_mtime),
+        ]
+        if self.encoder is not None and is_compressible(content_type):
+            headers.append(("Vary", "Accept-Encoding"))
+        if is_not_modified(request, etag, stat.st_mtime):
+            with self._lock:
+                self.stats["not_modified"] += 1
+            return Response(304, headers)
+        headers.append(("Content-Type", content_type))
+        if encoding is not None:
+            headers.append(("Content-Encoding", encoding))
+            return self._encoded_response(path, stat, encoding, headers)
+        first, last, status = 0, stat.st_size - 1, 200
+        range_header = request.headers.get("Range")
+        if_range = request.headers.get("If-Range")
+        use_range = not if_range or _if_range_matches(if_range, etag, stat.st_mtime)
+        if range_header and request.method == "GET" and use_range:
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                with self._lock:
+                    self.stats["unsatisfiable"] += 1
+                return Response(416, [("Content-Range", f"bytes */{stat.st_size}"), *headers])
+            if byte_range is not None:
+                first, last = byte_range
+                status = 206
+                headers.append(("Content-Range", f"bytes {first}-{last}/{stat.st_size}"))
+        with self._lock:
+            self.stats["partial" if status == 206 else "full"] += 1
+        if stat.st_size > self.small_file_limit:
+            if request.method != "HEAD":
+                with self._lock:
+                    self.stats["sendfile"] += 1
+            return Response(status, headers, FileBody(path, first, last - first + 1))
+        data = self._read_small(path, stat).data
+        return Response(status, headers, data[first:last + 1] if status == 206 else data)
+
+    def _listing(self, request: Request, directory: Path) -> Response:
+        """An HTML index of a directory without ``index.html``, like ``SimpleHTTPRequestHandler`` gives."""
+        parts = urlsplit(request.target)
+        if not parts.path.endswith("/"):
+            location = urlunsplit(("", "", parts.path + "/", parts.query, ""))
+            return Response(301, [("Location", location)])
+        try:
+            names = sorted(os.listdir(directory), key=str.lower)
+        except OSError:
+            return text_response(404, "No permission to list directory\n")
+        with self._lock:
+            self.stats["listings"] += 1
+        title = html.escape(unquote(parts.path), quote=False)
+        items = []
+        for name in names:
+            shown = name + "/" if (directory / name).is_dir() else name
+            items.append(f'<li><a href="{quote(shown)}">{html.escape(shown, quote=False)}</a></li>')
+        body = (
+            f'<!DOCTYPE HTML>\n<html lang="en">\n<head>\n<meta charset="utf-8">\n'
+            f"<title>Directory listing for {title}</title>\n</head>\n<body>\n"
+            f"<h1>Directory listing for {title}</h1>\n<hr>\n<ul>\n" + "\n".join(items) + "\n</ul>\n<hr>\n</body>\n</html>\n"
+        )
+        return Response(200, [("Content-Type", "text/html; charset=utf-8"), ("Cache-Control", "no-cache")], body.encode("utf-8"))
+
+    def _encoded_response(self, path: Path, stat: os.stat_result, encoding: str, headers: list) -> Response:
+        """Send ``path`` encoded, compressing it as little as possible.
+
+        Small files are encoded once and kept with their cache entry; large ones use a
+        precompressed ``<name>.gz``/``<name>.br`` sibling that is at least as new, or
+        are compressed while they stream.
+        """
+        with self._lock:
+            self.stats["full"] += 1
+        if stat.st_size <= self.small_file_limit:
+            entry = self._read_small(path, stat)
+            return Response(200, headers, self.encoder.encode_cached(entry.variants, entry.data, encoding))
+        sibling = path.with_name(path.name + PRECOMPRESSED_SUFFIXES[encoding])
+        try:
+            if sibling.stat().st_mtime_ns >= stat.st_mtime_ns:
+                with self._lock:
+                    self.stats["precompressed"] += 1
+                return Response(200, headers, FileBody(sibling))
+        except OSError:
+            pass
+        return Response(200, headers, self.encoder.encode_stream(FileBody(path), encoding))
+
+    def _read_small(self, path: Path, stat: os.stat_result) -> _CachedFile:
+        with self._lock:
+            cached = self._cache.get(path)
+            if cached is not None and (cached.size, cached.mtime_ns, cached.inode) == (
+                stat.st_size,
+                stat.st_mtime_ns,
+                stat.st_ino,
+            ):
+                self._cache.move_to_end(path)
+                self.stats["hits"] += 1
+                return cached
+        data = path.read_bytes()
+        entry = _CachedFile(len(data), stat.st_mtime_ns, stat.st_ino, data)
+        with self._lock:
+            self.stats["misses"] += 1
+            previous = self._cache.pop(path, None)
+            if previous is not None:
+                self._cached_bytes -= previous.size
+            if entry.size <= self.cache_bytes:
+                self._cache[path] = entry
+                self._cached_bytes += entry.size
+            while self._cached_bytes > self.cache_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cached_bytes -= evicted.size
+                self.stats["evictions"] += 1
+        return entry
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "files": len(self._cache),
+                "cached_bytes": self._cached_bytes,
+                "cache_bytes": self.cache_bytes,
+                **self.stats,
+            }
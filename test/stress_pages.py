@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Streamed stress pages with many SHiFT codes for benchmarking code extraction.
+
+A page is described by a :class:`StressPageSpec` and produced chunk by chunk, so
+even a 100k-code page with lots of filler never exists in memory as a whole.
+The same spec always yields the same page and the same expected code list.
+"""
+
+from __future__ import annotations
+
+import random
+from dataclasses import asdict, dataclass, fields
+from typing import Iterator, List, Mapping
+
+from shift_codes import CODE_ALPHABET, generate_shift_code, iter_shift_codes
+
+MAX_CODES = 100_000
+MAX_FILLER = 64 * 1024
+CHUNK_SIZE = 64 * 1024
+PLACEMENTS = ("div", "attribute", "table", "mixed")
+
+_FILLER_WORDS = (
+    "vault hunter loot legendary golden keys reward weekly shift event "
+    "redeem platform borderlands pandora moxxi claptrap guide patch notes"
+).split()
+
+
+@dataclass(frozen=True)
+class StressPageSpec:
+    codes: int = 100
+    expired: int = 0
+    filler: int = 0
+    placement: str = "mixed"
+    near_miss: float = 0.0
+    repeat: float = 0.0
+    seed: int = 0
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.codes <= MAX_CODES:
+            raise ValueError(f"codes must be between 0 and {MAX_CODES}")
+        if not 0 <= self.expired <= MAX_CODES:
+            raise ValueError(f"expired must be between 0 and {MAX_CODES}")
+        if not 0 <= self.filler <= MAX_FILLER:
+            raise ValueError(f"filler must be between 0 and {MAX_FILLER} bytes")
+        if self.placement not in PLACEMENTS:
+            raise ValueError(f"placement must be one of {', '.join(PLACEMENTS)}")
+        if not 0 <= self.near_miss <= 16:
+            raise ValueError("near_miss must be between 0 and 16 per code")
+        if not 0 <= self.repeat < 1:
+            raise ValueError("repeat must be a fraction in [0, 1)")
+
+    @classmethod
+    def from_query(cls, query: Mapping[str, List[str]]) -> "StressPageSpec":
+        """Build a spec from parsed query parameters, e.g. ``?codes=5000&filler=2048``."""
+        values = {}
+        for spec_field in fields(cls):
+            raw = query.get(spec_field.name)
+            if not raw:
+                continue
+            converter = {"int": int, "float": float, "str": str}[spec_field.type]
+            try:
+                values[spec_field.name] = converter(raw[-1])
+            except ValueError as exc:
+                raise ValueError(f"Invalid value for {spec_field.name}: {raw[-1]!r}") from exc
+        return cls(**values)
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def iter_page_codes(spec: StressPageSpec) -> Iterator[str]:
+    """Unique active codes of the page followed by its unique expired codes, in page order."""
+    return iter_shift_codes(spec.codes + spec.expired, spec.seed)
+
+
+def near_miss(rng: random.Random) -> str:
+    """A string that looks like a SHiFT code but must not match the extraction regex."""
+    code = generate_shift_code(rng)
+    kind = rng.randrange(5)
+    if kind == 0:
+        return code.lower()
+    if kind == 1:
+        return code[:-1]
+    if kind == 2:
+        return rng.choice(CODE_ALPHABET) + code
+    if kind == 3:
+        return code.replace("-", "–")
+    return code.replace("-", " - ", 1)
+
+
+def _filler_block(size: int, rng: random.Random) -> str:
+    if size <= 0:
+        return ""
+    words: List[str] = []
+    length = 0
+    while length < size:
+        word = rng.choice(_FILLER_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    text = " ".join(words)[:size]
+    return f'<p class="filler"><span>{text}</span></p>\n'
+
+
+def _place(code: str, placement: str, index: int) -> str:
+    if placement == "div":
+        return f'<div class="code new">{code}</div>\n'
+    if placement == "attribute":
+        return f'<a class="copy" data-code="{code}" href="/redeem?code={code}" title="{code}">Copy code</a>\n'
+    return f"<tr><td>{index + 1}</td><td>{code}</td><td>Golden Key</td></tr>\n"
+
+
+class _ChunkBuffer:
+    def __init__(self, size: int = CHUNK_SIZE) -> None:
+        self.size = size
+        self.parts: List[str] = []
+        self.length = 0
+
+    def add(self, text: str) -> bool:
+        self.parts.append(text)
+        self.length += len(text)
+        return self.length >= self.size
+
+    def take(self) -> bytes:
+        data = "".join(self.parts).encode("utf-8")
+        self.parts = []
+        self.length = 0
+        return data
+
+
+def _iter_section(
+    title: str,
+    codes: Iterator[str],
+    count: int,
+    spec: StressPageSpec,
+    rng: random.Random,
+    filler: str,
+    buffer: _ChunkBuffer,
+) -> Iterator[bytes]:
+    placements = PLACEMENTS[:3] if spec.placement == "mixed" else (spec.placement,)
+    emitted: List[str] = []
+    table_open = False
+    if buffer.add(f"<h2>{title}</h2>\n"):
+        yield buffer.take()
+    for index in range(count):
+        code = next(codes)
+        emitted.append(code)
+        placement = placements[index % len(placements)]
+        markup = []
+        if placement == "table" and not table_open:
+            markup.append('<table class="codes"><tbody>\n')
+            table_open = True
+        elif placement != "table" and table_open:
+            markup.append("</tbody></table>\n")
+            table_open = False
+        whole, fraction = divmod(spec.near_miss, 1)
+        misses = int(whole) + (1 if rng.random() < fraction else 0)
+        for _ in range(misses):
+            markup.append(f"<span class=\"hint\">Not a code: {near_miss(rng)}</span>\n")
+        markup.append(_place(code, placement, index))
+        if spec.repeat and rng.random() < spec.repeat:
+            markup.append(_place(rng.choice(emitted), placement, index))
+        if filler and placement != "table":
+            markup.append(filler)
+        if buffer.add("".join(markup)):
+            yield buffer.take()
+    if table_open:
+        buffer.add("</tbody></table>\n")
+
+
+def iter_stress_page(spec: StressPageSpec) -> Iterator[bytes]:
+    """Yield the page as UTF-8 chunks of roughly ``CHUNK_SIZE`` bytes."""
+    layout_rng = random.Random(f"{spec.seed}-layout")
+    codes = iter_page_codes(spec)
+    filler = _filler_block(spec.filler, layout_rng)
+    buffer = _ChunkBuffer()
+    buffer.add(
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"UTF-8\">\n"
+        f"<title>Stress SHiFT Codes - {spec.codes} codes</title>\n</head>\n<body>\n"
+        f"<h1>Stress page ({spec.codes} active, {spec.expired} expired, seed {spec.seed})</h1>\n"
+    )
+    yield from _iter_section("Active Codes", codes, spec.codes, spec, layout_rng, filler, buffer)
+    yield from _iter_section("Expired Codes", codes, spec.expired, spec, layout_rng, filler, buffer)
+    buffer.add("</body>\n</html>\n")
+    yield buffer.take()
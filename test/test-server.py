@@ -1,16 +1,44 @@
 #!/usr/bin/env python3
 """
 Simple HTTP server to serve a test page with SHiFT codes for testing notifications
-Run with: python3 test-server.py
+Run with: python3 test-server.py [--mode single|threaded|asyncio] [--workers N] [--processes N] [--port PORT]
 """
 
-import http.server
-import socketserver
+import argparse
+import json
 import os
 import sys
 import random
-import string
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
 from datetime import datetime
+from email.message import Message
+from pathlib import Path
+
+from server_core import (
+    SERVER_MODES,
+    Request,
+    Response,
+    is_not_modified,
+    json_response,
+    make_etag,
+    make_server,
+    text_response,
+    validator_headers,
+)
+from content_encoding import BROTLI_QUALITY, GZIP_LEVEL, ContentEncoder, encoded_etag
+from faults import FaultConfig, FaultInjector
+from mock_shift import MockConfig, MockShiftBackend
+from page_archive import PageArchive
+from prefork import GRACE_SECONDS, AdminJournal, PreforkServer, SharedStats
+from server_metrics import ServerMetrics, tag_client
+from shift_codes import generate_shift_codes
+from source_simulator import SourceConfig, SourceSimulator
+from static_files import CACHE_BYTES, MAX_AGE, StaticFiles
+from virtual_clock import VirtualClock, parse_duration, parse_time
+from stress_pages import StressPageSpec, iter_page_codes, iter_stress_page
 
 PORT = 8000
 USE_FIXED_CODES = True
@@ -22,41 +50,17 @@ codes = [
     "TZFT3-K9Z33-5FT3W-BJ33T-WZ5X5"
 ]
 
-def generate_shift_code():
-
-    """Generate a random SHiFT code in the format XXXXX-XXXXX-XXXXX-XXXXX-XXXXX"""
-    def random_segment():
-        # SHiFT codes use uppercase letters and numbers, but exclude some characters
-        # for clarity (no 0, O, I, 1, etc.)
-        chars = 'ABCDEFGHJKMNPQRSTUVWXYZ23456789'
-        return ''.join(random.choice(chars) for _ in range(5))
-    
-    return '-'.join(random_segment() for _ in range(5))
+DEFAULT_TITLE = "Borderlands 4"
+DEFAULT_TEMPLATE = "default"
+REGEN_INTERVAL = 60.0
 
-def generate_test_html():
-    """Generate HTML with random SHiFT codes"""
-    
-    if USE_FIXED_CODES:
-        active_codes = codes
-    else:
-        # Generate 3-5 random codes each time
-        num_codes = random.randint(3, 5)
-        active_codes = [generate_shift_code() for _ in range(num_codes)]
-    
-    # Generate 1-2 expired codes
-    expired_codes = [generate_shift_code() for _ in range(random.randint(1, 2))]
-    
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    active_codes_html = '\n    '.join([f'<div class="code new">{code}</div>' for code in active_codes])
-    expired_codes_html = '\n    '.join([f'<div class="code expired">{code}</div>' for code in expired_codes])
-    
-    return f"""
+PAGE_TEMPLATES = {
+    DEFAULT_TEMPLATE: """
 <!DOCTYPE html>
 <html lang="en">
 <head>
     <meta charset="UTF-8">
-    <title>Test SHiFT Codes - Borderlands 4</title>
+    <title>Test SHiFT Codes - {title}</title>
     <style>
         body {{ font-family: Arial, sans-serif; margin: 40px; }}
         h1 {{ color: #007cba; }}
@@ -73,7 +77,7 @@ def generate_test_html():
     </style>
 </head>
 <body>
-    <h1>Test SHiFT Codes for Borderlands 4</h1>
+    <h1>Test SHiFT Codes for {title}</h1>
     <p>This is a test page for notification testing with randomly generated codes.</p>
     
     <h2>Active Codes</h2>
@@ -82,37 +86,473 @@ def generate_test_html():
     <h2>Expired Codes (for reference)</h2>
     {expired_codes_html}
     
-    <p><em>Updated: {current_time} (codes regenerated on each request)</em></p>
+    <p><em>Updated: {current_time} ({regen_note})</em></p>
 </body>
 </html>
-"""
+""",
+}
 
-class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        if self.path == '/' or self.path == '/index.html':
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html')
-            self.end_headers()
-            # Generate fresh HTML with random codes on each request
-            html_content = generate_test_html()
-            self.wfile.write(html_content.encode('utf-8'))
-        else:
-            super().do_GET()
+def pick_page_codes(rng=None):
+    """Choose the active and expired codes for a new page variant, reproducibly when given an rng"""
+    draw = rng or random
+    seed = rng.getrandbits(64) if rng else None
+    if USE_FIXED_CODES:
+        active_codes = codes
+    else:
+        # Generate 3-5 random codes each time
+        num_codes = draw.randint(3, 5)
+        active_codes = generate_shift_codes(num_codes, seed)
+    
+    # Generate 1-2 expired codes
+    expired_codes = generate_shift_codes(draw.randint(1, 2), None if seed is None else seed + 1)
+    return tuple(active_codes), tuple(expired_codes)
+
+def generate_test_html(active_codes=None, expired_codes=None, title=DEFAULT_TITLE,
+                       template=DEFAULT_TEMPLATE, updated=None, regen_interval=0):
+    """Generate HTML with SHiFT codes, picking random ones when none are given"""
+    if active_codes is None or expired_codes is None:
+        active_codes, expired_codes = pick_page_codes()
+    
+    current_time = (updated or datetime.now()).strftime("%Y-%m-%d %H:%M:%S")
+    if regen_interval > 0:
+        regen_note = f"codes regenerated every {regen_interval:g} seconds"
+    else:
+        regen_note = "codes regenerated on each request"
+    
+    active_codes_html = '\n    '.join([f'<div class="code new">{code}</div>' for code in active_codes])
+    expired_codes_html = '\n    '.join([f'<div class="code expired">{code}</div>' for code in expired_codes])
+    
+    return PAGE_TEMPLATES[template].format(
+        title=title,
+        active_codes_html=active_codes_html,
+        expired_codes_html=expired_codes_html,
+        current_time=current_time,
+        regen_note=regen_note,
+    )
+
+@dataclass
+class RenderedPage:
+    body: bytes
+    etag: str
+    last_modified: float
+    encoded: dict = field(default_factory=dict)  # compressed bodies by content coding
+
+class PageRenderCache:
+    """Pre-rendered page variants keyed on (active codes, expired codes, template).
+
+    A new set of codes is drawn at most once per ``interval`` seconds (0 draws on
+    every request, the original behaviour); in between, every poll gets the same
+    bytes and validators, so conditional GETs can be answered with a 304. With a
+    ``seed`` the codes of each interval are a function of the seed and the clock,
+    so separate processes serve the same page at the same time.
+    """
+
+    def __init__(self, interval=REGEN_INTERVAL, max_variants=64, seed=None):
+        self.interval = interval
+        self.max_variants = max_variants
+        self.seed = seed
+        self._variants = OrderedDict()
+        self._current = {}
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def get(self, title=DEFAULT_TITLE, template=DEFAULT_TEMPLATE):
+        now = time.time()
+        if self.seed is not None and self.interval > 0:
+            slot = int(now // self.interval)
+            rng = random.Random(f"{self.seed}:{title}:{template}:{slot}")
+            return self.render(*pick_page_codes(rng), title, template, slot * self.interval, self.interval)
+        with self._lock:
+            current = self._current.get((title, template))
+            if current is None or self.interval <= 0 or now - current[0] >= self.interval:
+                current = (now, pick_page_codes())
+                self._current[(title, template)] = current
+            generated_at, (active_codes, expired_codes) = current
+        return self.render(active_codes, expired_codes, title, template, generated_at, self.interval)
+
+    def render(self, active_codes, expired_codes, title, template, generated_at, regen_interval):
+        """Return the cached page for these codes, rendering it on first use"""
+        key = (active_codes, expired_codes, title, template)
+        with self._lock:
+            page = self._variants.get(key)
+            if page is not None:
+                self._variants.move_to_end(key)
+                self.stats['hits'] += 1
+                return page
+        html = generate_test_html(active_codes, expired_codes, title, template,
+                                  datetime.fromtimestamp(generated_at), regen_interval)
+        body = html.encode('utf-8')
+        page = RenderedPage(body, make_etag(body), int(generated_at))
+        with self._lock:
+            self.stats['renders'] += 1
+            self._variants[key] = page
+            while len(self._variants) > self.max_variants:
+                self._variants.popitem(last=False)
+        return page
+
+    def record(self, body, not_modified):
+        with self._lock:
+            if not_modified:
+                self.stats['not_modified'] += 1
+                self.stats['bytes_saved'] += len(body)
+            else:
+                self.stats['full_responses'] += 1
+                self.stats['bytes_sent'] += len(body)
+
+    def snapshot(self):
+        with self._lock:
+            return {'interval': self.interval, 'variants': len(self._variants), **self.stats}
+
+page_cache = PageRenderCache()
+mock_backend = MockShiftBackend()
+metrics = ServerMetrics()
+faults = FaultInjector()
+encoder = ContentEncoder()
+static_files = StaticFiles(Path(os.getcwd()), encoder=encoder)
+clock = VirtualClock()
+sources = SourceSimulator.from_shift_config(clock=clock.now, origin=clock.start)
+shared_stats = None  # set in prefork mode, where every worker process keeps its own counters
+client_cookies = False  # --client-cookies: hand out shift_client cookies on generated pages
+admin_journal = None  # set in prefork mode, where every worker process keeps its own clock, faults and mock
+ADMIN_PATHS = ('/clock', '/faults', '/mock/config', '/mock/codes', '/mock/reset')
+replay = None  # PageArchive served under /replay when --replay is given
+
+def page_response(request, page):
+    """Serve a rendered page, compressed if the client accepts it, or a bodiless 304 when it already has it"""
+    content_type = 'text/html; charset=utf-8'
+    encoding = encoder.negotiate(request, content_type, len(page.body))
+    etag = encoded_etag(page.etag, encoding)
+    validators = validator_headers(etag, page.last_modified)
+    validators += [('Cache-Control', 'no-cache'), ('Vary', 'Accept-Encoding')]
+    not_modified = is_not_modified(request, etag, page.last_modified)
+    if not_modified:
+        page_cache.record(page.encoded.get(encoding, page.body), True)
+        return Response(304, validators)
+    headers = [('Content-type', content_type), *validators]
+    body = page.body
+    if encoding:
+        body = encoder.encode_cached(page.encoded, page.body, encoding)
+        headers.append(('Content-Encoding', encoding))
+    page_cache.record(body, False)
+    return Response(200, headers, body)
+
+def source_response(request, source):
+    """Serve a simulated code source from shift-config.js as it looks right now"""
+    snapshot = sources.snapshot(source)
+    page = page_cache.render(snapshot.active, snapshot.expired, source.game_label, DEFAULT_TEMPLATE,
+                             snapshot.updated_at, source.settings.update_interval)
+    return page_response(request, page)
+
+def clock_response(request):
+    """Show the simulated clock, or with a POST of {"advance": "3d"} / {"speed": 3600} change it"""
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or b'{}')
+            if not isinstance(payload, dict) or not set(payload) <= {'advance', 'speed'}:
+                raise ValueError('Expected a JSON object with "advance" and/or "speed"')
+            if 'speed' in payload:
+                clock.set_speed(float(payload['speed']))
+            if 'advance' in payload:
+                clock.advance(parse_duration(payload['advance']))
+        except (ValueError, TypeError) as exc:
+            return text_response(400, f"{exc}\n")
+    return json_response(clock.snapshot())
+
+def stress_response(request):
+    """Serve a streamed stress page, or with /stress/codes the codes that page contains"""
+    try:
+        spec = StressPageSpec.from_query(request.query)
+    except ValueError as exc:
+        return text_response(400, f"{exc}\n")
+    if request.path == '/stress/codes':
+        return json_response({'spec': spec.as_dict(), 'codes': list(iter_page_codes(spec))})
+    headers = [
+        ('Content-type', 'text/html; charset=utf-8'),
+        ('X-Shift-Code-Count', str(spec.codes + spec.expired)),
+        ('Cache-Control', 'no-store'),
+        ('Vary', 'Accept-Encoding'),
+    ]
+    body = iter_stress_page(spec)
+    encoding = encoder.negotiate(request, 'text/html')
+    if encoding:
+        headers.append(('Content-Encoding', encoding))
+        body = encoder.encode_stream(body, encoding)
+    return Response(200, headers, body)
+
+def replay_response(request):
+    """Serve a recorded page as it was at ?at= (default: the simulated clock), its codes, or the archive's URLs"""
+    if replay is None:
+        return text_response(404, "No archive loaded; start the server with --replay ARCHIVE\n")
+    url = request.query_value('url')
+    if url is None:
+        return json_response({'records': len(replay), 'bytes': replay.size, 'urls': replay.describe()})
+    try:
+        at = parse_time(request.query_value('at')) if request.query_value('at') else clock.now()
+    except ValueError as exc:
+        return text_response(400, f"{exc}\n")
+    page = replay.find(url, at)
+    if page is None:
+        return text_response(404, f"{url} has no record at or before {datetime.fromtimestamp(at)}\n")
+    if request.path == '/replay/codes':
+        return json_response({**page.summary(), 'codes': page.codes()})
+    # Records never change once appended, so where one starts identifies its content.
+    etag = f'"{page.offset:x}-{int(page.fetched_at * 1000):x}"'
+    validators = validator_headers(etag, page.fetched_at) + [('Cache-Control', 'no-cache')]
+    if page.status == 200 and is_not_modified(request, etag, page.fetched_at):
+        return Response(304, validators)
+    return Response(page.status, [('Content-type', page.content_type), *validators], page.body)
+
+def cache_stats():
+    return {
+        **page_cache.snapshot(),
+        'static': static_files.snapshot(),
+        'compression': encoder.snapshot(),
+    }
+
+def worker_stats():
+    return {'metrics': metrics.state(), 'cache': cache_stats()}
+
+def apply_admin(path, payload):
+    """Apply an admin change another prefork worker made: the clock's new state, or the body POSTed to path"""
+    if path == '/clock':
+        clock.restore(payload)
+        return
+    request = Request('POST', path, Message(), ('', 0), payload.encode('latin-1'))
+    faults.handle(request) or route(request)
+
+def app(request: Request) -> Response:
+    if admin_journal is not None and request.method == 'POST' and request.path in ADMIN_PATHS:
+        with admin_journal.exclusive():
+            response = faults.handle(request) or route(request)
+            if response.status == 200:
+                admin_journal.record(request.path, clock.state() if request.path == '/clock'
+                                     else request.body.decode('latin-1'))
+    else:
+        if admin_journal is not None:
+            admin_journal.sync()
+        response = faults.handle(request) or route(request)
+    response = faults.apply(request, response)
+    if client_cookies:
+        tag_client(request, response)
+    return response
+
+def route(request: Request) -> Response:
+    """Route a request: the generated code page at the root, files from the serving directory otherwise."""
+    if request.path in ('/', '/index.html'):
+        return page_response(request, page_cache.get())
+    if request.path == '/cache-stats':
+        stats = cache_stats()
+        if shared_stats is not None:
+            stats['workers'] = {str(pid): worker['cache'] for pid, worker in shared_stats.gather().items()}
+        return json_response(stats)
+    if request.path == '/metrics':
+        current = metrics
+        if shared_stats is not None:
+            current = ServerMetrics.merged(worker['metrics'] for worker in shared_stats.gather().values())
+        if request.query_value('format') == 'json':
+            return json_response(current.snapshot())
+        return text_response(200, current.prometheus(), 'text/plain; version=0.0.4; charset=utf-8')
+    if request.path in ('/stress', '/stress/codes'):
+        return stress_response(request)
+    if request.path == '/sources':
+        return json_response({'clock': clock.snapshot(), 'sources': sources.describe()})
+    if request.path == '/clock':
+        return clock_response(request)
+    if request.path in ('/replay', '/replay/codes'):
+        return replay_response(request)
+    source = sources.get(request.path)
+    if source is not None:
+        return source_response(request, source)
+    mock_response = mock_backend.handle(request, time.time())
+    if mock_response is not None:
+        return mock_response
+    return static_files.response(request)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a test page with SHiFT codes.")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port to listen on (default {PORT})")
+    parser.add_argument("--bind", default="", help="Address to bind to (default: all interfaces)")
+    parser.add_argument(
+        "--mode",
+        choices=SERVER_MODES,
+        default="single",
+        help="single: one request at a time; threaded: a thread per connection; "
+        "asyncio: one event loop with keep-alive connections",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="threaded: cap concurrent connections to a pool of N threads; "
+        "asyncio: run request handling on a pool of N threads instead of the event loop",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        default=1,
+        help="Prefork N worker processes that share the port through SO_REUSEPORT, each running --mode "
+        "(default 1: no prefork). POSTs to /clock, /faults and /mock/* reach every worker, but each keeps "
+        "its own mock redemptions and rate limits",
+    )
+    parser.add_argument(
+        "--grace",
+        type=float,
+        default=GRACE_SECONDS,
+        help=f"Seconds prefork workers give requests in flight to finish on shutdown (default {GRACE_SECONDS:g})",
+    )
+    parser.add_argument(
+        "--regen-interval",
+        type=float,
+        default=REGEN_INTERVAL,
+        help=f"Seconds a generated page variant is reused before new codes are drawn "
+        f"(default {REGEN_INTERVAL:g}; 0 regenerates on every request)",
+    )
+    parser.add_argument(
+        "--mock-config",
+        type=Path,
+        default=None,
+        help="JSON file with latency, rate-limit, error and per-code settings for the mock SHiFT endpoints",
+    )
+    parser.add_argument(
+        "--sources-config",
+        type=Path,
+        default=None,
+        help="JSON file with the simulated sources' schedule (rotation, lifetime, update cadence, lag, coverage) "
+        "and an optional timeline of scripted codes",
+    )
+    parser.add_argument(
+        "--clock-speed",
+        type=float,
+        default=1.0,
+        help="Simulated seconds per real second for the sources (default 1; 3600 replays an hour per second)",
+    )
+    parser.add_argument(
+        "--clock-start",
+        default=None,
+        help="Simulated start time as a Unix timestamp or ISO 8601 date (default: now)",
+    )
+    parser.add_argument(
+        "--static-max-age",
+        type=int,
+        default=MAX_AGE,
+        help=f"Cache-Control max-age in seconds for static files (default {MAX_AGE}; 0 sends no-cache)",
+    )
+    parser.add_argument(
+        "--static-cache-mb",
+        type=float,
+        default=CACHE_BYTES / (1024 * 1024),
+        help=f"Memory for the LRU of small static files in MB (default {CACHE_BYTES // (1024 * 1024)})",
+    )
+    parser.add_argument(
+        "--gzip-level",
+        type=int,
+        choices=range(0, 10),
+        default=GZIP_LEVEL,
+        metavar="0-9",
+        help=f"gzip level for clients that accept it (default {GZIP_LEVEL}; 0 disables gzip)",
+    )
+    parser.add_argument(
+        "--brotli-quality",
+        type=int,
+        choices=range(-1, 12),
+        default=BROTLI_QUALITY,
+        metavar="-1-11",
+        help=f"Brotli quality when the brotli module is installed (default {BROTLI_QUALITY}; -1 disables brotli)",
+    )
+    parser.add_argument(
+        "--faults",
+        type=Path,
+        default=None,
+        help="JSON file with per-path latency, throttling, trickling, 429/503, reset and hang rules",
+    )
+    parser.add_argument(
+        "--replay",
+        type=Path,
+        default=None,
+        help="Page archive recorded with page_archive.py to serve under /replay?url=...&at=...",
+    )
+    parser.add_argument(
+        "--client-cookies",
+        action="store_true",
+        help="Set a shift_client cookie on generated pages for clients without one, so browser profiles behind "
+        "one address show up as separate clients in /metrics",
+    )
+    parser.add_argument(
+        "--access-log",
+        type=Path,
+        default=None,
+        help="Append one JSON line per request to this file instead of logging to stderr",
+    )
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    args = parse_args()
+    page_cache.interval = args.regen_interval
+    static_files.max_age = args.static_max_age
+    static_files.cache_bytes = int(args.static_cache_mb * 1024 * 1024)
+    encoder.gzip_level = args.gzip_level
+    encoder.brotli_quality = args.brotli_quality
+    client_cookies = args.client_cookies
+    if args.mock_config:
+        try:
+            mock_backend.configure(MockConfig.load(args.mock_config))
+        except (OSError, ValueError) as e:
+            print(f"❌ Invalid mock config: {e}")
+            sys.exit(1)
     try:
-        with socketserver.TCPServer(("", PORT), MyHTTPRequestHandler) as httpd:
-            print(f"🚀 Test server running at http://localhost:{PORT}")
+        clock = VirtualClock(parse_time(args.clock_start) if args.clock_start else None, args.clock_speed)
+        source_config = SourceConfig.load(args.sources_config) if args.sources_config else None
+        sources = SourceSimulator.from_shift_config(source_config, clock=clock.now, origin=clock.start)
+    except (OSError, ValueError, TypeError) as e:
+        print(f"❌ Invalid sources config: {e}")
+        sys.exit(1)
+    if args.faults:
+        try:
+            faults.configure(FaultConfig.load(args.faults))
+        except (OSError, ValueError, TypeError) as e:
+            print(f"❌ Invalid fault config: {e}")
+            sys.exit(1)
+    if args.replay:
+        try:
+            replay = PageArchive(args.replay)
+        except (OSError, ValueError) as e:
+            print(f"❌ Invalid replay archive: {e}")
+            sys.exit(1)
+    if args.access_log:
+        metrics = ServerMetrics(args.access_log)
+    options = {'observer': metrics.observe, 'log_requests': args.access_log is None}
+    try:
+        if args.processes > 1:
+            # Workers must agree on the generated page, so its codes follow a shared seed.
+            page_cache.seed = random.getrandbits(64)
+            shared_stats = SharedStats(worker_stats)
+            admin_journal = AdminJournal(apply_admin)
+            server = PreforkServer(args.processes, args.mode, (args.bind, args.port), app, args.workers,
+                                   grace=args.grace, stats=shared_stats, journal=admin_journal, **options)
+            running = f"{args.mode} mode, {args.processes} processes"
+        else:
+            server = make_server(args.mode, (args.bind, args.port), app, args.workers, **options)
+            running = f"{args.mode} mode"
+        with server as httpd:
+            print(f"🚀 Test server running at http://localhost:{args.port} ({running})")
             print("📋 Test codes are available at the root URL")
+            print(f"🌐 {len(sources.sources)} simulated sources from shift-config.js are listed at /sources")
+            if replay is not None:
+                print(f"📼 {len(replay)} recorded pages from {args.replay} are listed at /replay")
             print("🔔 Add this URL to your extension settings:")
-            print(f"   http://localhost:{PORT}")
+            print(f"   http://localhost:{args.port}")
             print("\n⚠️  Press Ctrl+C to stop the server")
             httpd.serve_forever()
     except KeyboardInterrupt:
         print("\n🛑 Server stopped")
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
     except OSError as e:
         if e.errno == 98:  # Address already in use
-            print(f"❌ Port {PORT} is already in use. Try a different port or stop the existing server.")
+            print(f"❌ Port {args.port} is already in use. Try a different port or stop the existing server.")
             sys.exit(1)
         else:
-            raise
\ No newline at end of file
+            raise
+    finally:
+        metrics.close()
@@ -0,0 +1,103 @@
+"""Round trips of code_store's compact form against dumps in the extension's current storage shape.
+
+Run with: python3 -m pytest test/test_code_store.py
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+from pathlib import Path
+
+import pytest
+
+from code_store import MAGIC, analyze, compact, decode, encode, load_dump, with_wrapper
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures" / "code_store"
+DUMPS = ("settings_export.json", "storage_dump.json", "irregular_dump.json")
+
+
+def round_trip(storage, wrapper=None):
+    return decode(encode(storage, wrapper))
+
+
+@pytest.mark.parametrize("name", DUMPS)
+def test_fixture_round_trips(name):
+    storage, wrapper = load_dump(FIXTURES / name)
+    assert round_trip(storage, wrapper) == (storage, wrapper)
+    assert compact(storage, wrapper) == encode(storage, wrapper)
+
+
+def test_settings_export_keeps_its_wrapper():
+    storage, wrapper = load_dump(FIXTURES / "settings_export.json")
+    assert wrapper == {
+        "exportDate": "2025-09-20T18:42:07.311Z",
+        "version": "2.1",
+        "extensionName": "Borderlands SHIFT Code Manager",
+    }
+    restored = with_wrapper(*round_trip(storage, wrapper))
+    assert restored == json.loads((FIXTURES / "settings_export.json").read_text(encoding="utf-8"))
+    # Key order of the export is kept too, so a restored file diffs cleanly against the original.
+    assert list(restored["settings"]) == list(storage)
+
+
+def test_raw_dump_has_no_wrapper():
+    storage, wrapper = load_dump(FIXTURES / "storage_dump.json")
+    assert wrapper is None
+    assert round_trip(storage) == (storage, None)
+
+
+def test_entries_are_rebuilt_in_the_extension_shape():
+    storage, wrapper = load_dump(FIXTURES / "settings_export.json")
+    restored, _ = round_trip(storage, wrapper)
+    for key, value in restored["codeStates"].items():
+        assert list(value) == ["state", "timestamp", "game", "platform", "retryCount"]
+        assert key == f"{value['platform']}:{value['game']}:{key.rsplit(':', 1)[1]}"
+
+
+def test_mixed_states_fit_in_cells():
+    storage, _ = load_dump(FIXTURES / "settings_export.json")
+    report = analyze(storage)
+    assert report["irregular_entries"] == 0
+    assert report["cells"] == 3
+    # The shared-value cell with exceptions on both sides is much smaller than its JSON.
+    assert len(encode(storage)) < len(json.dumps(storage)) / 3
+
+
+def test_irregular_entries_are_kept_verbatim():
+    storage, _ = load_dump(FIXTURES / "irregular_dump.json")
+    assert analyze(storage)["irregular_entries"] == 6
+    restored, _ = round_trip(storage)
+    codes = restored["codeStates"]
+    assert codes["steam:bl4:JZRTJ-SR9BB-W6T35-BJBTT-36FZR"]["note"] == "kept"
+    assert "retryCount" not in codes["xbox:bl4:JZRTJ-SR9BB-W6T35-BJBTT-36FZR"]
+    assert codes["epic:bl:goty:JZRTJ-SR9BB-W6T35-BJBTT-36FZR"]["game"] == "bl:goty"
+    assert codes["nintendo:bl4:JZRTJ-SR9BB-W6T35-BJBTT-36FZR"]["timestamp"] == 1758390000000.5
+    assert restored["ShiftCodes"] == storage["ShiftCodes"]
+
+
+@pytest.mark.parametrize(
+    "change",
+    [
+        lambda storage: storage.update(gameNewCodes={}, codeStates={}),
+        lambda storage: [storage.pop("gameNewCodes"), storage.pop("codeStates")],
+        lambda storage: storage.pop("ShiftCodes"),
+        lambda storage: storage.update(ShiftCodes=[]),
+        lambda storage: storage.clear(),
+    ],
+    ids=["empty", "missing", "no-shift-codes", "no-codes", "nothing"],
+)
+def test_empty_and_missing_keys(change):
+    storage, _ = load_dump(FIXTURES / "storage_dump.json")
+    storage = copy.deepcopy(storage)
+    change(storage)
+    assert round_trip(storage) == (storage, None)
+
+
+def test_damaged_stores_are_rejected():
+    storage, wrapper = load_dump(FIXTURES / "settings_export.json")
+    data = encode(storage, wrapper)
+    truncated = [data[:size] for size in range(len(data))]
+    for damaged in (*truncated, data + b"\x00", b"NOTASTORE" + data[len(MAGIC):]):
+        with pytest.raises(ValueError):
+            decode(damaged)
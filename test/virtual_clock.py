@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+A clock that can run faster than real time and be moved forward on demand.
+
+The test server reads simulated time from a :class:`VirtualClock` so weeks of
+code publications can be replayed in seconds: with ``speed=3600`` every real
+second is an hour, and :meth:`VirtualClock.advance` jumps ahead at once.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Optional, Union
+
+_DURATION = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*([smhdw]?)\s*$")
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 7 * 86400}
+
+
+def parse_duration(value: Union[str, float, int]) -> float:
+    """Seconds from a number or a string such as ``90``, ``15m``, ``12h``, ``3d`` or ``2w``."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = _DURATION.match(value)
+    if not match:
+        raise ValueError(f"Invalid duration '{value}' (expected seconds or a number with s/m/h/d/w)")
+    return float(match.group(1)) * _UNITS[match.group(2)]
+
+
+def parse_time(value: Union[str, float, int]) -> float:
+    """A Unix timestamp from a number or an ISO 8601 date/time (UTC unless it has an offset)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError as exc:
+        raise ValueError(f"Invalid time '{value}' (expected a Unix timestamp or ISO 8601)") from exc
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+class VirtualClock:
+    """Simulated time: ``start`` plus real time elapsed times ``speed``, plus any manual advances."""
+
+    def __init__(self, start: Optional[float] = None, speed: float = 1.0, real: Callable[[], float] = time.monotonic):
+        if speed < 0:
+            raise ValueError("Clock speed cannot be negative")
+        self._real = real
+        self._lock = threading.Lock()
+        self.start = time.time() if start is None else start
+        self.speed = speed
+        self._base = self.start
+        self._real_base = real()
+
+    def now(self) -> float:
+        with self._lock:
+            return self._base + (self._real() - self._real_base) * self.speed
+
+    def _rebase(self) -> None:
+        real = self._real()
+        self._base += (real - self._real_base) * self.speed
+        self._real_base = real
+
+    def advance(self, seconds: float) -> float:
+        if seconds < 0:
+            raise ValueError("The clock only moves forward")
+        with self._lock:
+            self._rebase()
+            self._base += seconds
+            return self._base
+
+    def set_speed(self, speed: float) -> None:
+        if speed < 0:
+            raise ValueError("Clock speed cannot be negative")
+        with self._lock:
+            self._rebase()
+            self.speed = speed
+
+    def state(self) -> dict:
+        """What :meth:`restore` needs to give another clock the same time and speed.
+
+        ``time.monotonic`` is the same for every process on a machine, so the
+        state can be handed to another process (a prefork worker, say).
+        """
+        with self._lock:
+            return {"base": self._base, "real_base": self._real_base, "speed": self.speed}
+
+    def restore(self, state: dict) -> None:
+        with self._lock:
+            self._base = state["base"]
+            self._real_base = state["real_base"]
+            self.speed = state["speed"]
+
+    def elapsed(self) -> float:
+        """Simulated seconds since ``start``."""
+        return self.now() - self.start
+
+    def snapshot(self) -> dict:
+        now = self.now()
+        return {
+            "now": now,
+            "iso": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            "start": self.start,
+            "elapsed": now - self.start,
+            "speed": self.speed,
+        }